@@ -3,30 +3,29 @@ api_call.py
 
 This file contains functions that handle the management of prompts for interacting with various APIs.
 """
-import os
-import streamlit as st
 from typing import List
-from openai import AzureOpenAI
 from pydantic import BaseModel, create_model
 
+from cache import response_cache
+from clients import (
+    get_client,
+    chat_limiter,
+    call_with_retry
+)
+from streaming import StreamConsumer
+from metrics import (
+    instrument,
+    set_stage,
+    add_to_span,
+    mark_first_token
+)
 from config import (
-    API_VERSION,
     MODEL,
     TEMPERATURE,
-    SEED
-)
-
-try:
-    OAI_API_KEY = st.secrets["OAI_API_KEY"]
-    OAI_API_ENDPOINT = st.secrets["OAI_API_ENDPOINT"]
-except (KeyError, FileNotFoundError):
-    OAI_API_KEY = os.getenv("OAI_API_KEY")
-    OAI_API_ENDPOINT = os.getenv("OAI_API_ENDPOINT")
-
-client = AzureOpenAI(
-    api_key=OAI_API_KEY,
-    api_version=API_VERSION,
-    azure_endpoint=OAI_API_ENDPOINT
+    SEED,
+    RESPONSE_CACHE_ENABLED,
+    STREAM_STRUCTURED_OUTPUT,
+    COMPLETION_TOKENS_ESTIMATE
 )
 
 class LectureNote(BaseModel):
@@ -65,85 +64,266 @@ def create_dynamic_lecture_note(headings: List[str]) -> BaseModel:
     LectureNoteExample = create_model('LectureNoteExample', **fields)
     return LectureNoteExample
 
-def get_response(SYSTEM_PROMPT, USER_MESSAGE, structured_output, box=None):
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens in a text.
+
+    English text averages about four characters per token, which is close enough for budgeting
+    without adding a tokenizer dependency.
+
+    Args:
+    - text (str): The text
+
+    Returns:
+    int: The estimated number of tokens
+    """
+    return len(text) // 4
+
+def _request_tokens(*contents):
+    """
+    Estimates the tokens a chat request counts against the tokens-per-minute quota: the prompt plus the expected completion.
+    """
+    return sum(estimate_tokens(content) for content in contents) + COMPLETION_TOKENS_ESTIMATE
+
+def _record_usage(usage, prompts, completion):
+    """
+    Adds the tokens of a response to the current metrics span, estimating them when the API does not report usage.
+    """
+    if usage is not None:
+        add_to_span(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+    else:
+        add_to_span(prompt_tokens=sum(estimate_tokens(prompt) for prompt in prompts), completion_tokens=estimate_tokens(completion))
+
+def build_messages(SYSTEM_PROMPT, USER_MESSAGE, context=None):
+    """
+    Lays out the chat messages with the unchanging parts first.
+
+    The provider caches prompts by prefix, so the system prompt and a large `context` message (e.g., the transcript)
+    come before the user's message, which changes between generations.
+
+    Args:
+    - SYSTEM_PROMPT (str): The system message providing context to the model
+    - USER_MESSAGE (str): The user's message to which the model will respond to
+    - context (str, optional): A large message that stays the same across requests
+
+    Returns:
+    List[dict]: The messages
+    """
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if context is not None:
+        messages.append({"role": "user", "content": context})
+    messages.append({"role": "user", "content": USER_MESSAGE})
+    return messages
+
+def iter_content(response):
+    """
+    Yields the text of each chunk in a streamed chat completion, skipping chunks without content.
+
+    Args:
+    - response: The streamed chat completion
+
+    Yields:
+    str: The next piece of the response text
+    """
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            mark_first_token()
+            yield chunk.choices[0].delta.content
+
+@instrument("get_response")
+def get_response(SYSTEM_PROMPT, USER_MESSAGE, structured_output, box=None, use_cache=None, on_fields=None, context=None):
     """
     Function to get a response from the chat model and stream the result.
 
     Args:
     - SYSTEM_PROMPT (str): The system message providing context to the model
     - USER_MESSAGE (str): The user's message to which the model will respond to
+    - structured_output (BaseModel or None): The pydantic model to parse the response into, or None to stream plain text
     - box: A UI element to display streaming results
+    - use_cache (bool, optional): Reuse the response to an identical earlier request. Defaults to RESPONSE_CACHE_ENABLED
+    - on_fields (callable, optional): For structured output, called with a dict of the fields completed so far
+      each time another field closes. The structured response is streamed when this is given and STREAM_STRUCTURED_OUTPUT is set
+    - context (str, optional): A large message that stays the same across requests, such as the transcript.
+      It is sent before USER_MESSAGE so repeated requests share a cacheable prefix
 
     Returns:
     str: The full respond accumulated from the streaming content
     """
+    messages = build_messages(SYSTEM_PROMPT, USER_MESSAGE, context)
+    prompts = [message["content"] for message in messages]
+
+    # Identical prompts, schema and generation parameters give the same request, so its response can be reused
+    cache_key = None
+    if RESPONSE_CACHE_ENABLED if use_cache is None else use_cache:
+        cache_key = response_cache.make_key(
+            system=SYSTEM_PROMPT,
+            user=USER_MESSAGE,
+            context=context,
+            schema=structured_output.model_json_schema() if structured_output is not None else None,
+            model=MODEL,
+            temperature=TEMPERATURE,
+            seed=SEED
+        )
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            add_to_span(cache_hits=1)
+            if structured_output is None:
+                if box is not None:
+                    box.info(cached)  # Replay the cached response into the UI
+                return cached
+            parsed = structured_output.model_validate_json(cached)
+            if on_fields is not None:
+                on_fields(parsed.model_dump())
+            return parsed
+
     # Response for clean transcription
     if structured_output == None:
-        response = client.chat.completions.create(
+        set_stage("get_response.text")
+        response = call_with_retry(
+        get_client().chat.completions.create,
+        limiter=chat_limiter,
+        tokens=_request_tokens(*prompts),
         model=MODEL,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": USER_MESSAGE}
-        ],
+        messages=messages,
         temperature=TEMPERATURE,
         seed=SEED,
         stream=True
         )
-        results = ""
-        for chunk in response:
-            if chunk.choices[0].delta.content != "":
-                try:
-                    results += chunk.choices[0].delta.content
-                    box.info(results)
-                except TypeError:
-                    pass
+        results = StreamConsumer(box).consume(iter_content(response))
+        _record_usage(None, prompts, results)
+
+        if cache_key is not None:
+            response_cache.set(cache_key, results)
         return results
 
+    # Streamed response for lecture note generation, showing each field as soon as it is complete
+    elif on_fields is not None and STREAM_STRUCTURED_OUTPUT:
+        set_stage("get_response.structured_stream")
+        # A failed stream is retried from the start, and the fields are shown again as they arrive
+        parsed = call_with_retry(
+            _stream_structured_response,
+            messages, structured_output, on_fields,
+            limiter=chat_limiter,
+            tokens=_request_tokens(*prompts)
+        )
+        if cache_key is not None:
+            response_cache.set(cache_key, parsed.model_dump_json())
+        return parsed
+
     # Response for lecture note generation
     else:
-        response = client.beta.chat.completions.parse(
+        set_stage("get_response.parse")
+        response = call_with_retry(
+            get_client().beta.chat.completions.parse,
+            limiter=chat_limiter,
+            tokens=_request_tokens(*prompts),
             model=MODEL,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": USER_MESSAGE}
-            ],
+            messages=messages,
             temperature=TEMPERATURE,
             seed=SEED,
             response_format=structured_output
         )
 
-        return response.choices[0].message.parsed
+        parsed = response.choices[0].message.parsed
+        _record_usage(response.usage, prompts, response.choices[0].message.content or "")
+        if cache_key is not None:
+            response_cache.set(cache_key, parsed.model_dump_json())
+        return parsed
+
+def _may_grow(value):
+    """
+    Tells whether a value read from partial JSON may still change as more tokens arrive.
+    """
+    return isinstance(value, (list, dict, int, float)) and not isinstance(value, bool)
+
+def _stream_structured_response(messages, structured_output, on_fields):
+    """
+    Streams a structured response, parsing the partial JSON as tokens arrive.
+
+    Fields are generated in schema order, so every field before the last one in the partial JSON is complete. The partial
+    parser leaves out a string until its closing quote, so the last field is complete too unless it is a list, an object
+    or a number, which may still grow. `on_fields` is called whenever another field completes, and once more with every
+    field at the end.
+
+    Args:
+    - messages (List[dict]): The chat messages, from `build_messages`
+    - structured_output (BaseModel): The pydantic model to parse the response into
+    - on_fields (callable): Called with a dict of the fields completed so far
+
+    Returns:
+    BaseModel: The fully validated response
+    """
+    completed_count = 0
+    with get_client().beta.chat.completions.stream(
+        model=MODEL,
+        messages=messages,
+        temperature=TEMPERATURE,
+        seed=SEED,
+        response_format=structured_output
+    ) as stream:
+        for event in stream:
+            if event.type != "content.delta" or not isinstance(event.parsed, dict):
+                continue
+            mark_first_token()
+
+            # An unfinished string is left out of `event.parsed`, so only a last list, object or number may still be growing
+            field_names = list(event.parsed)
+            if field_names and _may_grow(event.parsed[field_names[-1]]):
+                field_names.pop()
+            if len(field_names) > completed_count:
+                completed_count = len(field_names)
+                on_fields({name: event.parsed[name] for name in field_names})
+
+        completion = stream.get_final_completion()
+        parsed = completion.choices[0].message.parsed
+
+    _record_usage(completion.usage, [message["content"] for message in messages], completion.choices[0].message.content or "")
+    on_fields(parsed.model_dump())
+    return parsed
 
-def get_lecture_note_md(lecture_note, box):
+@instrument("get_lecture_note_md")
+def get_lecture_note_md(lecture_note, box, use_cache=None):
     """
     Converts the string into markdown format
 
     Args:
     - lecture_note (str): The string to be converted to markdown format
     - box: A UI element to display streaming results
+    - use_cache (bool, optional): Reuse the response to an identical earlier request. Defaults to RESPONSE_CACHE_ENABLED
 
     Returns:
     str: The full respond accumulated from the streaming content
     """
-    response = client.chat.completions.create(
+    messages = [
+        {"role": "system",
+         "content": "You are a markdown formatter. Please take the provided string and format it into markdown. "
+        "Each attribute should be treated as a heading, and the corresponding text should follow as a paragraph. "
+        "Use appropriate markdown syntax for headings (e.g., `#` for H1, `##` for H2, etc.). "
+        "Ensure the final output is well-structured and easy to read."},
+        {"role": "user",
+         "content": lecture_note}
+    ]
+
+    cache_key = None
+    if RESPONSE_CACHE_ENABLED if use_cache is None else use_cache:
+        cache_key = response_cache.make_key(messages=messages, model="gpt-4o-2024-08-06")
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            add_to_span(cache_hits=1)
+            box.info(cached)  # Replay the cached response into the UI
+            return cached
+
+    response = call_with_retry(
+        get_client().chat.completions.create,
+        limiter=chat_limiter,
+        tokens=_request_tokens(lecture_note) * 2,  # The formatted note is about as long as the input
         model="gpt-4o-2024-08-06",
-        messages=[
-            {"role": "system",
-             "content": "You are a markdown formatter. Please take the provided string and format it into markdown. "
-            "Each attribute should be treated as a heading, and the corresponding text should follow as a paragraph. "
-            "Use appropriate markdown syntax for headings (e.g., `#` for H1, `##` for H2, etc.). "
-            "Ensure the final output is well-structured and easy to read."},
-            {"role": "user",
-             "content": lecture_note}
-        ],
+        messages=messages,
         stream=True
     )
-    results = ""
-    for chunk in response:
-        if chunk.choices[0].delta.content != "":
-            try:
-                results += chunk.choices[0].delta.content
-                box.info(results)
-            except TypeError:
-                pass
+    results = StreamConsumer(box).consume(iter_content(response))
+    _record_usage(None, [message["content"] for message in messages], results)
+
+    if cache_key is not None:
+        response_cache.set(cache_key, results)
     return results
@@ -3,35 +3,242 @@ app.py
 
 This file serves as the main entry point for the application.
 """
+import io
+import uuid
+
 import streamlit as st
 
-from api_call import (
-    LectureNote,
-    get_response,
-    create_dynamic_lecture_note,
-    get_lecture_note_md
+from jobs import (
+    get_job_runner,
+    transcription_job,
+    live_transcription_job,
+    lecture_note_job
 )
-from utils import (
-    speech_to_text,
-    split_audio,
-    get_headings
+from cache import hash_audio
+from library import get_library
+from prompts import format_raw_notes
+from metrics import (
+    registry,
+    start_metrics_server
 )
-from prompts import (
-    user_message_lecture_note_fn,
-    user_message_clean_fn,
-    SYSTEM_PROMPT_get_lecture_note,
-    SYSTEM_PROMPT_get_clean
+from config import (
+    JOB_POLL_INTERVAL,
+    METRICS_PORT,
+    SHOW_TIMING_PANEL
 )
 
+# Stored as the transcription's source when the transcription comes from a live session or the lecture library
+LIVE_TRANSCRIPTION = "live"
+LIBRARY_TRANSCRIPTION = "library"
+
+# Session state keys of the widgets holding each lecture detail, filled in when a lecture is opened from the library
+DETAIL_WIDGET_KEYS = {
+    "title": "lecture_title",
+    "date": "date_of_lecture",
+    "lecturer": "lecturer_name",
+    "course": "course_name",
+    "outline": "lecture_outline",
+    "takeaways": "key_takeaways",
+    "additional_notes": "additional_notes",
+    "headings": "headings_string",
+}
+
 st.set_page_config(layout="wide")
 st.title("Lecture Note Generation")
 
 if "transcription" not in st.session_state:
     st.session_state.transcription = None
 
+# The recording the transcription belongs to (see `get_upload_key`), so it is kept across generations but not used for
+# another file. Kept in the URL with the transcription job, so the result is matched to the file uploaded again after a reload
+if "transcription_source" not in st.session_state:
+    st.session_state.transcription_source = st.query_params.get("transcription_source")
+
+# Who this session's lectures are saved for, so transcribing the same recording again updates this session's lecture only
+if "library_owner" not in st.session_state:
+    st.session_state.library_owner = uuid.uuid4().hex
+
+# Upload keys already computed, by the file ID of the upload
+if "upload_keys" not in st.session_state:
+    st.session_state.upload_keys = {}
+
+if "clean_transcription" not in st.session_state:
+    st.session_state.clean_transcription = None
+
 if "lecture_note" not in st.session_state:
     st.session_state.lecture_note = None
 
+if "preprocess_stats" not in st.session_state:
+    st.session_state.preprocess_stats = None
+
+if "auto_generate" not in st.session_state:
+    st.session_state.auto_generate = False
+
+# IDs of the background jobs this session is waiting on, also kept in the URL so a reconnecting browser picks them up again
+if "transcription_job" not in st.session_state:
+    st.session_state.transcription_job = st.query_params.get("transcription_job")
+
+if "lecture_note_job" not in st.session_state:
+    st.session_state.lecture_note_job = st.query_params.get("lecture_note_job")
+
+# The live session being recorded, its job, the chunks already added to it and the partial notes it made
+if "live_session" not in st.session_state:
+    st.session_state.live_session = None
+
+if "live_job" not in st.session_state:
+    st.session_state.live_job = None
+
+if "live_chunk_ids" not in st.session_state:
+    st.session_state.live_chunk_ids = []
+
+if "live_partial_notes" not in st.session_state:
+    st.session_state.live_partial_notes = None
+
+if "job_error" not in st.session_state:
+    st.session_state.job_error = None
+
+# The lecture library entry of the current lecture, which generated notes are saved to
+if "lecture_id" not in st.session_state:
+    st.session_state.lecture_id = None
+
+job_runner = get_job_runner()
+
+@st.cache_resource
+def get_metrics_server():
+    """
+    Starts the /metrics endpoint once per server process, not per session.
+    """
+    return start_metrics_server(METRICS_PORT)
+
+get_metrics_server()
+
+# Every job this session has started, for the timing panel
+if "job_ids" not in st.session_state:
+    st.session_state.job_ids = []
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_transcription_job():
+    """
+    Shows the progress of the transcription job, and stores its results once it is done.
+    """
+    job = job_runner.get(st.session_state.transcription_job)
+    if job is not None and not job.finished:
+        with st.spinner("Transcribing audio - this takes about 5 to 10 minutes..."):
+            st.progress(job.progress, text=job.message or "Transcribing segments...")
+            if job.preview:
+                st.info(job.preview)
+        return
+
+    st.session_state.transcription_job = None
+    st.query_params.pop("transcription_job", None)
+    st.query_params.pop("transcription_source", None)
+    if job is None or job.status == "failed":
+        st.session_state.job_error = "Unexpected error occurred. Please try again in ~ 1 minute."
+    else:
+        st.session_state.transcription = job.result["transcription"]  # Use raw transcript to generate lecture note
+        st.session_state.clean_transcription = job.result["clean_transcription"]
+        st.session_state.preprocess_stats = job.result["preprocess_stats"]
+        st.session_state.lecture_id = job.result["lecture_id"]
+
+        # Generate the lecture note in the next run, with whatever headings and notes are filled in below
+        st.session_state.auto_generate = st.session_state.get("auto_generate_after_transcription", False)
+    st.rerun()
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_live_job():
+    """
+    Shows the transcript and partial notes of the live session so far, and stores its results once the lecture has ended.
+    """
+    job = job_runner.get(st.session_state.live_job)
+    if job is not None and not job.finished:
+        st.progress(job.progress, text=job.message or "Waiting for the first minute of audio...")
+        if job.preview:
+            st.info(job.preview)
+        if st.session_state.live_session.partial_notes:
+            st.caption("Notes so far")
+            st.markdown(st.session_state.live_session.rolling_note_md)
+        return
+
+    st.session_state.live_job = None
+    st.session_state.live_session = None
+    if job is None or job.status == "failed":
+        st.session_state.job_error = "Unexpected error occurred. Please try again in ~ 1 minute."
+    elif not job.result["transcription"]:
+        st.session_state.job_error = "No speech was transcribed during the live session."
+    else:
+        st.session_state.transcription = job.result["transcription"]
+        st.session_state.clean_transcription = job.result["clean_transcription"]
+        st.session_state.live_partial_notes = job.result["partial_notes"]
+        st.session_state.lecture_id = job.result["lecture_id"]
+        st.session_state.transcription_source = LIVE_TRANSCRIPTION
+        st.session_state.preprocess_stats = None
+        st.session_state.auto_generate = st.session_state.get("auto_generate_after_live", False)
+    st.rerun()
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_lecture_note_job():
+    """
+    Shows the lecture note as it is generated, and stores it once the job is done.
+    """
+    job = job_runner.get(st.session_state.lecture_note_job)
+    if job is not None and not job.finished:
+        st.info(job.preview or "Generating lecture note...")
+        return
+
+    st.session_state.lecture_note_job = None
+    st.query_params.pop("lecture_note_job", None)
+    if job is None or job.status == "failed":
+        st.session_state.job_error = "Unexpected error occurred. Please try again in ~ 1 minute."
+    else:
+        # The transcription is kept, so changing the headings or notes and generating again reuses it
+        st.session_state.lecture_note = job.result["lecture_note"]
+        # A note generated without a transcript is saved as a lecture too, which generating again updates
+        st.session_state.lecture_id = job.result["lecture_id"]
+    st.rerun()
+
+def get_upload_key(audio_file):
+    """
+    Returns the hash of an uploaded recording. Unlike its file ID, it stays the same when the file is uploaded again.
+    """
+    upload_keys = st.session_state.upload_keys
+    if audio_file.file_id not in upload_keys:
+        upload_keys.clear()  # Only the current upload is needed
+        upload_keys[audio_file.file_id] = hash_audio(audio_file)
+    return upload_keys[audio_file.file_id]
+
+def open_lecture(lecture_id):
+    """
+    Reopens a lecture from the library: its transcript, note and details, without any API calls.
+    """
+    lecture = get_library().get(lecture_id)
+    if lecture is None:
+        st.session_state.job_error = "This lecture is no longer in the library."
+        return
+
+    st.session_state.transcription = lecture["transcription"]
+    st.session_state.clean_transcription = lecture["clean_transcription"]
+    st.session_state.transcription_source = LIBRARY_TRANSCRIPTION if lecture["transcription"] else None
+    # Notes generated again replace the lecture's note
+    st.session_state.lecture_id = lecture_id
+    st.session_state.lecture_note = lecture["lecture_note_md"]
+    st.session_state.live_partial_notes = None
+    st.session_state.preprocess_stats = None
+    for detail, key in DETAIL_WIDGET_KEYS.items():
+        st.session_state[key] = lecture[detail]
+
+with st.sidebar:
+    st.header("Lecture Library :books:")
+    query = st.text_input("Search past lectures", placeholder="Title, course, lecturer or anything said in the lecture")
+    for lecture in get_library().search(query):
+        label = " · ".join(part for part in (lecture["title"] or "Untitled lecture", lecture["course"], lecture["date"]) if part)
+        st.button(label, key=f"open_lecture_{lecture['id']}", on_click=open_lecture, args=(lecture["id"],), use_container_width=True)
+        if lecture["snippet"]:
+            st.caption(lecture["snippet"])
+
+if st.session_state.job_error is not None:
+    st.warning(st.session_state.job_error, icon="⚠️")
+    st.session_state.job_error = None
+
 col1, col2 = st.columns(2)
 
 with col1:
@@ -40,166 +247,184 @@ with col1:
 
     # Transcribe audio if an audio file is uplaoded
     if audio_file is not None:
-        audio_file_size_mb = audio_file.size / (1024 * 1024)
-
-        if st.button("Transcribe"):
-            box = st.empty()
-
-            try:
-                with st.spinner("Transcribing audio - this takes about 5 to 10 minutes..."):
-
-                    # Split the audio into smaller segments
-                    # If audio file size is more than 20MB, recursively split the audio into 20MB each before transcribing
-                    segments = None
-                    if audio_file_size_mb > 20:
-                        segments = split_audio(audio_file)
+        trim_silence = st.checkbox("Trim long silences before transcribing")
+        auto_generate = st.checkbox("Generate the lecture note as soon as transcription finishes")
+
+        transcribing = st.session_state.transcription_job is not None
+        if st.button("Transcribe", disabled=transcribing):
+            # The upload belongs to this session, so the job gets its own copy
+            audio_copy = io.BytesIO(audio_file.getvalue())
+            audio_copy.name = audio_file.name
+
+            # Runs in the background, so reruns from other widgets do not interrupt it
+            st.session_state.transcription_job = job_runner.submit(
+                "transcription", transcription_job, audio_copy, trim_silence=trim_silence, owner=st.session_state.library_owner
+            )
+            st.query_params["transcription_job"] = st.session_state.transcription_job
+            st.session_state.job_ids.append(st.session_state.transcription_job)
+            st.session_state.auto_generate_after_transcription = auto_generate
+            st.session_state.preprocess_stats = None
+            st.session_state.transcription = None
+            st.session_state.transcription_source = get_upload_key(audio_file)
+            st.query_params["transcription_source"] = st.session_state.transcription_source
+            st.session_state.lecture_id = None
 
-                    # Iterate through segments to get the transcription if segments exist
-                    if segments is not None:
-                        raw_transcription = ""
-                        for segment in segments:
+        if st.session_state.transcription_job is None and st.session_state.transcription is not None \
+                and st.session_state.transcription_source == get_upload_key(audio_file):
+            st.success(":white_check_mark: Successfully transcripted and cleaned!")
+            st.info(st.session_state.clean_transcription)
 
-                            # Pass the segment to the speech-to-text function
-                            segment_transcription = speech_to_text(segment)
-                            raw_transcription += segment_transcription  # Concatenate all the segment transcriptions
+        if st.session_state.preprocess_stats is not None:
+            stats = st.session_state.preprocess_stats
+            st.caption(
+                f"Uploaded {stats.processed_bytes / (1024 * 1024):.1f} MB instead of {stats.original_bytes / (1024 * 1024):.1f} MB "
+                f"and {stats.processed_duration / 60:.1f} instead of {stats.original_duration / 60:.1f} minutes of audio."
+            )
 
-                    else:
-                        # If do not need to slice audio, just transcibe per normal
-                        raw_transcription = speech_to_text(audio_file)
+    # Polled even without an upload, as the uploader is empty when the page is reloaded during the job
+    if st.session_state.transcription_job is not None:
+        show_transcription_job()
+
+    # Without a finished recording, the lecture can be transcribed while it is still being recorded
+    live_mode = audio_file is None and st.toggle("The lecture is still being recorded (live transcription)")
+    if live_mode:
+        live_session = st.session_state.live_session
+
+        if live_session is None:
+            follow_path = st.text_input("Path of a recording being written on this machine (leave empty to upload it in parts)")
+            auto_generate_after_live = st.checkbox("Generate the lecture note as soon as the lecture ends")
+
+            if st.button("Start live transcription"):
+                from live import LiveTranscriber  # Imported on first use, so the app renders without the audio and API stack
+
+                live_session = LiveTranscriber(path=follow_path.strip() or None)
+                st.session_state.live_session = live_session
+                st.session_state.live_chunk_ids = []
+                # Runs on a thread of its own for the whole lecture, so the other sessions' jobs are not kept waiting
+                st.session_state.live_job = job_runner.submit_dedicated("live_transcription", live_transcription_job, live_session)
+                st.session_state.job_ids.append(st.session_state.live_job)
+                st.session_state.auto_generate_after_live = auto_generate_after_live
+                st.session_state.transcription = None
+                st.session_state.lecture_id = None
+
+        if live_session is not None:
+            if not live_session.follows_file:
+                chunks = st.file_uploader(
+                    "Upload the next parts of the recording as they are ready",
+                    type=["mp3", "m4a", "mpeg"],
+                    accept_multiple_files=True,
+                    key=f"live_chunks_{st.session_state.live_job}"  # A new session starts with an empty list
+                )
+                for chunk in chunks or []:
+                    if chunk.file_id not in st.session_state.live_chunk_ids and not live_session.ended:
+                        live_session.add_chunk(io.BytesIO(chunk.getvalue()))
+                        st.session_state.live_chunk_ids.append(chunk.file_id)
 
-                    USER_MESSAGE_get_clean = user_message_clean_fn(raw_transcription)
-                    clean_transcription = get_response(SYSTEM_PROMPT_get_clean, USER_MESSAGE_get_clean, structured_output=None, box=box)  # will print response
-                    st.session_state.transcription = raw_transcription  # Use raw transcript to generate lecture note
+            if st.button("The lecture has ended", disabled=live_session.ended):
+                live_session.end()
 
-            except:
-                st.warning("Unexpected error occurred. Please try again in ~ 1 minute.", icon="⚠️")
-                st.stop()
+        if st.session_state.live_job is not None:
+            show_live_job()
 
+        elif st.session_state.transcription is not None and st.session_state.transcription_source == LIVE_TRANSCRIPTION:
             st.success(":white_check_mark: Successfully transcripted and cleaned!")
+            st.info(st.session_state.clean_transcription)
+
+    if audio_file is None and not live_mode and st.session_state.transcription_source == LIBRARY_TRANSCRIPTION:
+        st.success(":books: Using the transcript of the lecture opened from the library")
+        st.info(st.session_state.clean_transcription)
 
     # Upload an example of a lecture note to feed to system
     st.header("Lecture Note Headings")
-    headings_string = st.text_area("Write the headings (comma-separated) you'd like to include in your lecture note (e.g., heading 1, heading 2,...) **(optional)**", height=100)
+    headings_string = st.text_area("Write the headings (comma-separated) you'd like to include in your lecture note (e.g., heading 1, heading 2,...) **(optional)**", height=100, key="headings_string")
 
     st.header("Additional Details")
     with st.container(border=True):
         st.subheader("Raw Notes")
-        lecture_title = st.text_input("Lecture Title **(required)**")
-        date_of_lecture = st.text_input("Date of Lecture (DD/MM/YYYY)")
-        lecturer_name = st.text_input("Name of Lecturer")
-        course_name = st.text_input("Course Name")
-        lecture_outline = st.text_area("Lecture Outline")
-        key_takeaways = st.text_area("Key Takeaways and Important Points Discussed")
+        lecture_title = st.text_input("Lecture Title **(required)**", key="lecture_title")
+        date_of_lecture = st.text_input("Date of Lecture (DD/MM/YYYY)", key="date_of_lecture")
+        lecturer_name = st.text_input("Name of Lecturer", key="lecturer_name")
+        course_name = st.text_input("Course Name", key="course_name")
+        lecture_outline = st.text_area("Lecture Outline", key="lecture_outline")
+        key_takeaways = st.text_area("Key Takeaways and Important Points Discussed", key="key_takeaways")
 
         st.subheader("Additional Notes")
-        additional_notes = st.text_area("Any supplementary information or details mentioned during the lecture")
+        additional_notes = st.text_area("Any supplementary information or details mentioned during the lecture", key="additional_notes")
 
-    raw_notes = f"""
-        Lecture Title: {lecture_title},
-        Date of Lecture: {date_of_lecture},
-        Lecturer Name: {lecturer_name},
-        Course Name: {course_name},
-        Lecture Outline: {lecture_outline},
-        Key Takeaways: {key_takeaways}
-        """
+    raw_notes = format_raw_notes(
+        title=lecture_title,
+        date=date_of_lecture,
+        lecturer=lecturer_name,
+        course=course_name,
+        outline=lecture_outline,
+        takeaways=key_takeaways
+    )
 
     # if `get_lecture_note` button is clicked, run the user_message_fn
-    get_lecture_note = st.button("Generate lecture note")
+    get_lecture_note = st.button("Generate lecture note", disabled=st.session_state.lecture_note_job is not None)
 
 with col2:
     st.header("Generated Lecture Note :page_facing_up:")
 
-    if get_lecture_note:
-
-        box = st.empty()
-
-        # If Audio file is uploaded
-        if audio_file is not None:
-
-            # Check if transcription is made if an audio file has been uploaded
-            if st.session_state.transcription is not None:
-
-                USER_MESSAGE_get_lecture_note = user_message_lecture_note_fn(
-                    transcript=st.session_state.transcription,
-                    raw_notes=raw_notes,
-                    additional_notes=additional_notes
-                )
+    # Generate when the button is clicked, or straight after transcription if that was asked for
+    auto_generate_now, st.session_state.auto_generate = st.session_state.auto_generate, False
+    if get_lecture_note or auto_generate_now:
 
-                # An example was given, need to use a different system prompt
-                if headings_string != "":
-                    # If there is a desired sample to follow
-                    headings_list = get_headings(headings_string)
-                    # Pass the headings as attributes into the class
-                    LectureNoteExample = create_dynamic_lecture_note(headings_list)
-
-                    # Getting the structure of the lecture note (if headings present) Use lecture note example in system prompt
-                    lecture_note = get_response(
-                        SYSTEM_PROMPT=SYSTEM_PROMPT_get_lecture_note,
-                        USER_MESSAGE=USER_MESSAGE_get_lecture_note,
-                        structured_output=LectureNoteExample
-                    )
-                    lecture_note_string = str(lecture_note)
-                    lecture_note_md = get_lecture_note_md(lecture_note_string, box)
-
-                # No example was given
-                else:
-                    lecture_note = get_response(
-                        SYSTEM_PROMPT=SYSTEM_PROMPT_get_lecture_note,  # Use standard example in system prompt
-                        USER_MESSAGE=USER_MESSAGE_get_lecture_note,
-                        structured_output=LectureNote
-                    )
-                    lecture_note_string = str(lecture_note)
-                    lecture_note_md = get_lecture_note_md(lecture_note_string, box)
-
-                st.session_state.lecture_note = lecture_note_md
-
-                # Clear st.session_state.transcription
-                st.session_state.transcription = None
+        # Check if transcription is made if an audio file has been uploaded
+        if audio_file is not None and (st.session_state.transcription is None
+                                       or st.session_state.transcription_source != get_upload_key(audio_file)):
+            st.warning("⚠️ Please transcribe the audio audio file before generating the lecture note.")
 
-            else: # Transcription is not done yet
-                st.warning("⚠️ Please transcribe the audio audio file before generating the lecture note.")
+        elif live_mode and st.session_state.live_job is not None:
+            st.warning("⚠️ Please end the live transcription before generating the lecture note.")
 
-        # If no audio file is being uploaded: transcription=None
         else:
-            USER_MESSAGE_get_lecture_note = user_message_lecture_note_fn(
-                transcript=None,
+            # If no audio file is being uploaded: transcription=None
+            live_transcript = live_mode and st.session_state.transcription_source == LIVE_TRANSCRIPTION
+            library_transcript = (audio_file is None and not live_mode
+                                  and st.session_state.transcription_source == LIBRARY_TRANSCRIPTION)
+            transcript = (st.session_state.transcription
+                          if audio_file is not None or live_transcript or library_transcript else None)
+
+            # Long transcripts are summarised in parts and merged, shorter ones in a single call
+            st.session_state.lecture_note_job = job_runner.submit(
+                "lecture_note",
+                lecture_note_job,
+                transcript=transcript,
                 raw_notes=raw_notes,
-                additional_notes=additional_notes
+                additional_notes=additional_notes,
+                headings_string=headings_string,
+                # A long live lecture was summarised in parts while it was recorded, so only the merge is left
+                partial_notes=st.session_state.live_partial_notes if live_transcript else None,
+                # Saved with the lecture being worked on, or as a new lecture if there is none yet
+                lecture_id=st.session_state.lecture_id,
+                details={
+                    "title": lecture_title,
+                    "date": date_of_lecture,
+                    "lecturer": lecturer_name,
+                    "course": course_name,
+                    "outline": lecture_outline,
+                    "takeaways": key_takeaways,
+                    "additional_notes": additional_notes,
+                }
             )
+            st.query_params["lecture_note_job"] = st.session_state.lecture_note_job
+            st.session_state.job_ids.append(st.session_state.lecture_note_job)
 
-            # An example was given, need to use a different system prompt
-            if headings_string != "":
-                # If there is a desired sample to follow
-                headings_list = get_headings(headings_string)
-                # Pass the headings as attributes into the class
-                LectureNoteExample = create_dynamic_lecture_note(headings_list)
-
-                lecture_note = get_response(
-                    SYSTEM_PROMPT=SYSTEM_PROMPT_get_lecture_note,
-                    USER_MESSAGE=USER_MESSAGE_get_lecture_note,
-                    structured_output=LectureNoteExample
-                )
-                lecture_note_string = str(lecture_note)
-                lecture_note_md = get_lecture_note_md(lecture_note_string, box)
-
-            # No example was given
-            else:
-                lecture_note = get_response(
-                    SYSTEM_PROMPT=SYSTEM_PROMPT_get_lecture_note,  # Use standard example in system prompt
-                    USER_MESSAGE=USER_MESSAGE_get_lecture_note,
-                    structured_output=LectureNote
-                )
-                lecture_note_string = str(lecture_note)
-                lecture_note_md = get_lecture_note_md(lecture_note_string, box)
-
-            st.session_state.lecture_note = lecture_note_md
-
-            # Clear st.session_state.transcription
-            st.session_state.transcription = None
+    if st.session_state.lecture_note_job is not None:
+        show_lecture_note_job()
 
-    if st.session_state.lecture_note and st.download_button(
-        "Download lecture note",
-        data=st.session_state.lecture_note,
-        file_name="lecture_note.txt"
-    ):
+    if st.session_state.lecture_note:
         st.markdown(st.session_state.lecture_note)
+        st.download_button(
+            "Download lecture note",
+            data=st.session_state.lecture_note,
+            file_name="lecture_note.txt"
+        )
+
+if SHOW_TIMING_PANEL and st.session_state.job_ids:
+    with st.expander("Timings"):
+        for job_id in reversed(st.session_state.job_ids):
+            job = job_runner.get(job_id)
+            st.caption(f"{job.kind if job else 'Job'} {job_id}")
+            st.dataframe(registry.job_summary(job_id), hide_index=True)
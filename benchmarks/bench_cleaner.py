@@ -0,0 +1,71 @@
+"""
+bench_cleaner.py
+
+Times the local transcript cleaner on a synthetic transcript with fillers and repetitions.
+
+Usage:
+    python benchmarks/bench_cleaner.py --words 30000
+"""
+import os
+import sys
+import time
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cleaner import clean_text  # noqa: E402
+
+
+def make_transcript(word_count, seed=0):
+    """
+    Builds a lecture-like transcript where some sentences start with fillers or repeat words.
+    """
+    rng = random.Random(seed)
+    vocabulary = ("the gradient of a loss function tells us which direction to move the weights "
+                  "so that the error goes down and we keep doing this until it converges").split()
+    fillers = ["Um,", "Uh,", "So, like,", "You know,"]
+    words = []
+    while len(words) < word_count:
+        sentence = rng.sample(vocabulary, rng.randint(6, 14))
+        if rng.random() < 0.2:
+            sentence = [rng.choice(fillers)] + sentence
+        if rng.random() < 0.2:
+            position = rng.randrange(len(sentence) - 2)
+            sentence[position:position] = sentence[position:position + 2]  # "we keep we keep"
+        words.extend(sentence)
+        words[-1] += "."
+    return " ".join(words[:word_count])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=30000, help="Length of the synthetic transcript")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    transcript = make_transcript(args.words)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        cleaned = clean_text(transcript)
+        timings.append(time.perf_counter() - start)
+
+    result = {
+        "words_in": len(transcript.split()),
+        "words_out": len(cleaned.split()),
+        "best_seconds": round(min(timings), 4),
+        "mean_seconds": round(sum(timings) / len(timings), 4),
+        "words_per_second": round(args.words / min(timings)),
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+bench_client.py
+
+Fires concurrent chat requests at the fake OpenAI server through the shared client, with the server
+throttling, to check that `call_with_retry` and the rate limiters get every request through.
+
+Usage:
+    python benchmarks/bench_client.py --requests 40 --concurrency 8 --server-rpm 20 --failure-rate 0.1
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_openai_server import FakeServerConfig, start_server  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40, help="Number of chat requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--server-rpm", type=int, default=20, help="Requests a minute the fake server accepts")
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="Fraction of requests failing with a 500")
+    parser.add_argument("--latency", type=float, default=0.1, help="Fake server latency in seconds")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    server, url, server_stats = start_server(FakeServerConfig(
+        latency=args.latency,
+        completion_tokens=50,
+        tokens_per_second=1000,
+        requests_per_minute=args.server_rpm,
+        failure_rate=args.failure_rate
+    ))
+    # The client reads its endpoint when it is created, on the first request
+    os.environ["OAI_API_KEY"] = "fake"
+    os.environ["OAI_API_ENDPOINT"] = url
+
+    from api_call import get_response  # noqa: E402
+    import clients  # noqa: E402
+
+    retries = []
+    lock = threading.Lock()
+    original_call_with_retry = clients.call_with_retry
+
+    def on_retry(attempt, delay, error):
+        with lock:
+            retries.append((attempt, delay, type(error).__name__))
+
+    def call_with_retry(fn, *fn_args, **kwargs):
+        kwargs.setdefault("on_retry", on_retry)
+        return original_call_with_retry(fn, *fn_args, **kwargs)
+
+    # Count retries without changing what get_response does
+    import api_call  # noqa: E402
+    api_call.call_with_retry = call_with_retry
+
+    def request(index):
+        return get_response("You are a helpful assistant.", f"Summarise lecture {index}.", structured_output=None, use_cache=False)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outputs = list(executor.map(request, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    result = {
+        "requests": args.requests,
+        "succeeded": sum(1 for output in outputs if output),
+        "retries": len(retries),
+        "server_throttled": server_stats.throttled,
+        "server_failed": server_stats.failed,
+        "max_retry_delay": round(max((delay for _, delay, _ in retries), default=0), 2),
+        "seconds": round(elapsed, 2),
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(", ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+bench_e2e.py
+
+Offline end-to-end benchmark of the app's flows against the local fake OpenAI server, so performance can be
+tracked without spending anything on Azure.
+
+Scenarios:
+- audio_lecture_note: transcribe and clean a recording, then generate the default `LectureNote`
+- audio_headings: the same with user-supplied headings (a dynamic lecture note model)
+- notes_only: generate a lecture note from typed notes, without audio
+- live_lecture_note: feed the recording to a live session in five-minute chunks, then generate the note once it ends;
+  "note_after_end" is the time from the end of the lecture to the finished note
+
+The recording is synthetic speech-like audio: a voiced tone with a wandering pitch, modulated at syllable rate,
+with short pauses between phrases and a longer pause every half minute, over a low noise floor.
+
+Each scenario runs in a fresh interpreter with its own fake server and an empty transcription cache, and reports
+per-stage latency, peak RSS and throughput as JSON.
+
+Usage:
+    python benchmarks/bench_e2e.py --minutes 20 --output results.json
+    python benchmarks/bench_e2e.py --scenarios notes_only --requests-per-minute 30
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import resource
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ["audio_lecture_note", "audio_headings", "notes_only", "live_lecture_note"]
+
+LIVE_CHUNK_SECONDS = 300
+
+HEADINGS = "Summary, Key Concepts, Worked Examples, Open Questions"
+
+RAW_NOTES = {
+    "title": "Gradient Descent",
+    "date": "01/09/2026",
+    "lecturer": "Dr. Tan",
+    "course": "Machine Learning",
+    "outline": "Loss functions, gradients, learning rates, convergence",
+    "takeaways": "The learning rate trades off speed against stability",
+}
+
+
+def make_speech_like_audio(path, minutes):
+    """
+    Writes a stereo 44.1 kHz MP3 that behaves like a lecture recording for splitting and silence trimming.
+    """
+    voice = (
+        "0.3*sin(2*PI*(140+25*sin(2*PI*0.3*t))*t)"  # Voiced tone with a wandering pitch
+        "*(0.55+0.45*sin(2*PI*4*t))"  # Syllables
+        "*lt(mod(t,6),4.8)"  # Pauses between phrases
+        "*lt(mod(t,37),34.5)"  # A longer pause every half minute
+    )
+    seconds = minutes * 60
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-y",
+         "-f", "lavfi", "-i", f"aevalsrc='{voice}':s=44100:d={seconds}",
+         "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.003:duration={seconds}",
+         "-filter_complex", "amix=inputs=2:normalize=0", "-ac", "2", "-ar", "44100", "-b:a", "128k", path],
+        check=True
+    )
+
+
+class TimingBox:
+    """
+    Stands in for `st.empty()`, recording when output first reaches the UI and how often it is updated.
+    """
+    def __init__(self):
+        self.first_update = None
+        self.updates = 0
+
+    def info(self, text):
+        if self.first_update is None:
+            self.first_update = time.perf_counter()
+        self.updates += 1
+
+
+def run_scenario(scenario, audio_path, server_options):
+    """
+    Runs one scenario in this process and returns its measurements.
+    """
+    from fake_openai_server import FakeServerConfig, start_server
+
+    server, url, server_stats = start_server(FakeServerConfig(**server_options))
+    os.environ["OAI_API_KEY"] = "benchmark"
+    os.environ["OAI_API_ENDPOINT"] = url
+
+    import cache
+    from notes import generate_lecture_note
+    from pipeline import run_pipeline
+    from prompts import format_raw_notes
+    from utils import get_audio_duration
+
+    # Start from an empty transcription cache so every run transcribes
+    cache.transcription_cache.directory = tempfile.mkdtemp(prefix="bench-transcriptions-")
+
+    stages = {}
+    result = {"scenario": scenario}
+    start = time.perf_counter()
+
+    transcript = partial_notes = None
+    if scenario == "live_lecture_note":
+        from live import LiveTranscriber
+
+        chunk_dir = tempfile.mkdtemp(prefix="bench-chunks-")
+        subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-i", audio_path, "-f", "segment",
+                        "-segment_time", str(LIVE_CHUNK_SECONDS), "-c", "copy", os.path.join(chunk_dir, "chunk_%03d.mp3")],
+                       check=True)
+
+        # Each chunk is transcribed before the next arrives, as when the lecture is recorded in real time
+        transcriber = LiveTranscriber()
+        for chunk in sorted(os.listdir(chunk_dir)):
+            if os.path.getsize(os.path.join(chunk_dir, chunk)) > 1024:  # The segmenter can leave an empty last chunk
+                transcriber.add_chunk(os.path.join(chunk_dir, chunk))
+                transcriber.process_available()
+        stages["live_ingest"] = time.perf_counter() - start
+        start = time.perf_counter()  # Later stages are measured from the end of the lecture
+        transcriber.end()
+        live_result = transcriber.run()
+        transcript, partial_notes = live_result["transcription"], live_result["partial_notes"]
+        stages["live_finish"] = time.perf_counter() - start
+        result["audio_seconds"] = round(transcriber.audio_seconds, 1)
+        result["transcript_words"] = len(transcript.split())
+        result["partial_notes"] = len(partial_notes)
+
+    elif scenario != "notes_only":
+        audio_seconds = get_audio_duration(audio_path)
+        first_transcribed = None
+        for event in run_pipeline(audio_path):
+            now = time.perf_counter()
+            if event.stage == "preprocessed":
+                stages["preprocess"] = now - start
+            elif event.stage == "transcribed" and first_transcribed is None:
+                first_transcribed = now
+                stages["first_part_transcribed"] = now - start
+            elif event.stage == "done":
+                transcript = event.data[0]
+                stages["transcribe_and_clean"] = now - start
+                result["parts"] = event.total
+        result["audio_seconds"] = round(audio_seconds, 1)
+        result["transcript_words"] = len(transcript.split())
+
+    box = TimingBox()
+    note_start = time.perf_counter()
+    generate_lecture_note(
+        transcript=transcript,
+        raw_notes=format_raw_notes(**RAW_NOTES),
+        additional_notes="Assignment 2 is due next week.",
+        headings_string=HEADINGS if scenario == "audio_headings" else "",
+        box=box,
+        partial_notes=partial_notes
+    )
+    end = time.perf_counter()
+    if box.first_update is not None:
+        stages["note_first_output"] = box.first_update - note_start
+    stages["note"] = end - note_start
+    stages["total"] = end - start
+    if scenario == "live_lecture_note":
+        stages["note_after_end"] = stages.pop("total")
+    server.shutdown()
+
+    result["stages"] = {stage: round(seconds, 3) for stage, seconds in stages.items()}
+    result["ui_updates"] = box.updates
+    result["requests"] = server_stats.requests
+    result["throttled"] = server_stats.throttled
+    if "total" in stages:
+        result["completion_tokens_per_second"] = round(server_stats.completion_tokens / stages["total"], 1)
+        if "audio_seconds" in result:
+            result["audio_hours_per_wall_hour"] = round(result["audio_seconds"] / stages["total"], 1)
+    # ru_maxrss is in kilobytes on Linux; ffmpeg runs as a child process, so both are reported
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    result["peak_child_rss_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="*", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--minutes", type=float, default=20, help="Length of the synthetic recording")
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake server latency before each response (seconds)")
+    parser.add_argument("--tokens-per-second", type=float, default=80, help="Fake completion speed")
+    parser.add_argument("--whisper-seconds-per-mb", type=float, default=2.0, help="Fake Whisper processing time")
+    parser.add_argument("--requests-per-minute", type=int, default=0, help="Fake server throttling (0 = unlimited)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of fake server requests failing with a 500")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--audio", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    server_options = {
+        "latency": args.latency,
+        "tokens_per_second": args.tokens_per_second,
+        "whisper_seconds_per_mb": args.whisper_seconds_per_mb,
+        "requests_per_minute": args.requests_per_minute,
+        "failure_rate": args.failure_rate,
+    }
+
+    # Child process: run one scenario and print its result
+    if args.run_scenario:
+        print(json.dumps(run_scenario(args.run_scenario, args.audio, server_options)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_path = os.path.join(tmp, "lecture.mp3")
+        if any(scenario != "notes_only" for scenario in args.scenarios):
+            make_speech_like_audio(audio_path, args.minutes)
+
+        for scenario in args.scenarios:
+            command = [sys.executable, os.path.abspath(__file__), "--run-scenario", scenario, "--audio", audio_path]
+            for option, value in server_options.items():
+                command += [f"--{option.replace('_', '-')}", str(value)]
+            completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+            if completed.returncode != 0:
+                sys.stderr.write(completed.stderr)
+                sys.exit(f"Scenario {scenario} failed")
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+            print(json.dumps(results[-1]), flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"minutes": args.minutes, "server": server_options, "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
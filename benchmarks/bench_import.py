@@ -0,0 +1,79 @@
+"""
+bench_import.py
+
+Measures cold-start latency: the time to import each module of the app in a fresh interpreter, which heavy
+dependencies that import pulls in, and the time of the app's first script run (what a new session waits for).
+
+Usage:
+    python benchmarks/bench_import.py --repeat 5
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["config", "prompts", "cleaner", "streaming", "cache", "clients", "api_call", "render",
+           "utils", "notes", "pipeline", "live", "library", "jobs", "cli"]
+
+HEAVY_MODULES = ["streamlit", "openai", "httpx", "pydantic", "numpy"]
+
+IMPORT_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+# Streamlit is imported before timing, since every session of a running server already has it
+APP_SCRIPT = """
+import sys, time, json
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("app.py", default_timeout=60)
+start = time.perf_counter()
+app.run()
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(script, repeat):
+    env = {**os.environ, "OAI_API_KEY": os.environ.get("OAI_API_KEY", "fake"),
+           "OAI_API_ENDPOINT": os.environ.get("OAI_API_ENDPOINT", "http://127.0.0.1:1/")}
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {
+        "seconds": round(statistics.median(run["seconds"] for run in runs), 4),
+        "loaded": ",".join(runs[-1]["loaded"]) or "-",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per measurement (the median is reported)")
+    parser.add_argument("--modules", nargs="*", default=MODULES, help="Modules to import")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for module in args.modules:
+        results.append({"module": module, **measure(IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES), args.repeat)})
+    results.append({"module": "app (first run)", **measure(APP_SCRIPT.format(heavy=HEAVY_MODULES), args.repeat)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+bench_library.py
+
+Measures the lecture library at scale: how long it takes to save lectures, to search them by keyword and to reopen one,
+over a database of synthetic lectures with lecture-length transcripts.
+
+Usage:
+    python benchmarks/bench_library.py --lectures 3000 --words 6000
+"""
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from library import LectureLibrary
+
+TOPICS = ["gradient", "descent", "entropy", "regression", "matrix", "eigenvalue", "convolution", "bayesian", "markov",
+          "kernel", "fourier", "integral", "derivative", "optimisation", "probability", "variance", "recursion",
+          "graph", "sorting", "compiler", "protein", "enzyme", "photosynthesis", "thermodynamics", "quantum"]
+COURSES = ["Machine Learning", "Linear Algebra", "Statistics", "Algorithms", "Biochemistry", "Physics"]
+
+QUERIES = ["gradient", "markov chain", "eigen", "Machine Learning", "thermodynamics entropy", "lecture 42", "no such term", "Machine Lea"]
+
+
+def make_text(rng, vocabulary, words):
+    return " ".join(rng.choices(vocabulary, k=words))
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lectures", type=int, default=3000, help="Lectures in the library")
+    parser.add_argument("--words", type=int, default=6000, help="Words in each transcript")
+    parser.add_argument("--repeat", type=int, default=50, help="Runs of each query")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # Common filler words plus a long tail of made-up words, so term frequencies look like speech
+    long_tail = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(4, 10))) for _ in range(20000)]
+    vocabulary = ["the", "a", "of", "and", "to", "is", "we", "so", "this", "that"] * 200 + TOPICS * 4 + long_tail
+
+    with tempfile.TemporaryDirectory() as tmp:
+        library = LectureLibrary(os.path.join(tmp, "library.db"))
+
+        start = time.perf_counter()
+        for index in range(args.lectures):
+            transcript = make_text(rng, vocabulary, args.words)
+            lecture_id = library.save_transcript(transcript, transcript, source=f"lecture_{index}.mp3", title=f"Lecture {index}")
+            library.save_note(
+                f"# {rng.choice(TOPICS).title()}\n\n{make_text(rng, vocabulary, 400)}",
+                details={"title": f"Lecture {index}", "course": rng.choice(COURSES), "lecturer": "Dr. Tan"},
+                lecture_id=lecture_id
+            )
+        save_seconds = time.perf_counter() - start
+
+        results = {
+            "lectures": args.lectures,
+            "words_per_transcript": args.words,
+            "database_mb": round(os.path.getsize(library.path) / (1024 * 1024), 1),
+            "save_ms_per_lecture": round(save_seconds * 1000 / args.lectures, 2),
+            "queries": {},
+        }
+
+        for query in QUERIES + [""]:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                matches = library.search(query)
+                timings.append((time.perf_counter() - start) * 1000)
+            results["queries"][query or "(recent)"] = {
+                "matches": len(matches),
+                "p50_ms": round(statistics.median(timings), 2),
+                "p95_ms": round(percentile(timings, 0.95), 2),
+            }
+
+        timings = []
+        for _ in range(args.repeat):
+            lecture_id = rng.randint(1, args.lectures)
+            start = time.perf_counter()
+            library.get(lecture_id)
+            timings.append((time.perf_counter() - start) * 1000)
+        results["open_p50_ms"] = round(statistics.median(timings), 2)
+        library.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+bench_split_audio.py
+
+Compares the number of MP3 encodes and the CPU time per hour of audio for the original pydub-based
+`split_audio` (export, measure, shrink by 5 minutes and re-export) and the bitrate-planned `split_audio`.
+
+Usage:
+    python benchmarks/bench_split_audio.py --minutes 60 --max-size-mb 10
+"""
+import io
+import os
+import sys
+import time
+import json
+import argparse
+import resource
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OAI_API_KEY", "benchmark")
+os.environ.setdefault("OAI_API_ENDPOINT", "http://127.0.0.1:1")
+
+import utils  # noqa: E402
+
+
+def make_audio(path, minutes):
+    """
+    Writes a stereo 44.1 kHz MP3 of the given length, similar to a typical lecture recording.
+    """
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-y",
+         "-f", "lavfi", "-i", f"sine=frequency=220:duration={minutes * 60}",
+         "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.05:duration={minutes * 60}",
+         "-filter_complex", "amix=inputs=2", "-ac", "2", "-ar", "44100", path],
+        check=True
+    )
+
+
+def legacy_split_audio(audio_file, max_size_mb, counter):
+    """
+    The original split_audio, with every MP3 export counted.
+    """
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(audio_file)
+    max_size_bytes = max_size_mb * (1024 * 1024)
+    segments = []
+    start_time = 0
+    segment_duration = 60 * 30 * 1000
+
+    def export(segment):
+        segment_bytes = io.BytesIO()
+        segment.export(segment_bytes, format='mp3')
+        counter["encodes"] += 1
+        return segment_bytes
+
+    while start_time < len(audio):
+        segment = audio[start_time:(start_time + segment_duration)]
+        segment_bytes = export(segment)
+        while segment_bytes.getbuffer().nbytes > max_size_bytes:
+            segment_duration -= 5 * 60 * 1000
+            segment = audio[start_time:(start_time + segment_duration)]
+            segment_bytes = export(segment)
+        segments.append(segment_bytes)
+        start_time += len(segment)
+
+    return segments
+
+
+def planned_split_audio(audio_file, max_size_mb, counter):
+    """
+    The current split_audio, with every ffmpeg encode counted.
+    """
+    encode_window = utils._encode_window
+
+    def counting_encode_window(*args, **kwargs):
+        counter["encodes"] += 1
+        return encode_window(*args, **kwargs)
+
+    utils._encode_window = counting_encode_window
+    try:
+        return list(utils.split_audio(audio_file, max_size_mb=max_size_mb))
+    finally:
+        utils._encode_window = encode_window
+
+
+def cpu_seconds():
+    """
+    CPU time used so far by this process and by the ffmpeg processes it has waited for.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def run(name, split_fn, path, max_size_mb, hours):
+    counter = {"encodes": 0}
+    cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+    segments = split_fn(path, max_size_mb, counter)
+    cpu, wall = cpu_seconds() - cpu_start, time.perf_counter() - wall_start
+    return {
+        "implementation": name,
+        "segments": len(segments),
+        "largest_segment_mb": round(max(s.getbuffer().nbytes for s in segments) / (1024 * 1024), 2),
+        "encodes": counter["encodes"],
+        "encodes_per_audio_hour": round(counter["encodes"] / hours, 2),
+        "cpu_seconds_per_audio_hour": round(cpu / hours, 2),
+        "wall_seconds": round(wall, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=60, help="Length of the synthetic recording")
+    parser.add_argument("--max-size-mb", type=int, default=10, help="Segment size limit passed to split_audio")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only benchmark the current implementation")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lecture.mp3")
+        make_audio(path, args.minutes)
+        hours = args.minutes / 60
+
+        results = []
+        if not args.skip_legacy:
+            results.append(run("legacy", legacy_split_audio, path, args.max_size_mb, hours))
+        results.append(run("planned", planned_split_audio, path, args.max_size_mb, hours))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
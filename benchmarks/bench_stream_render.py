@@ -0,0 +1,115 @@
+"""
+bench_stream_render.py
+
+Compares the original streaming loop (`results += chunk; box.info(results)` on every chunk) with
+`StreamConsumer` on a simulated token stream, counting UI pushes and the characters they send.
+
+The fake box serialises every pushed text to UTF-8, roughly what Streamlit does before sending it over the websocket.
+
+Usage:
+    python benchmarks/bench_stream_render.py --tokens 20000
+"""
+import os
+import sys
+import time
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming import StreamConsumer  # noqa: E402
+
+
+class FakeBox:
+    """
+    Stands in for `st.empty()`, recording what would be sent to the browser.
+    """
+    def __init__(self):
+        self.pushes = 0
+        self.chars_sent = 0
+
+    def info(self, text):
+        self.pushes += 1
+        self.chars_sent += len(text.encode("utf-8"))
+
+
+def make_tokens(count, seed=0):
+    words = ["lecture", "the", "gradient", "of", "a", "function", "is", "zero", "at", "minimum", "we", "see", "that"]
+    rng = random.Random(seed)
+    return [" " + rng.choice(words) for _ in range(count)]
+
+
+def naive_consume(tokens, box):
+    results = ""
+    for token in tokens:
+        results += token
+        box.info(results)
+    return results
+
+
+def paced(tokens, tokens_per_second):
+    """
+    Yields the tokens, sleeping between batches to model the speed of the model.
+    """
+    for index, token in enumerate(tokens):
+        yield token
+        if tokens_per_second and index % 50 == 49:
+            time.sleep(50 / tokens_per_second)
+
+
+def run(consume):
+    box = FakeBox()
+    start = time.perf_counter()
+    text = consume(box)
+    return box, text, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=20000, help="Number of streamed chunks")
+    parser.add_argument("--tokens-per-second", type=float, default=0,
+                        help="Simulated model speed (0 = as fast as possible)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    tokens = make_tokens(args.tokens)
+
+    naive_box, naive_text, naive_elapsed = run(lambda box: naive_consume(paced(tokens, args.tokens_per_second), box))
+
+    consumers = []
+    def consume(box):
+        consumers.append(StreamConsumer(box))
+        return consumers[0].consume(paced(tokens, args.tokens_per_second))
+    consumer_box, consumer_text, consumer_elapsed = run(consume)
+    stats = consumers[0].stats
+    assert naive_text == consumer_text
+
+    results = [
+        {
+            "implementation": "naive",
+            "ui_pushes": naive_box.pushes,
+            "chars_sent": naive_box.chars_sent,
+            "seconds": round(naive_elapsed, 4),
+            "chunks_per_second": round(len(tokens) / naive_elapsed),
+        },
+        {
+            "implementation": "stream_consumer",
+            "ui_pushes": consumer_box.pushes,
+            "chars_sent": consumer_box.chars_sent,
+            "seconds": round(consumer_elapsed, 4),
+            "chunks_per_second": round(len(tokens) / consumer_elapsed),
+            "time_to_first_token": round(stats.time_to_first_token, 6),
+        },
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
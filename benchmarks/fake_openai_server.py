@@ -0,0 +1,286 @@
+"""
+fake_openai_server.py
+
+A local stand-in for the Azure OpenAI endpoints the app uses, for exercising the client, retries and
+rate limiting without calling (or paying for) Azure.
+
+It answers Whisper transcriptions, streamed and non-streamed chat completions, and structured outputs
+(it fills in any JSON schema it is sent), with configurable latency, token rate, throttling and failures.
+
+Usage:
+    python benchmarks/fake_openai_server.py --port 8765 --requests-per-minute 60
+    OAI_API_KEY=fake OAI_API_ENDPOINT=http://127.0.0.1:8765/ streamlit run app.py
+"""
+import json
+import time
+from email.utils import formatdate
+import random
+import argparse
+import threading
+from dataclasses import dataclass
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the lecture covers gradient descent and how the learning rate controls the size of each step "
+         "towards a minimum of the loss function").split()
+
+
+@dataclass
+class FakeServerConfig:
+    """
+    How the fake server behaves
+    """
+    latency: float = 0.2  # Seconds before the first byte of every response
+    tokens_per_second: float = 200.0  # Speed of streamed and non-streamed completions
+    completion_tokens: int = 400  # Length of plain-text completions
+    whisper_seconds_per_mb: float = 2.0  # Extra Whisper latency per MB of uploaded audio
+    requests_per_minute: int = 0  # Requests above this rate get a 429 with Retry-After (0 = unlimited)
+    failure_rate: float = 0.0  # Fraction of requests that fail with `failure_status`
+    failure_status: int = 500  # Status of failed requests, e.g. 400 for one that must not be retried
+    throttle_first: int = 0  # The first this many requests get a 429 asking to retry after `retry_after` seconds
+    fail_first: int = 0  # The next this many requests fail with `failure_status`
+    retry_after: float = 1.0  # Seconds asked for by the 429s of `throttle_first`
+    retry_after_format: str = "both"  # How a 429 gives the wait: "ms", "seconds", "date", "both" (ms and seconds) or "none"
+
+
+class FakeServerStats:
+    """
+    Counts what the server has seen, so benchmarks can report throttling.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.failed = 0
+        self.audio_bytes = 0
+        self.completion_tokens = 0
+
+
+def fake_text(token_count, rng):
+    return " ".join(rng.choice(WORDS) for _ in range(max(1, token_count)))
+
+
+def fake_value(schema, definitions, rng):
+    """
+    Builds a value that matches a JSON schema, as produced by pydantic for structured outputs.
+    """
+    if "$ref" in schema:
+        return fake_value(definitions[schema["$ref"].split("/")[-1]], definitions, rng)
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            options = [option for option in schema[key] if option.get("type") != "null"] or schema[key]
+            return fake_value(options[0], definitions, rng)
+
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "null")
+    if kind == "object":
+        return {name: fake_value(prop, definitions, rng) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fake_value(schema.get("items", {"type": "string"}), definitions, rng) for _ in range(3)]
+    if kind == "integer":
+        return rng.randint(0, 100)
+    if kind == "number":
+        return rng.random() * 100
+    if kind == "boolean":
+        return rng.random() < 0.5
+    if kind == "null":
+        return None
+    return fake_text(rng.randint(8, 30), rng).capitalize() + "."
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Set on the subclass created by `start_server`
+    config: FakeServerConfig = None
+    stats: FakeServerStats = None
+    window: deque = None
+    window_lock: threading.Lock = None
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _retry_after_headers(self, wait):
+        form = self.config.retry_after_format
+        headers = {}
+        if form in ("ms", "both"):
+            headers["retry-after-ms"] = str(int(wait * 1000))
+        if form in ("seconds", "both"):
+            headers["retry-after"] = str(max(1, round(wait)))
+        if form == "date":
+            headers["retry-after"] = formatdate(time.time() + wait, usegmt=True)
+        return headers
+
+    def _throttled(self):
+        """
+        Returns how long the caller should wait if this request is over the per-minute limit, else None.
+        """
+        limit = self.config.requests_per_minute
+        if not limit:
+            return None
+        now = time.monotonic()
+        with self.window_lock:
+            while self.window and now - self.window[0] > 60:
+                self.window.popleft()
+            if len(self.window) >= limit:
+                return 60 - (now - self.window[0])
+            self.window.append(now)
+        return None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("content-length", 0)))
+        rng = random.Random()
+
+        with self.stats.lock:
+            self.stats.requests += 1
+            number = self.stats.requests
+
+        wait = self.config.retry_after if number <= self.config.throttle_first else self._throttled()
+        if wait is not None:
+            with self.stats.lock:
+                self.stats.throttled += 1
+            self._send_json(429, {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                            self._retry_after_headers(wait))
+            return
+
+        if number <= self.config.throttle_first + self.config.fail_first or rng.random() < self.config.failure_rate:
+            with self.stats.lock:
+                self.stats.failed += 1
+            status = self.config.failure_status
+            self._send_json(status, {"error": {"code": str(status), "message": f"Fake error {status}."}})
+            return
+
+        time.sleep(self.config.latency)
+        path = self.path.split("?")[0]
+        if path.endswith("/audio/transcriptions"):
+            self._transcription(body, rng)
+        elif path.endswith("/chat/completions"):
+            self._chat(json.loads(body), rng)
+        else:
+            self._send_json(404, {"error": {"code": "404", "message": f"Unknown path {path}"}})
+
+    def _transcription(self, body, rng):
+        megabytes = len(body) / (1024 * 1024)
+        with self.stats.lock:
+            self.stats.audio_bytes += len(body)
+        time.sleep(megabytes * self.config.whisper_seconds_per_mb)
+        # About 150 spoken words a minute of 32 kbps audio (0.24 MB)
+        self._send_json(200, {"text": fake_text(int(megabytes / 0.24 * 150), rng).capitalize() + "."})
+
+    def _chat(self, request, rng):
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            content = json.dumps(fake_value(schema, schema.get("$defs", {}), rng))
+        else:
+            content = fake_text(self.config.completion_tokens, rng)
+
+        # Split into roughly four-character tokens
+        tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+        prompt_tokens = sum(len(message.get("content") or "") for message in request.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        with self.stats.lock:
+            self.stats.completion_tokens += len(tokens)
+
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request.get("model", "fake")}
+        if not request.get("stream"):
+            time.sleep(len(tokens) / self.config.tokens_per_second)
+            self._send_json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content}
+            }]})
+            return
+
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": delta, "finish_reason": finish_reason}
+            ]})
+
+        # Azure starts every stream with a chunk that only carries content filter results
+        send_event(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "prompt_filter_results": []}))
+        send_event(chunk({"role": "assistant", "content": ""}))
+        for token in tokens:
+            time.sleep(1 / self.config.tokens_per_second)
+            send_event(chunk({"content": token}))
+        send_event(chunk({}, "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send_event(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start_server(config=None, port=0):
+    """
+    Starts the fake server on a background thread.
+
+    Args:
+    - config (FakeServerConfig, optional): How the server behaves
+    - port (int, optional): Port to listen on; 0 picks a free one
+
+    Returns:
+    Tuple[ThreadingHTTPServer, str, FakeServerStats]: The server (call `shutdown()` to stop it), its endpoint URL and its counters
+    """
+    handler = type("Handler", (FakeOpenAIHandler,), {
+        "config": config or FakeServerConfig(),
+        "stats": FakeServerStats(),
+        "window": deque(),
+        "window_lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/", handler.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=FakeServerConfig.latency)
+    parser.add_argument("--tokens-per-second", type=float, default=FakeServerConfig.tokens_per_second)
+    parser.add_argument("--completion-tokens", type=int, default=FakeServerConfig.completion_tokens)
+    parser.add_argument("--whisper-seconds-per-mb", type=float, default=FakeServerConfig.whisper_seconds_per_mb)
+    parser.add_argument("--requests-per-minute", type=int, default=FakeServerConfig.requests_per_minute)
+    parser.add_argument("--failure-rate", type=float, default=FakeServerConfig.failure_rate)
+    args = parser.parse_args()
+
+    config = FakeServerConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        whisper_seconds_per_mb=args.whisper_seconds_per_mb,
+        requests_per_minute=args.requests_per_minute,
+        failure_rate=args.failure_rate,
+    )
+    server, url, _ = start_server(config, args.port)
+    print(f"Fake OpenAI server listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+cache.py
+
+This file contains the caches that let the application skip API calls it has already paid for.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+from cachetools import TTLCache
+
+from config import (
+    CACHE_DIR,
+    TRANSCRIPTION_CACHE_MAX_MB,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_ENTRIES
+)
+
+def hash_audio(audio_file, block_size=1024 * 1024):
+    """
+    Computes the SHA-256 hash of an audio file without loading it into memory at once.
+
+    Args:
+    - audio_file (str or file-like object): Path to the audio file or a file-like object (e.g., BytesIO).
+    - block_size (int, optional): Number of bytes hashed at a time.
+
+    Returns:
+    str: The hex digest of the audio bytes.
+    """
+    digest = hashlib.sha256()
+
+    if isinstance(audio_file, (str, os.PathLike)):
+        with open(audio_file, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    position = audio_file.tell()
+    audio_file.seek(0)
+    for block in iter(lambda: audio_file.read(block_size), b""):
+        digest.update(block)
+    audio_file.seek(position)  # Leave the file where the caller had it
+    return digest.hexdigest()
+
+class TranscriptionCache:
+    """
+    Persistent, size-bounded LRU cache of transcriptions, stored as one text file per entry.
+
+    Entries are keyed on the audio hash plus everything else that changes the transcription
+    (language, model, preprocessing), so the same recording uploaded by anyone is only transcribed once.
+    Reading an entry refreshes its modification time, and the least recently used entries are
+    deleted once the directory grows past `max_mb`.
+    """
+    def __init__(self, directory=os.path.join(CACHE_DIR, "transcriptions"), max_mb=TRANSCRIPTION_CACHE_MAX_MB):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(audio_hash, *parts):
+        """
+        Builds a cache key from the audio hash and the settings the transcription depends on.
+
+        Args:
+        - audio_hash (str): Hash of the audio bytes, from `hash_audio`.
+        - parts: Other values the transcription depends on, such as the language and model.
+
+        Returns:
+        str: The cache key.
+        """
+        return hashlib.sha256("\0".join([audio_hash, *map(str, parts)]).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def get(self, key):
+        """
+        Gets a cached transcription.
+
+        Args:
+        - key (str): The cache key, from `make_key`.
+
+        Returns:
+        str or None: The transcription, or None if it is not cached.
+        """
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            return None
+        return text
+
+    def set(self, key, text):
+        """
+        Stores a transcription, then evicts the least recently used entries if the cache is too large.
+
+        Args:
+        - key (str): The cache key, from `make_key`.
+        - text (str): The transcription.
+        """
+        # Write to a temporary file first so another process never reads a half-written entry
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.directory, suffix=".tmp", delete=False) as tmp:
+            tmp.write(text)
+        os.replace(tmp.name, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".txt"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+class ResponseCache:
+    """
+    In-memory cache of chat responses with a time-to-live and a maximum number of entries.
+
+    It is shared by every session in the process, and is safe to use from several threads.
+    """
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self._cache = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(**parts):
+        """
+        Builds a cache key from everything the response depends on.
+
+        Args:
+        - parts: JSON-serialisable values, such as the messages, the response schema and the generation parameters.
+
+        Returns:
+        str: The cache key.
+        """
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Gets a cached response.
+
+        Args:
+        - key (str): The cache key, from `make_key`.
+
+        Returns:
+        str or None: The response text (or JSON for structured responses), or None if it is not cached or has expired.
+        """
+        with self._lock:
+            return self._cache.get(key)
+
+    def set(self, key, text):
+        """
+        Stores a response.
+
+        Args:
+        - key (str): The cache key, from `make_key`.
+        - text (str): The response text (or JSON for structured responses).
+        """
+        with self._lock:
+            self._cache[key] = text
+
+transcription_cache = TranscriptionCache()
+response_cache = ResponseCache()
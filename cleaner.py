@@ -0,0 +1,162 @@
+"""
+cleaner.py
+
+This file contains the local transcript cleaner, which removes filler words and repetition without an API call.
+"""
+import re
+
+from config import CLEAN_MAX_NGRAM
+
+# Hesitation sounds are removed wherever they appear. Between two commas one comma is kept ("it is, uh, fine"),
+# at the start of a sentence the punctuation after them goes too ("Um. So today"), elsewhere the comma next to them does.
+# A hyphen counts as part of the word, so "uh-huh", "mm-hmm" and "uh-oh" are kept whole
+HESITATIONS = r"(?<![\w-])(?:u+m+|u+h+|e+r+m+|h+m+)(?![\w-])"
+HESITATION_BETWEEN_COMMAS_PATTERN = re.compile(rf",\s*{HESITATIONS}\s*,", re.IGNORECASE)
+HESITATION_AT_START_PATTERN = re.compile(rf"(^|[.?!]\s+){HESITATIONS}\s*[,.?!]*\s*", re.IGNORECASE)
+HESITATION_PATTERN = re.compile(rf"(?:,\s*)?{HESITATIONS}(?:\s*,)?", re.IGNORECASE)
+
+# Filler phrases are only removed when set off by punctuation, so "I like this" and "a sort of bias" are kept
+FILLER_PHRASES = r"(?:like|you know|sort of|kind of|i mean)"
+FILLER_BETWEEN_COMMAS_PATTERN = re.compile(rf",\s*{FILLER_PHRASES}\s*,", re.IGNORECASE)
+FILLER_BEFORE_END_PATTERN = re.compile(rf",\s*{FILLER_PHRASES}\s*(?=[.?!])", re.IGNORECASE)
+FILLER_AT_START_PATTERN = re.compile(rf"(^|[.?!]\s+){FILLER_PHRASES}\s*,\s*", re.IGNORECASE)
+
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.?!])\s+")
+SENTENCE_END_PATTERN = re.compile(r"[.?!]['\")\]]*$")
+DIGIT_PATTERN = re.compile(r"\d")
+SPACE_PATTERN = re.compile(r"\s+")
+SPACE_BEFORE_PUNCTUATION_PATTERN = re.compile(r"\s+([,.?!;:])")
+REPEATED_PUNCTUATION_PATTERN = re.compile(r"([,;:])(?:\s*[,;:])+")
+COMMA_BEFORE_END_PATTERN = re.compile(r",\s*([.?!])")
+NORMALISE_PATTERN = re.compile(r"[^\w']")
+
+# Words that are legitimately doubled in English ("had had", "that that") or doubled for emphasis ("very very")
+ALLOWED_DOUBLES = {"had", "that", "very", "really", "much", "many", "long", "far"}
+
+# Abbreviations ending in a full stop that do not end a sentence, so the next word is not capitalised
+ABBREVIATIONS = {"e.g.", "i.e.", "etc.", "vs.", "cf.", "approx.", "dr.", "mr.", "mrs.", "ms.", "prof.", "fig.", "eq."}
+
+def _normalise(word):
+    return NORMALISE_PATTERN.sub("", word.lower())
+
+def remove_fillers(text):
+    """
+    Removes hesitation sounds ("um", "uh") and filler phrases ("like", "you know", "sort of") set off by punctuation.
+
+    A filler between two commas is replaced by one comma, so "it is, you know, fine" becomes "it is, fine".
+
+    Args:
+    - text (str): The transcript
+
+    Returns:
+    str: The transcript without fillers
+    """
+    text = HESITATION_BETWEEN_COMMAS_PATTERN.sub(",", text)
+    text = HESITATION_AT_START_PATTERN.sub(r"\1", text)
+    text = HESITATION_PATTERN.sub(" ", text)
+    text = FILLER_BETWEEN_COMMAS_PATTERN.sub(",", text)
+    text = FILLER_BEFORE_END_PATTERN.sub("", text)
+    return FILLER_AT_START_PATTERN.sub(r"\1", text)
+
+def remove_repeated_ngrams(text, max_n=CLEAN_MAX_NGRAM):
+    """
+    Collapses a run of words that is immediately repeated ("I think I think it is") into one copy.
+
+    The later copy is kept, since it is usually the one the speaker finished the sentence with. Runs containing a number
+    are never collapsed, as repeated numbers ("1 1 2 3 5 8") are part of what was said, and neither are runs that cross
+    the end of a sentence ("The answer is yes. Yes.").
+
+    Args:
+    - text (str): The transcript
+    - max_n (int, optional): The longest repeated run of words that is collapsed
+
+    Returns:
+    str: The transcript without immediate repetitions
+    """
+    words = text.split()
+    normalised = [_normalise(word) for word in words]
+    numeric = [bool(DIGIT_PATTERN.search(word)) for word in normalised]
+    ends_sentence = [bool(SENTENCE_END_PATTERN.search(word)) for word in words]
+    keep = [True] * len(words)
+
+    index = 0
+    while index < len(words):
+        for n in range(min(max_n, (len(words) - index) // 2), 0, -1):
+            # Cheap check on the first word before comparing whole runs
+            if normalised[index] != normalised[index + n] or not normalised[index]:
+                continue
+            if n == 1 and normalised[index] in ALLOWED_DOUBLES:
+                continue
+            if any(numeric[index:index + n]) or any(ends_sentence[index:index + n]):
+                continue
+            if normalised[index:index + n] == normalised[index + n:index + 2 * n]:
+                for position in range(index, index + n):
+                    keep[position] = False
+                index += n - 1  # The kept copy may itself be repeated again
+                break
+        index += 1
+
+    return " ".join(word for word, kept in zip(words, keep) if kept)
+
+def remove_repeated_sentences(text):
+    """
+    Drops a sentence that repeats the sentence right before it.
+
+    Args:
+    - text (str): The transcript
+
+    Returns:
+    str: The transcript without repeated sentences
+    """
+    sentences = []
+    previous = None
+    for sentence in SENTENCE_SPLIT_PATTERN.split(text):
+        normalised = " ".join(_normalise(word) for word in sentence.split())
+        if normalised and normalised == previous:
+            continue
+        sentences.append(sentence)
+        previous = normalised
+    return " ".join(sentences)
+
+def _capitalise_sentences(text):
+    """
+    Capitalises the first letter of each sentence, except after an abbreviation such as "e.g.".
+    """
+    sentences = SENTENCE_SPLIT_PATTERN.split(text)
+    for index in range(len(sentences)):
+        after_abbreviation = index > 0 and sentences[index - 1].rsplit(" ", 1)[-1].lower() in ABBREVIATIONS
+        if not after_abbreviation:
+            sentences[index] = sentences[index][:1].upper() + sentences[index][1:]
+    return " ".join(sentences)
+
+def normalise_whitespace(text):
+    """
+    Collapses whitespace, tidies punctuation left behind by removed words and capitalises each sentence.
+
+    Args:
+    - text (str): The transcript
+
+    Returns:
+    str: The tidied transcript
+    """
+    text = SPACE_PATTERN.sub(" ", text).strip()
+    text = SPACE_BEFORE_PUNCTUATION_PATTERN.sub(r"\1", text)
+    text = REPEATED_PUNCTUATION_PATTERN.sub(r"\1", text)
+    text = COMMA_BEFORE_END_PATTERN.sub(r"\1", text)
+    text = text.lstrip(",;:.?! ")  # Left at the start once the words before it were removed
+    return _capitalise_sentences(text)
+
+def clean_text(transcript):
+    """
+    Cleans a transcript locally: removes fillers, immediate repetitions and repeated sentences, and normalises whitespace.
+
+    Args:
+    - transcript (str): The transcript to clean
+
+    Returns:
+    str: The cleaned transcript
+    """
+    text = remove_fillers(transcript)
+    text = remove_repeated_ngrams(text)
+    text = remove_repeated_sentences(text)
+    return normalise_whitespace(text)
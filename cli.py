@@ -0,0 +1,393 @@
+"""
+cli.py
+
+This file is the headless batch entry point: it runs the same pipeline as the app over a directory or manifest of
+lecture recordings, writing notes and transcripts to disk and saving them to the lecture library.
+
+Finished recordings are recorded in a state file in the output directory, so a batch that is interrupted can be run
+again with the same arguments and only the remaining recordings are processed.
+
+Usage:
+    python cli.py lectures/ --output notes/ --course "Machine Learning" --workers 2
+    python cli.py semester.csv --output notes/ --headings "Summary, Key Concepts, Examples"
+    python cli.py recording.mp3 --follow --output notes/ --title "Week 3"
+
+With --follow, the source is a recording that is still being written: it is transcribed as it grows, and the note is
+written once the recording has not grown for --idle-timeout seconds.
+
+A manifest is a CSV or JSON list of lectures with an "audio" path (relative to the manifest) and optionally
+"name", "title", "date", "lecturer", "course", "outline", "takeaways", "additional_notes" and "headings".
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cache import hash_audio
+from live import LiveTranscriber
+from library import (
+    LECTURE_DETAILS,
+    get_library
+)
+from notes import generate_lecture_note
+from prompts import format_raw_notes
+from pipeline import run_pipeline
+from utils import get_audio_duration
+from metrics import (
+    job_context,
+    start_metrics_server
+)
+from config import (
+    BATCH_MAX_WORKERS,
+    CLEANING_MODE,
+    LIVE_IDLE_TIMEOUT,
+    METRICS_PORT,
+    METRICS_HOST
+)
+
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".mpeg")
+
+def find_recordings(directory):
+    """
+    Lists the audio files in a directory and its subdirectories.
+
+    Args:
+    - directory (str): The directory to search
+
+    Returns:
+    List[dict]: One lecture per recording, named after its path relative to `directory`
+    """
+    lectures = []
+    for root, _, files in os.walk(directory):
+        for file_name in files:
+            if file_name.lower().endswith(AUDIO_EXTENSIONS):
+                path = os.path.join(root, file_name)
+                name = os.path.splitext(os.path.relpath(path, directory))[0].replace(os.sep, "__")
+                lectures.append({"audio": os.path.abspath(path), "name": name})
+    return sorted(lectures, key=lambda lecture: lecture["name"])
+
+def read_manifest(path):
+    """
+    Reads a CSV or JSON manifest of lectures.
+
+    Args:
+    - path (str): Path to the manifest
+
+    Returns:
+    List[dict]: The lectures, with audio paths made absolute
+    """
+    with open(path, encoding="utf-8", newline="") as file:
+        if path.lower().endswith(".json"):
+            lectures = json.load(file)
+        else:
+            lectures = list(csv.DictReader(file))
+
+    base = os.path.dirname(os.path.abspath(path))
+    for lecture in lectures:
+        if not lecture.get("audio"):
+            raise ValueError(f"Manifest entry without an audio path: {lecture}")
+        lecture["audio"] = os.path.join(base, lecture["audio"])
+        lecture["name"] = lecture.get("name") or os.path.splitext(os.path.basename(lecture["audio"]))[0]
+    return lectures
+
+def fill_defaults(lecture, defaults):
+    """
+    Fills in the `LECTURE_DETAILS` of a lecture that are not set, titling it after its name if it has no title.
+    """
+    for key in LECTURE_DETAILS:
+        lecture[key] = lecture.get(key) or defaults.get(key) or ""
+    lecture["title"] = lecture["title"] or lecture["name"]
+    return lecture
+
+def load_lectures(source, defaults):
+    """
+    Loads the lectures to process from a directory or a manifest, filling in details not given per lecture.
+
+    Args:
+    - source (str): A directory of recordings, or a CSV or JSON manifest
+    - defaults (dict): Values for the `LECTURE_DETAILS` not set per lecture (e.g., the course name)
+
+    Returns:
+    List[dict]: The lectures, with unique names
+    """
+    lectures = find_recordings(source) if os.path.isdir(source) else read_manifest(source)
+
+    seen = {}
+    for lecture in lectures:
+        fill_defaults(lecture, defaults)
+
+        # Two recordings with the same name would overwrite each other's notes
+        count = seen.get(lecture["name"], 0) + 1
+        seen[lecture["name"]] = count
+        if count > 1:
+            lecture["name"] = f"{lecture['name']}_{count}"
+    return lectures
+
+class BatchState:
+    """
+    The resumable record of a batch: which recordings are done or failed, and where their outputs are.
+
+    Saved as JSON after every recording, replacing the file atomically so a crash never leaves it half written.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.lectures = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.lectures = json.load(file).get("lectures", {})
+
+    def is_done(self, lecture):
+        """
+        Checks if a lecture was completed by an earlier run and its outputs are still there.
+        """
+        entry = self.lectures.get(lecture["audio"])
+        return (
+            entry is not None
+            and entry["status"] == "done"
+            and all(os.path.exists(path) for path in entry["outputs"].values())
+        )
+
+    def record(self, lecture, entry):
+        """
+        Stores the outcome of a lecture and saves the state file.
+        """
+        with self._lock:
+            self.lectures[lecture["audio"]] = entry
+            directory = os.path.dirname(os.path.abspath(self.path))
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".tmp", delete=False) as tmp:
+                json.dump({"lectures": self.lectures}, tmp, indent=2)
+            os.replace(tmp.name, self.path)
+
+def _write_text(path, text):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+
+def _write_up(lecture, output_dir, transcription, clean_transcription, partial_notes=None):
+    """
+    Generates the lecture note from a transcript, writes it to `output_dir` with the transcripts and saves it to the lecture library.
+
+    Returns:
+    dict: The "outputs" (paths of the note, transcript and clean transcript) and the "lecture_id" in the library
+    """
+    lecture_note, lecture_note_md = generate_lecture_note(
+        transcript=transcription,
+        raw_notes=format_raw_notes(
+            title=lecture["title"],
+            date=lecture["date"],
+            lecturer=lecture["lecturer"],
+            course=lecture["course"],
+            outline=lecture["outline"],
+            takeaways=lecture["takeaways"]
+        ),
+        additional_notes=lecture["additional_notes"],
+        headings_string=lecture["headings"],
+        partial_notes=partial_notes
+    )
+
+    outputs = {
+        "note": os.path.join(output_dir, f"{lecture['name']}.md"),
+        "transcript": os.path.join(output_dir, f"{lecture['name']}.transcript.txt"),
+        "clean_transcript": os.path.join(output_dir, f"{lecture['name']}.clean.txt"),
+    }
+    _write_text(outputs["transcript"], transcription)
+    _write_text(outputs["clean_transcript"], clean_transcription)
+    _write_text(outputs["note"], lecture_note_md)
+
+    library = get_library()
+    lecture_id = library.save_transcript(
+        transcription,
+        clean_transcription,
+        source=lecture["audio"],
+        audio_hash=hash_audio(lecture["audio"]),
+        title=lecture["title"],
+        owner="cli"  # Processing a recording again updates its lecture
+    )
+    library.save_note(
+        lecture_note_md,
+        lecture_note,
+        details={key: lecture[key] for key in LECTURE_DETAILS},
+        lecture_id=lecture_id
+    )
+    return {"outputs": outputs, "lecture_id": lecture_id}
+
+def process_lecture(lecture, output_dir, language="en", trim_silence=False, cleaning_mode=CLEANING_MODE):
+    """
+    Transcribes, cleans and writes up one recording.
+
+    Args:
+    - lecture (dict): The lecture, from `load_lectures`
+    - output_dir (str): Directory to write the note and transcripts to
+    - language (str, optional): The language of the audio. Default is English ("en").
+    - trim_silence (bool, optional): Shorten long silences before transcribing. Default is False.
+    - cleaning_mode (str, optional): "local" or "llm", see `run_pipeline`
+
+    Returns:
+    dict: The state entry of the lecture, with its outputs, audio seconds and processing seconds
+    """
+    start = time.perf_counter()
+    audio_seconds = get_audio_duration(lecture["audio"])
+
+    for event in run_pipeline(lecture["audio"], language=language, trim_silence=trim_silence, cleaning_mode=cleaning_mode):
+        if event.stage == "done":
+            transcription, clean_transcription = event.data
+
+    return {
+        "status": "done",
+        **_write_up(lecture, output_dir, transcription, clean_transcription),
+        "audio_seconds": audio_seconds,
+        "seconds": time.perf_counter() - start,
+    }
+
+def follow_lecture(lecture, output_dir, language="en", cleaning_mode=CLEANING_MODE, idle_timeout=LIVE_IDLE_TIMEOUT):
+    """
+    Transcribes a recording while it is still being written, and writes up the lecture once it stops growing.
+
+    Args:
+    - lecture (dict): The lecture, with `fill_defaults` applied
+    - output_dir (str): Directory to write the note and transcripts to
+    - language (str, optional): The language of the audio. Default is English ("en").
+    - cleaning_mode (str, optional): "local" or "llm", see `run_pipeline`
+    - idle_timeout (float, optional): Seconds without growth after which the recording is treated as finished
+
+    Returns:
+    dict: The state entry of the lecture, with its outputs, audio seconds and the seconds from the end of the recording to the note
+    """
+    transcriber = LiveTranscriber(path=lecture["audio"], language=language, cleaning_mode=cleaning_mode)
+
+    def show_progress():
+        print(f"{lecture['name']}: transcribed {transcriber.audio_seconds / 60:.1f} min "
+              f"({len(transcriber.partial_notes)} partial notes)", flush=True)
+
+    result = transcriber.run(idle_timeout=idle_timeout, on_update=show_progress)
+    written = _write_up(lecture, output_dir, result["transcription"], result["clean_transcription"], result["partial_notes"])
+
+    return {
+        "status": "done",
+        **written,
+        "audio_seconds": transcriber.audio_seconds,
+        "seconds": time.perf_counter() - transcriber.ended_at,
+    }
+
+def _process_tagged(lecture, output_dir, **options):
+    with job_context(lecture["name"]):  # Tags the lecture's timings in the metrics log with its name
+        return process_lecture(lecture, output_dir, **options)
+
+def run_batch(lectures, output_dir, state, workers=BATCH_MAX_WORKERS, **options):
+    """
+    Processes the lectures not already done, `workers` at a time, recording each outcome in `state`.
+
+    Args:
+    - lectures (List[dict]): The lectures, from `load_lectures`
+    - output_dir (str): Directory to write notes and transcripts to
+    - state (BatchState): The state of the batch
+    - workers (int, optional): Maximum number of recordings processed at the same time
+    - options: Passed to `process_lecture`
+
+    Returns:
+    dict: Counts of processed, skipped and failed lectures, and the audio and wall-clock time of this run
+    """
+    pending = [lecture for lecture in lectures if not state.is_done(lecture)]
+    summary = {"processed": 0, "skipped": len(lectures) - len(pending), "failed": 0, "audio_seconds": 0.0}
+    print(f"{len(pending)} of {len(lectures)} lectures to process ({summary['skipped']} already done)", flush=True)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_process_tagged, lecture, output_dir, **options): lecture for lecture in pending}
+        for completed, future in enumerate(as_completed(futures), start=1):
+            lecture = futures[future]
+            try:
+                entry = future.result()
+            except Exception as error:
+                entry = {"status": "failed", "error": f"{type(error).__name__}: {error}", "outputs": {}}
+                summary["failed"] += 1
+                print(f"[{completed}/{len(pending)}] failed {lecture['name']}: {entry['error']}", flush=True)
+            else:
+                summary["processed"] += 1
+                summary["audio_seconds"] += entry["audio_seconds"]
+                print(f"[{completed}/{len(pending)}] done {lecture['name']} "
+                      f"({entry['audio_seconds'] / 60:.1f} min of audio in {entry['seconds'] / 60:.1f} min)", flush=True)
+            state.record(lecture, entry)
+
+    summary["wall_seconds"] = time.perf_counter() - start
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory of recordings, or a CSV or JSON manifest (a single recording with --follow)")
+    parser.add_argument("--output", default="notes", help="Directory to write notes and transcripts to")
+    parser.add_argument("--state", help="Resumable state file (default: batch_state.json in the output directory)")
+    parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS, help="Recordings processed at the same time")
+    parser.add_argument("--language", default="en", help="Language of the recordings")
+    parser.add_argument("--trim-silence", action="store_true", help="Shorten long silences before transcribing (not with --follow)")
+    parser.add_argument("--cleaning-mode", choices=("local", "llm"), default=CLEANING_MODE)
+    parser.add_argument("--headings", default="", help="Comma-separated headings for every note")
+    parser.add_argument("--course", default="", help="Course name for every lecture")
+    parser.add_argument("--lecturer", default="", help="Lecturer name for every lecture")
+    parser.add_argument("--additional-notes", default="", help="Additional notes for every lecture")
+    parser.add_argument("--title", default="", help="Title of the lecture (with --follow)")
+    parser.add_argument("--follow", action="store_true", help="Transcribe a recording while it is still being written")
+    parser.add_argument("--idle-timeout", type=float, default=LIVE_IDLE_TIMEOUT,
+                        help="With --follow, seconds without growth after which the recording is treated as finished")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Port of the Prometheus-style /metrics endpoint")
+    parser.add_argument("--metrics-host", default=METRICS_HOST, help="Address the /metrics endpoint listens on")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    start_metrics_server(args.metrics_port, args.metrics_host)
+
+    os.makedirs(args.output, exist_ok=True)
+    defaults = {
+        "headings": args.headings,
+        "course": args.course,
+        "lecturer": args.lecturer,
+        "additional_notes": args.additional_notes,
+    }
+    state = BatchState(args.state or os.path.join(args.output, "batch_state.json"))
+
+    if args.follow:
+        lecture = fill_defaults({
+            "audio": os.path.abspath(args.source),
+            "name": os.path.splitext(os.path.basename(args.source))[0],
+            "title": args.title,
+        }, defaults)
+        with job_context(lecture["name"]):
+            entry = follow_lecture(lecture, args.output, language=args.language, cleaning_mode=args.cleaning_mode,
+                                   idle_timeout=args.idle_timeout)
+        state.record(lecture, entry)
+        print(json.dumps(entry, indent=2) if args.json else
+              f"done {lecture['name']} ({entry['audio_seconds'] / 60:.1f} min of audio, "
+              f"note written {entry['seconds']:.1f} s after the recording ended)")
+        return
+
+    lectures = load_lectures(args.source, defaults)
+
+    summary = run_batch(
+        lectures,
+        args.output,
+        state,
+        workers=args.workers,
+        language=args.language,
+        trim_silence=args.trim_silence,
+        cleaning_mode=args.cleaning_mode
+    )
+    audio_hours = summary["audio_seconds"] / 3600
+    wall_hours = summary["wall_seconds"] / 3600
+    summary["audio_hours_per_wall_hour"] = round(audio_hours / wall_hours, 2) if wall_hours else 0.0
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"processed={summary['processed']}, skipped={summary['skipped']}, failed={summary['failed']}, "
+              f"audio_hours={audio_hours:.2f}, wall_hours={wall_hours:.2f}, "
+              f"audio_hours_per_wall_hour={summary['audio_hours_per_wall_hour']}")
+
+    sys.exit(1 if summary["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
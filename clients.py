@@ -0,0 +1,208 @@
+"""
+clients.py
+
+This file contains the shared Azure OpenAI client, with its connection pool, retry policy and rate limiters.
+
+`openai` and `httpx` are imported, and the client built, on the first API call rather than at import,
+so the app renders without waiting for them.
+"""
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+from metrics import add_to_span
+from config import (
+    API_VERSION,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_TIMEOUT,
+    API_MAX_RETRIES,
+    API_RETRY_BACKOFF,
+    API_MAX_RETRY_DELAY,
+    CHAT_REQUESTS_PER_MINUTE,
+    CHAT_TOKENS_PER_MINUTE,
+    WHISPER_REQUESTS_PER_MINUTE
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+def _read_credentials():
+    """
+    Reads the API key and endpoint from Streamlit secrets, falling back to environment variables.
+
+    Returns:
+    Tuple[str, str]: The API key and endpoint
+    """
+    import streamlit as st
+
+    try:
+        return st.secrets["OAI_API_KEY"], st.secrets["OAI_API_ENDPOINT"]
+    except (KeyError, FileNotFoundError):
+        return os.getenv("OAI_API_KEY"), os.getenv("OAI_API_ENDPOINT")
+
+def get_client():
+    """
+    Returns the Azure OpenAI client shared by every session, creating it on first use.
+
+    There is one connection pool for the whole process. Retries are handled by `call_with_retry` so they go through the limiters.
+
+    Returns:
+    AzureOpenAI: The client
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from openai import AzureOpenAI
+
+                api_key, endpoint = _read_credentials()
+                _client = AzureOpenAI(
+                    api_key=api_key,
+                    api_version=API_VERSION,
+                    azure_endpoint=endpoint,
+                    max_retries=0,
+                    http_client=httpx.Client(
+                        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+                        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10.0)
+                    )
+                )
+    return _client
+
+def retryable_errors():
+    """
+    Returns the errors worth sending the same request again for.
+    """
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+    return (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that refills at `per_minute` units a minute, up to one minute's worth.
+
+    `acquire` blocks until enough units are available, so every thread drawing from the same bucket
+    together stays under the per-minute quota.
+    """
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self._available = per_minute
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        """
+        Takes `amount` units from the bucket, waiting until they are available.
+
+        Args:
+        - amount (float, optional): The number of units to take. Requests larger than the bucket are capped to its size.
+        """
+        amount = min(amount, self.capacity)
+        with self._condition:
+            self._refill()
+            while self._available < amount:
+                self._condition.wait((amount - self._available) / self.rate)
+                self._refill()
+            self._available -= amount
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits for one deployment, shared by every session in the process.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens=0):
+        """
+        Waits until one more request, using about `tokens` tokens, fits under the limits.
+
+        Args:
+        - tokens (int, optional): Estimated tokens used by the request
+        """
+        self.requests.acquire()
+        if self.tokens is not None and tokens:
+            self.tokens.acquire(tokens)
+
+def retry_after(error):
+    """
+    Reads how long the server asked us to wait from a `retry-after-ms` or `retry-after` header.
+
+    Args:
+    - error (Exception): The error raised by the client
+
+    Returns:
+    float or None: Seconds to wait, or None if the server did not say
+    """
+    from openai import APIStatusError
+
+    if not isinstance(error, APIStatusError):
+        return None
+    headers = error.response.headers
+
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def call_with_retry(fn, *args, limiter=None, tokens=0, max_retries=API_MAX_RETRIES, on_retry=None, **kwargs):
+    """
+    Calls the API through the rate limiter, retrying throttling, timeouts, connection and server errors.
+
+    Retries wait for the server's `Retry-After` if given, and otherwise back off exponentially with jitter.
+
+    Args:
+    - fn (callable): The client method (or function making the request) to call
+    - args: Positional arguments for `fn`
+    - limiter (RateLimiter, optional): The limiter of the deployment being called
+    - tokens (int, optional): Estimated tokens used by the request, drawn from the limiter's token bucket
+    - max_retries (int, optional): Number of retries after the first attempt
+    - on_retry (callable, optional): Called as `on_retry(attempt, delay, error)` before each retry
+    - kwargs: Keyword arguments for `fn`
+
+    Returns:
+    The return value of `fn`
+    """
+    errors = retryable_errors()
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            return fn(*args, **kwargs)
+        except errors as error:
+            if attempt >= max_retries:
+                raise
+            delay = retry_after(error)
+            if delay is None:
+                delay = API_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5)
+            delay = min(delay, API_MAX_RETRY_DELAY)
+            add_to_span(retries=1)
+            if on_retry is not None:
+                on_retry(attempt + 1, delay, error)
+            time.sleep(delay)
+            attempt += 1
+
+chat_limiter = RateLimiter(CHAT_REQUESTS_PER_MINUTE, CHAT_TOKENS_PER_MINUTE)
+whisper_limiter = RateLimiter(WHISPER_REQUESTS_PER_MINUTE)
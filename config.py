@@ -2,8 +2,9 @@
 config.py
 
 This file contains configuration constants for the application, including API version, model details,
-temperature setting for text generation, and a seed value for reproducibility.
+temperature setting for text generation, a seed value for reproducibility, and transcription settings.
 """
+import os
 
 API_VERSION = "2024-08-01-preview"
 
@@ -12,3 +13,149 @@ MODEL = "gpt-4o-2024-08-06"
 TEMPERATURE = 0.8
 
 SEED = 0
+
+WHISPER_MODEL = "whisper-1"
+
+# How structured lecture notes are turned into markdown: "local" renders the fields directly,
+# "llm" sends them to the model for formatting (slower, and costs a second call)
+MARKDOWN_RENDERER = "local"
+
+# Stream structured lecture notes and show each section as soon as it is complete
+STREAM_STRUCTURED_OUTPUT = True
+
+# Streamed text is pushed to the UI at most this many times per second, or sooner once this many new characters are waiting
+STREAM_MAX_FPS = 10
+STREAM_FLUSH_CHARS = 2000
+
+# Number of audio segments sent to Whisper at the same time
+TRANSCRIBE_MAX_WORKERS = 4
+
+# Bitrate (kbps) that audio segments are encoded at before being sent to Whisper
+SEGMENT_BITRATE_KBPS = 128
+
+# Longest segment (seconds) split_audio will produce, even if a longer one would fit under the size limit.
+# Shorter segments are transcribed in parallel, and overlap stitching keeps the extra boundaries clean
+MAX_SEGMENT_DURATION = 60 * 10
+
+# Fraction of the size limit a segment is planned to fill, leaving room for container overhead
+SEGMENT_SIZE_HEADROOM = 0.95
+
+# Audio is downmixed to mono and resampled to this rate (Hz) before being sent to Whisper
+PREPROCESS_SAMPLE_RATE = 16000
+
+# Bitrate (kbps) of the preprocessed MP3, which is plenty for 16 kHz mono speech
+PREPROCESS_BITRATE_KBPS = 32
+
+# Silences quieter than this (dB) and longer than SILENCE_MIN_DURATION seconds are trimmed, keeping SILENCE_KEEP seconds of each
+SILENCE_THRESHOLD_DB = -40
+SILENCE_MIN_DURATION = 2.0
+SILENCE_KEEP = 0.5
+
+# Segment boundaries are moved to the quietest point within this many seconds of the planned boundary
+BOUNDARY_SEARCH_WINDOW = 15.0
+
+# Length (seconds) of the frames whose RMS energy is compared when looking for a quiet point
+RMS_FRAME_DURATION = 0.05
+
+# Seconds of audio repeated at the start of the next segment, so no word is lost at a boundary
+SEGMENT_OVERLAP = 2.0
+
+# Most words that can be repeated across a boundary and removed when transcripts are stitched
+OVERLAP_MAX_WORDS = 20
+
+# Words at the start of a segment searched for the end of the previous one when the overlap was transcribed
+# differently. SEGMENT_OVERLAP holds about 5 words of speech, so a match further in is a repeated phrase, not the overlap
+OVERLAP_ANCHOR_WORDS = 6
+
+# Directory for on-disk caches
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# Transcriptions are kept until the cache grows past this size, then the least recently used ones are removed
+TRANSCRIPTION_CACHE_MAX_MB = 200
+
+# Reuse chat responses for identical requests (opt-in, because it skips sampling a new response)
+RESPONSE_CACHE_ENABLED = False
+
+# Chat responses are kept in memory for this many seconds, up to this many entries
+RESPONSE_CACHE_TTL = 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 256
+
+# Transcripts longer than this (estimated tokens) are split into parts, summarised concurrently and merged
+MAP_REDUCE_THRESHOLD_TOKENS = 24000
+
+# Size (estimated tokens) of each transcript part, and how many parts are summarised at the same time
+MAP_CHUNK_TOKENS = 8000
+MAP_REDUCE_MAX_WORKERS = 4
+
+# How transcripts are cleaned: "local" removes fillers and repetition with rules, "llm" asks the model (slower, costs a call per part)
+CLEANING_MODE = "local"
+
+# Longest run of words that the local cleaner collapses when it is immediately repeated
+CLEAN_MAX_NGRAM = 6
+
+# Number of transcript parts cleaned at the same time while transcription is still running
+CLEAN_MAX_WORKERS = 4
+
+# Size (estimated tokens) of the parts a cached transcript is split into for cleaning
+CLEAN_CHUNK_TOKENS = 2000
+
+# Connections kept open to the API, shared by every session in the process, and the read timeout (seconds)
+HTTP_MAX_CONNECTIONS = 20
+HTTP_TIMEOUT = 600.0
+
+# Throttled, timed out and failed API requests are retried with exponential backoff, or after the server's Retry-After
+API_MAX_RETRIES = 5
+API_RETRY_BACKOFF = 1.0
+API_MAX_RETRY_DELAY = 60.0
+
+# Quota of the deployments, shared by every session in the process. Set these to match your Azure deployments
+CHAT_REQUESTS_PER_MINUTE = 300
+CHAT_TOKENS_PER_MINUTE = 50000
+WHISPER_REQUESTS_PER_MINUTE = 50
+
+# Completion tokens counted against the tokens-per-minute quota for each chat request, on top of the prompt
+COMPLETION_TOKENS_ESTIMATE = 1000
+
+# Transcription and lecture note jobs run in a background pool shared by every session, so they survive reruns
+JOB_MAX_WORKERS = 4
+
+# Seconds between checks on a running job in the app, and seconds a finished job is kept before it is forgotten
+JOB_POLL_INTERVAL = 1.0
+JOB_TTL = 3600
+
+# Number of recordings the batch CLI processes at the same time (each also transcribes its segments concurrently)
+BATCH_MAX_WORKERS = 2
+
+# Per-stage timings, bytes, tokens and retries are appended to this JSON lines file (None to disable)
+METRICS_LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "metrics.jsonl")
+
+# Port of the Prometheus-style /metrics endpoint, started with the app or the batch CLI (None to disable)
+METRICS_PORT = 9464
+
+# Address the /metrics endpoint listens on. Only this machine can read it by default; use "0.0.0.0" to let a
+# Prometheus server elsewhere scrape it
+METRICS_HOST = "127.0.0.1"
+
+# Number of recent jobs whose individual timings are kept in memory, for the timing panel
+METRICS_MAX_JOBS = 100
+
+# Show a panel with the per-stage timings of this session's jobs in the app
+SHOW_TIMING_PANEL = False
+
+# Keep the partial notes of long transcripts in the response cache, so regenerating with other headings or notes only re-runs the merge
+MAP_SUMMARY_CACHE_ENABLED = True
+
+# Live sessions transcribe the recording in windows of about this many seconds as it arrives
+LIVE_WINDOW_SECONDS = 60
+
+# Seconds between checks for new audio in a live session
+LIVE_POLL_INTERVAL = 5.0
+
+# A live recording that has not grown for this many seconds is treated as finished, so an abandoned session does not hold a job worker
+LIVE_IDLE_TIMEOUT = 600.0
+
+# SQLite database of every transcript and lecture note produced, searchable from the app
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "library.db")
+
+# Number of lectures listed in the library search results
+LIBRARY_SEARCH_LIMIT = 20
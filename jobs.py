@@ -0,0 +1,287 @@
+"""
+jobs.py
+
+This file contains the background job runner, which runs transcriptions and lecture note generation outside the Streamlit
+script so they survive reruns, and keeps each job's progress and results for the app to poll.
+"""
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from cache import hash_audio
+from library import get_library
+from metrics import job_context
+from config import (
+    JOB_MAX_WORKERS,
+    JOB_TTL,
+    LIVE_IDLE_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Job:
+    """
+    A background job and what it has reported so far.
+
+    `status` is one of "pending", "running", "done" or "failed". The job also stands in for `st.empty()`:
+    whatever is passed to `info` is kept as its `preview`, for the app to show on its next poll.
+    """
+    kind: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "pending"
+    progress: float = 0.0
+    message: str = ""
+    preview: str = ""
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def update(self, progress=None, message=None):
+        """
+        Records the progress of the job.
+
+        Args:
+        - progress (float, optional): Fraction of the job done, between 0 and 1
+        - message (str, optional): A short description of what the job is doing
+        """
+        if progress is not None:
+            self.progress = progress
+        if message is not None:
+            self.message = message
+
+    def info(self, text):
+        self.preview = text
+
+class JobRunner:
+    """
+    A thread pool for background jobs, with a store of the jobs submitted to it.
+
+    One runner is shared by every session (see `get_job_runner`), so it bounds the number of jobs running at once
+    across all uploads. Jobs that last as long as a lecture are started with `submit_dedicated` instead, on a thread of
+    their own, so they do not hold a worker the other jobs are waiting for. Finished jobs are forgotten `ttl` seconds
+    after they end.
+    """
+    def __init__(self, max_workers=JOB_MAX_WORKERS, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """
+        Queues a job.
+
+        Args:
+        - kind (str): What the job does, e.g., "transcription"
+        - fn (callable): Called as `fn(job, *args, **kwargs)` in a worker thread. Its return value becomes `job.result`
+        - args, kwargs: Arguments for `fn`
+
+        Returns:
+        str: The job ID
+        """
+        job = self._add(kind)
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def submit_dedicated(self, kind, fn, *args, **kwargs):
+        """
+        Starts a job on a daemon thread of its own, outside the pool, for jobs that run until the user ends them.
+
+        Args:
+        - kind (str): What the job does, e.g., "live_transcription"
+        - fn (callable): Called as `fn(job, *args, **kwargs)` in the new thread. Its return value becomes `job.result`
+        - args, kwargs: Arguments for `fn`
+
+        Returns:
+        str: The job ID
+        """
+        job = self._add(kind)
+        threading.Thread(target=self._run, args=(job, fn, args, kwargs), name=f"job-{kind}", daemon=True).start()
+        return job.id
+
+    def get(self, job_id):
+        """
+        Looks up a job.
+
+        Args:
+        - job_id (str): The job ID returned by `submit`
+
+        Returns:
+        Job or None: The job, or None if it is unknown or has expired
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _add(self, kind):
+        job = Job(kind)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        return job
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and now - job.finished_at > self.ttl]:
+            del self._jobs[job_id]
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        try:
+            with job_context(job.id):  # Tags the job's timings with its ID
+                job.result = fn(job, *args, **kwargs)
+            job.status = "done"
+        except Exception as error:
+            logger.exception("%s job %s failed", job.kind, job.id)
+            job.error = str(error)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+@st.cache_resource
+def get_job_runner():
+    """
+    Returns the job runner shared by every session and rerun of the app.
+    """
+    return JobRunner()
+
+def _save_to_library(method, *args, **kwargs):
+    """
+    Calls a saving method of the lecture library, logging instead of failing the job if the database cannot be written.
+
+    Returns:
+    int or None: The lecture ID, or None if it could not be saved
+    """
+    try:
+        return getattr(get_library(), method)(*args, **kwargs)
+    except sqlite3.Error:
+        logger.exception("Could not save to the lecture library")
+        return None
+
+def transcription_job(job, audio_file, language="en", trim_silence=False, owner=None):
+    """
+    Transcribes and cleans a recording, reporting progress and the cleaned parts to the job.
+
+    Args:
+    - job (Job): The job running this function
+    - audio_file (str or file-like object): Path to the audio file or a file-like object (e.g., BytesIO).
+      Uploads should be copied first, as the upload belongs to the session
+    - language (str, optional): The language of the audio. Default is English ("en").
+    - trim_silence (bool, optional): Shorten long silences before transcribing. Default is False.
+    - owner (str, optional): Who the lecture is saved for in the library, see `LectureLibrary.save_transcript`
+
+    Returns:
+    dict: The "transcription", "clean_transcription", "preprocess_stats" (None on a cache hit)
+    and "lecture_id" in the lecture library
+    """
+    from pipeline import run_pipeline  # Imported on first use, so the app renders without the audio and API stack
+
+    result = {"preprocess_stats": None}
+    clean_parts = []
+
+    for event in run_pipeline(audio_file, language=language, trim_silence=trim_silence):
+        if event.stage == "preprocessed":
+            result["preprocess_stats"] = event.data
+
+        elif event.stage == "transcribed":
+            if event.total is None:  # Still splitting the audio, so the segment count is not known yet
+                job.update(message=f"Transcribed part {event.index + 1}")
+            else:
+                job.update((event.index + 1) / event.total, f"Transcribed part {event.index + 1} of {event.total}")
+
+        elif event.stage == "cleaned":
+            clean_parts.append(event.data)
+            job.info("\n\n".join(clean_parts))  # Cleaned parts arrive in order
+
+        elif event.stage == "done":
+            result["transcription"], result["clean_transcription"] = event.data
+
+    # Saved straight away, so the transcript is kept whatever happens to the session
+    name = audio_file if isinstance(audio_file, str) else getattr(audio_file, "name", "")
+    result["lecture_id"] = _save_to_library(
+        "save_transcript",
+        result["transcription"],
+        result["clean_transcription"],
+        source=os.path.basename(name),
+        audio_hash=hash_audio(audio_file),
+        title=os.path.splitext(os.path.basename(name))[0],
+        owner=owner
+    )
+    return result
+
+def live_transcription_job(job, transcriber):
+    """
+    Transcribes a lecture while it is recorded, until the session is ended, showing the transcript so far in the job's preview.
+
+    The job runs for the whole lecture, so it should be started with `JobRunner.submit_dedicated`. It ends by itself once
+    no audio has arrived for LIVE_IDLE_TIMEOUT seconds. A lecture without any transcript is not saved to the library.
+
+    Args:
+    - job (Job): The job running this function
+    - transcriber (LiveTranscriber): The live session, which the app keeps adding chunks to
+
+    Returns:
+    dict: The "transcription", "clean_transcription" and "partial_notes" of the lecture, and its "lecture_id" in the
+    lecture library (None if nothing was transcribed)
+    """
+    def show_progress():
+        job.update(message=(
+            f"Transcribed {transcriber.audio_seconds / 60:.1f} minutes of the lecture"
+            f" ({len(transcriber.partial_notes)} partial notes so far)"
+        ))
+        job.info(transcriber.clean_transcript)
+
+    result = transcriber.run(idle_timeout=LIVE_IDLE_TIMEOUT, on_update=show_progress)
+    result["lecture_id"] = None
+    if result["transcription"]:
+        result["lecture_id"] = _save_to_library(
+            "save_transcript", result["transcription"], result["clean_transcription"], source="live"
+        )
+    return result
+
+def lecture_note_job(job, transcript, raw_notes, additional_notes, headings_string="", partial_notes=None,
+                     lecture_id=None, details=None):
+    """
+    Generates a lecture note, showing it in the job's preview as it is written, and saves it to the lecture library.
+
+    Args:
+    - job (Job): The job running this function
+    - transcript, raw_notes, additional_notes, headings_string, partial_notes: See `notes.generate_lecture_note`
+    - lecture_id (int, optional): The lecture of the transcript in the library. A new lecture is saved if None
+    - details (dict, optional): The lecture details to save with the note, see `library.LECTURE_DETAILS`
+
+    Returns:
+    dict: The "lecture_note" markdown and the "lecture_id" it was saved under
+    """
+    from notes import generate_lecture_note
+
+    def show_progress(completed, total):
+        job.update(completed / total, f"Long lecture: summarised part {completed} of {total}, merging once all parts are done...")
+        job.info(job.message)
+
+    lecture_note, lecture_note_md = generate_lecture_note(
+        transcript=transcript,
+        raw_notes=raw_notes,
+        additional_notes=additional_notes,
+        headings_string=headings_string,
+        box=job,
+        on_progress=show_progress,
+        partial_notes=partial_notes
+    )
+    lecture_id = _save_to_library(
+        "save_note", lecture_note_md, lecture_note, details={**(details or {}), "headings": headings_string}, lecture_id=lecture_id
+    )
+    return {"lecture_note": lecture_note_md, "lecture_id": lecture_id}
@@ -0,0 +1,259 @@
+"""
+library.py
+
+This file contains the lecture library: a local SQLite database of the transcripts and lecture notes the application
+has produced, with a full-text index so past lectures can be searched and reopened without any API calls.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+
+from config import (
+    LIBRARY_PATH,
+    LIBRARY_SEARCH_LIMIT
+)
+
+# Details of a lecture given by the user, stored with its transcript and note
+LECTURE_DETAILS = ("title", "date", "lecturer", "course", "outline", "takeaways", "additional_notes", "headings")
+
+# Columns of the full-text index, with their weight in the ranking
+INDEXED_COLUMNS = {
+    "title": 10.0,
+    "course": 5.0,
+    "lecturer": 5.0,
+    "lecture_note_md": 2.0,
+    "clean_transcription": 1.0,
+}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS lectures (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    audio_hash TEXT,
+    owner TEXT,
+    {", ".join(f"{column} TEXT NOT NULL DEFAULT ''" for column in LECTURE_DETAILS)},
+    transcription TEXT,
+    clean_transcription TEXT,
+    lecture_note_md TEXT,
+    lecture_note_json TEXT
+);
+CREATE INDEX IF NOT EXISTS lectures_updated_at ON lectures (updated_at);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS lectures_fts USING fts5(
+    {", ".join(INDEXED_COLUMNS)}, content='lectures', content_rowid='id', tokenize='porter unicode61'
+);
+
+-- Keep the index in step with the table
+CREATE TRIGGER IF NOT EXISTS lectures_insert AFTER INSERT ON lectures BEGIN
+    INSERT INTO lectures_fts (rowid, {", ".join(INDEXED_COLUMNS)})
+    VALUES (new.id, {", ".join(f"new.{column}" for column in INDEXED_COLUMNS)});
+END;
+CREATE TRIGGER IF NOT EXISTS lectures_delete AFTER DELETE ON lectures BEGIN
+    INSERT INTO lectures_fts (lectures_fts, rowid, {", ".join(INDEXED_COLUMNS)})
+    VALUES ('delete', old.id, {", ".join(f"old.{column}" for column in INDEXED_COLUMNS)});
+END;
+CREATE TRIGGER IF NOT EXISTS lectures_update AFTER UPDATE OF {", ".join(INDEXED_COLUMNS)} ON lectures BEGIN
+    INSERT INTO lectures_fts (lectures_fts, rowid, {", ".join(INDEXED_COLUMNS)})
+    VALUES ('delete', old.id, {", ".join(f"old.{column}" for column in INDEXED_COLUMNS)});
+    INSERT INTO lectures_fts (rowid, {", ".join(INDEXED_COLUMNS)})
+    VALUES (new.id, {", ".join(f"new.{column}" for column in INDEXED_COLUMNS)});
+END;
+"""
+
+# Columns listed in search results; the transcripts and note are only read when a lecture is opened
+_SUMMARY_COLUMNS = ("id", "created_at", "updated_at", "source", "title", "date", "lecturer", "course")
+
+def _match_query(query):
+    """
+    Turns the words of a search into an FTS5 query that matches lectures containing all of them.
+
+    Quoting every word keeps punctuation typed by the user from being read as FTS5 syntax. The index is stemmed, so
+    "learn" already finds "learning"; only the last word is matched as a prefix, for results as the user types, and
+    only from three letters, as a shorter prefix expands to so many terms that the search takes seconds.
+    """
+    words = [f'"{word}"' for word in re.findall(r"\w+", query)]
+    if words and len(words[-1]) >= 5:  # Three letters plus the quotes
+        words[-1] += "*"
+    return " ".join(words)
+
+class LectureLibrary:
+    """
+    The lectures stored in a SQLite database, one row per lecture with a full-text index over its title, course,
+    lecturer, note and cleaned transcript.
+
+    A lecture is saved once its transcript is ready, and its note is added (or replaced) each time one is generated.
+    The database is opened in WAL mode, so the app and the batch CLI can use it at the same time.
+
+    Transcribing the same recording again updates its lecture, but only for the same owner (an app session, or the
+    CLI), so one user saving a recording never overwrites the note another user made from it.
+    """
+    def __init__(self, path=LIBRARY_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(_SCHEMA)
+            # Libraries made before lectures had an owner
+            columns = {row["name"] for row in self._connection.execute("PRAGMA table_info(lectures)")}
+            if "owner" not in columns:
+                self._connection.execute("ALTER TABLE lectures ADD COLUMN owner TEXT")
+            self._connection.execute("DROP INDEX IF EXISTS lectures_audio_hash")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS lectures_audio_hash_owner ON lectures (audio_hash, owner)")
+            # Ranking with the index's own `rank` lets FTS5 sort the matches itself, which is several times faster
+            self._connection.execute(
+                "INSERT INTO lectures_fts (lectures_fts, rank) VALUES ('rank', ?)",
+                (f"bm25({', '.join(map(str, INDEXED_COLUMNS.values()))})",)
+            )
+
+    def save_transcript(self, transcription, clean_transcription, source="", audio_hash=None, title="", owner=None):
+        """
+        Saves the transcript of a lecture, so it is kept even before a note is generated from it.
+
+        Args:
+        - transcription (str): The raw transcript
+        - clean_transcription (str): The cleaned transcript
+        - source (str, optional): Where the audio came from, e.g., the uploaded file name
+        - audio_hash (str, optional): Hash of the audio bytes
+        - title (str, optional): The title of the lecture, until the user gives one
+        - owner (str, optional): Who is saving it. A lecture of the same owner with the same `audio_hash` is updated
+          instead of saved again. Without an owner, a new lecture is always saved
+
+        Returns:
+        int: The ID of the lecture
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            existing = None
+            if audio_hash is not None and owner is not None:
+                existing = self._connection.execute(
+                    "SELECT id FROM lectures WHERE audio_hash = ? AND owner = ? ORDER BY updated_at DESC LIMIT 1",
+                    (audio_hash, owner)
+                ).fetchone()
+
+            if existing is not None:
+                self._connection.execute(
+                    "UPDATE lectures SET updated_at = ?, transcription = ?, clean_transcription = ? WHERE id = ?",
+                    (now, transcription, clean_transcription, existing["id"])
+                )
+                return existing["id"]
+
+            cursor = self._connection.execute(
+                "INSERT INTO lectures (created_at, updated_at, source, audio_hash, owner, title, transcription, clean_transcription) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, now, source, audio_hash, owner, title, transcription, clean_transcription)
+            )
+            return cursor.lastrowid
+
+    def save_note(self, lecture_note_md, lecture_note=None, details=None, lecture_id=None):
+        """
+        Saves a generated lecture note with the details it was generated from.
+
+        Args:
+        - lecture_note_md (str): The lecture note markdown
+        - lecture_note (BaseModel, optional): The structured lecture note, a `LectureNote` or a model built from the headings
+        - details (dict, optional): Values of the `LECTURE_DETAILS`. Empty values keep what the lecture already has
+        - lecture_id (int, optional): The lecture the note belongs to. A new lecture is saved if None
+
+        Returns:
+        int: The ID of the lecture
+        """
+        values = {key: value for key, value in (details or {}).items() if key in LECTURE_DETAILS and value}
+        values["lecture_note_md"] = lecture_note_md
+        values["lecture_note_json"] = lecture_note.model_dump_json() if lecture_note is not None else None
+        values["updated_at"] = time.time()
+
+        with self._lock, self._connection:
+            if lecture_id is not None:
+                cursor = self._connection.execute(
+                    f"UPDATE lectures SET {', '.join(f'{column} = ?' for column in values)} WHERE id = ?",
+                    (*values.values(), lecture_id)
+                )
+                if cursor.rowcount:
+                    return lecture_id
+
+            values["created_at"] = values["updated_at"]
+            cursor = self._connection.execute(
+                f"INSERT INTO lectures ({', '.join(values)}) VALUES ({', '.join('?' for _ in values)})",
+                tuple(values.values())
+            )
+            return cursor.lastrowid
+
+    def get(self, lecture_id):
+        """
+        Reads a lecture with its transcripts and note.
+
+        Args:
+        - lecture_id (int): The ID of the lecture
+
+        Returns:
+        dict or None: The lecture, with the structured note as a dict under "lecture_note", or None if it does not exist
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM lectures WHERE id = ?", (lecture_id,)).fetchone()
+        if row is None:
+            return None
+        lecture = dict(row)
+        lecture["lecture_note"] = json.loads(lecture["lecture_note_json"]) if lecture["lecture_note_json"] else None
+        return lecture
+
+    def search(self, query="", limit=LIBRARY_SEARCH_LIMIT):
+        """
+        Finds lectures by keyword, best matches first. Without keywords, the most recently updated lectures are listed.
+
+        Args:
+        - query (str, optional): The words to look for in the title, course, lecturer, note and transcript
+        - limit (int, optional): Maximum number of lectures returned
+
+        Returns:
+        List[dict]: The lectures' details, with a "snippet" of the best matching text when searching
+        """
+        match = _match_query(query)
+        with self._lock:
+            if not match:
+                rows = self._connection.execute(
+                    f"SELECT {', '.join(_SUMMARY_COLUMNS)}, '' AS snippet FROM lectures ORDER BY updated_at DESC LIMIT ?", (limit,)
+                ).fetchall()
+            else:
+                rows = self._connection.execute(
+                    f"SELECT {', '.join(f'lectures.{column}' for column in _SUMMARY_COLUMNS)}, "
+                    "snippet(lectures_fts, -1, '**', '**', ' ... ', 16) AS snippet "
+                    "FROM lectures_fts JOIN lectures ON lectures.id = lectures_fts.rowid "
+                    "WHERE lectures_fts MATCH ? ORDER BY rank LIMIT ?",
+                    (match, limit)
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, lecture_id):
+        """
+        Removes a lecture from the library.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM lectures WHERE id = ?", (lecture_id,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+_library = None
+_library_lock = threading.Lock()
+
+def get_library():
+    """
+    Returns the lecture library shared by every session and job, opening it on first use.
+    """
+    global _library
+    if _library is None:
+        with _library_lock:
+            if _library is None:
+                _library = LectureLibrary()
+    return _library
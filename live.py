@@ -0,0 +1,238 @@
+"""
+live.py
+
+This file contains live sessions, which transcribe a lecture while it is still being recorded, so the lecture note
+can be ready shortly after the lecture ends instead of after the whole recording has been uploaded and transcribed.
+"""
+import os
+import time
+import tempfile
+import threading
+import subprocess
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from api_call import estimate_tokens
+from notes import summarize_chunk
+from pipeline import get_clean_fn
+from render import render_lecture_note_md
+from metrics import (
+    track,
+    submit_in_context
+)
+from utils import (
+    append_audio,
+    get_audio_duration,
+    split_live_audio,
+    speech_to_text,
+    trim_overlap
+)
+from config import (
+    CLEANING_MODE,
+    LIVE_WINDOW_SECONDS,
+    LIVE_POLL_INTERVAL,
+    MAP_CHUNK_TOKENS,
+    MAP_REDUCE_THRESHOLD_TOKENS,
+    PREPROCESS_BITRATE_KBPS,
+    SEGMENT_BITRATE_KBPS,
+    TRANSCRIBE_MAX_WORKERS
+)
+
+class LiveTranscriber:
+    """
+    A lecture that is transcribed while it is being recorded.
+
+    Audio either arrives through `add_chunk`, as consecutive pieces of the recording (e.g., uploads every few minutes),
+    or is read from `path`, a recording that another program keeps writing to. A followed recording must be readable
+    while it is written, such as MP3 or WAV; an M4A file can only be read once it is complete.
+
+    Each window of about `window_seconds` is transcribed with `speech_to_text` as soon as it is complete, and the
+    transcript is kept in order with the overlap between windows removed. Whenever `note_chunk_tokens` of new transcript
+    have built up, they are summarised into a partial lecture note, so once the lecture ends only the last window,
+    the last partial note and the merge are left to do.
+
+    `run` does this until `end` is called, and can be run in a background job while the app or the CLI adds audio.
+    """
+    def __init__(self, path=None, language="en", clean=True, cleaning_mode=CLEANING_MODE,
+                 window_seconds=LIVE_WINDOW_SECONDS, note_chunk_tokens=MAP_CHUNK_TOKENS, max_workers=TRANSCRIBE_MAX_WORKERS):
+        self.follows_file = path is not None
+        if path is None:
+            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as spool:
+                path = spool.name
+        self.path = path
+        self.language = language
+        self.window_seconds = window_seconds
+        self.note_chunk_tokens = note_chunk_tokens
+        self.max_workers = max_workers
+
+        self.raw_parts = []
+        self.clean_parts = []
+        self.partial_notes = []
+        self.audio_seconds = 0.0  # Seconds of the recording transcribed so far
+        self.ended_at = None  # time.perf_counter() when the recording was marked as finished
+
+        self._clean_fn = get_clean_fn(clean, cleaning_mode)
+        self._previous = ""
+        self._unsummarised = []
+        self._ended = threading.Event()
+        self._spool_lock = threading.Lock()
+        self._size = 0
+        self._grown_at = time.monotonic()
+
+    @property
+    def transcript(self):
+        return " ".join(part for part in self.raw_parts if part)
+
+    @property
+    def clean_transcript(self):
+        return "\n\n".join(part for part in self.clean_parts if part)
+
+    @property
+    def rolling_note_md(self):
+        """
+        The partial lecture notes made so far, as markdown.
+        """
+        return "\n\n".join(render_lecture_note_md(partial_note) for partial_note in self.partial_notes)
+
+    @property
+    def ended(self):
+        return self._ended.is_set()
+
+    def add_chunk(self, audio_file):
+        """
+        Appends the next piece of the recording.
+
+        Args:
+        - audio_file (str or file-like object): The piece, in any format ffmpeg reads
+        """
+        if self.follows_file:
+            raise ValueError("This live session follows a recording file and does not take chunks")
+        if self.ended:
+            raise ValueError("This live session has ended")
+        with self._spool_lock:
+            append_audio(audio_file, self.path)
+
+    def end(self):
+        """
+        Marks the recording as finished, so `run` transcribes the rest of it and returns.
+        """
+        if not self.ended:
+            self.ended_at = time.perf_counter()
+        self._ended.set()
+
+    def close(self):
+        """
+        Deletes the spool file of the chunks added to the session.
+        """
+        if not self.follows_file and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _available_seconds(self, final):
+        if not os.path.exists(self.path):
+            return 0.0
+        with self._spool_lock:
+            size = os.path.getsize(self.path)
+            if size != self._size:
+                self._size, self._grown_at = size, time.monotonic()
+            if size == 0:
+                return 0.0
+            try:
+                return get_audio_duration(self.path)
+            except (subprocess.CalledProcessError, ValueError):
+                if final:
+                    raise
+                return 0.0  # A recording that has only just started may not have a readable header yet
+
+    def _add_part(self, text, end_time):
+        new_text = trim_overlap(self._previous, text) if self._previous else text.strip()
+        self._previous = text
+        self.raw_parts.append(new_text)
+        self.clean_parts.append(self._clean_fn(new_text))
+        self._unsummarised.append(new_text)
+        self.audio_seconds = end_time
+
+    def _summarize(self, final=False):
+        pending = " ".join(part for part in self._unsummarised if part)
+        if not pending or (not final and estimate_tokens(pending) < self.note_chunk_tokens):
+            return
+        self.partial_notes.append(summarize_chunk(pending, len(self.partial_notes) + 1))
+        self._unsummarised = []
+
+    def process_available(self, final=False, on_update=None):
+        """
+        Transcribes every window of the recording that is complete, then makes a partial note if enough new transcript has built up.
+
+        Args:
+        - final (bool, optional): The recording has ended, so the rest of it is transcribed too
+        - on_update (callable, optional): Called with no arguments each time new transcript parts are added
+
+        Returns:
+        int: The number of windows transcribed
+        """
+        segments = split_live_audio(
+            self.path,
+            self.audio_seconds,
+            self._available_seconds(final),
+            self.window_seconds,
+            final=final,
+            # Chunks are spooled in the preprocessed format, so their windows are cut without re-encoding
+            bitrate_kbps=SEGMENT_BITRATE_KBPS if self.follows_file else PREPROCESS_BITRATE_KBPS,
+            copy=not self.follows_file
+        )
+
+        transcribed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # A session that has fallen behind catches up `max_workers` windows at a time, so memory stays bounded
+            while True:
+                batch = list(islice(segments, self.max_workers))
+                if not batch:
+                    break
+                futures = [
+                    (submit_in_context(executor, speech_to_text, segment, self.language), end_time)
+                    for segment, end_time in batch
+                ]
+                for future, end_time in futures:
+                    self._add_part(future.result(), end_time)
+                transcribed += len(batch)
+                if on_update is not None:
+                    on_update()
+
+        if not final:
+            self._summarize()
+        return transcribed
+
+    def run(self, poll_interval=LIVE_POLL_INTERVAL, idle_timeout=None, on_update=None):
+        """
+        Transcribes the recording as it arrives until `end` is called or it stops growing, then finishes the transcript.
+
+        Args:
+        - poll_interval (float, optional): Seconds between checks for new audio
+        - idle_timeout (float, optional): Treat the recording as finished once it has not grown for this many seconds
+        - on_update (callable, optional): Called with no arguments each time new transcript parts or partial notes are added
+
+        Returns:
+        dict: The "transcription", "clean_transcription" and "partial_notes" of the lecture
+        """
+        try:
+            while not self.ended:
+                notes_before = len(self.partial_notes)
+                self.process_available(on_update=on_update)
+                if len(self.partial_notes) > notes_before and on_update is not None:
+                    on_update()
+                if idle_timeout is not None and time.monotonic() - self._grown_at > idle_timeout:
+                    self.end()
+                self._ended.wait(poll_interval)
+
+            with track("live_finish"):  # The time from the end of the lecture to a transcript ready for the merge
+                self.process_available(final=True, on_update=on_update)
+                # Only a long transcript is written up from partial notes, a shorter one goes to the model in one call
+                if estimate_tokens(self.transcript) > MAP_REDUCE_THRESHOLD_TOKENS:
+                    self._summarize(final=True)
+        finally:
+            self.close()
+
+        return {
+            "transcription": self.transcript,
+            "clean_transcription": self.clean_transcript,
+            "partial_notes": self.partial_notes,
+        }
@@ -0,0 +1,296 @@
+"""
+metrics.py
+
+This file contains the instrumentation layer: per-stage wall time, bytes, audio seconds, tokens, time to first token
+and retries, tagged with the job they belong to, exported as a JSON lines log and a Prometheus-style text endpoint.
+"""
+import os
+import json
+import time
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import (
+    METRICS_HOST,
+    METRICS_LOG_FILE,
+    METRICS_MAX_JOBS
+)
+
+logger = logging.getLogger(__name__)
+
+# The job (app job ID or batch lecture name) the current thread is working on
+current_job_id = contextvars.ContextVar("current_job_id", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Attributes summed into counters, with their Prometheus help text
+COUNTED_ATTRIBUTES = {
+    "bytes_sent": "Bytes of audio uploaded or encoded",
+    "audio_seconds": "Seconds of audio processed",
+    "prompt_tokens": "Prompt tokens sent to the model (estimated when the API does not report usage)",
+    "completion_tokens": "Completion tokens received from the model (estimated when the API does not report usage)",
+    "retries": "Requests retried after throttling or an error",
+    "cache_hits": "Calls answered from a cache",
+}
+
+class Span:
+    """
+    One timed call of a stage, with the values recorded while it ran.
+    """
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.job_id = current_job_id.get()
+        self.attributes = dict(attributes)
+        self.error = None
+        self.timestamp = time.time()
+        self.started_at = time.perf_counter()
+        self.seconds = None
+
+    def add(self, **values):
+        """
+        Adds to numeric attributes, e.g., `span.add(retries=1)`.
+        """
+        for name, value in values.items():
+            self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def mark_first_token(self):
+        """
+        Records the time to first token, if it has not been recorded yet.
+        """
+        self.attributes.setdefault("time_to_first_token", time.perf_counter() - self.started_at)
+
+    def to_dict(self):
+        return {
+            "timestamp": self.timestamp,
+            "job_id": self.job_id,
+            "stage": self.stage,
+            "seconds": self.seconds,
+            "error": self.error,
+            **self.attributes,
+        }
+
+class MetricsRegistry:
+    """
+    Collects finished spans: totals per stage for Prometheus, recent spans per job for the timing panel,
+    and one JSON line per span in `log_file`.
+    """
+    def __init__(self, log_file=METRICS_LOG_FILE, max_jobs=METRICS_MAX_JOBS):
+        self.log_file = log_file
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._totals = defaultdict(float)
+        self._jobs = OrderedDict()
+        if log_file is not None:
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+
+    def record(self, span):
+        entry = span.to_dict()
+        with self._lock:
+            self._totals[("calls_total", span.stage)] += 1
+            self._totals[("seconds_total", span.stage)] += span.seconds
+            if span.error is not None:
+                self._totals[("errors_total", span.stage)] += 1
+            for name in COUNTED_ATTRIBUTES:
+                if name in span.attributes:
+                    self._totals[(f"{name}_total", span.stage)] += span.attributes[name]
+            if "time_to_first_token" in span.attributes:
+                self._totals[("time_to_first_token_seconds_sum", span.stage)] += span.attributes["time_to_first_token"]
+                self._totals[("time_to_first_token_seconds_count", span.stage)] += 1
+
+            if span.job_id is not None:
+                self._jobs.setdefault(span.job_id, []).append(entry)
+                self._jobs.move_to_end(span.job_id)
+                while len(self._jobs) > self.max_jobs:
+                    self._jobs.popitem(last=False)
+
+            if self.log_file is not None:
+                try:
+                    with open(self.log_file, "a", encoding="utf-8") as file:
+                        file.write(json.dumps(entry) + "\n")
+                except OSError:
+                    logger.warning("Could not write metrics to %s", self.log_file, exc_info=True)
+
+    def job_spans(self, job_id):
+        """
+        Returns the recorded spans of a job, oldest first.
+        """
+        with self._lock:
+            return list(self._jobs.get(job_id, []))
+
+    def job_summary(self, job_id):
+        """
+        Sums a job's spans per stage.
+
+        Args:
+        - job_id (str): The job ID
+
+        Returns:
+        List[dict]: One row per stage, in the order the stages first ran
+        """
+        rows = {}
+        for entry in self.job_spans(job_id):
+            row = rows.setdefault(entry["stage"], {"stage": entry["stage"], "calls": 0, "seconds": 0.0})
+            row["calls"] += 1
+            row["seconds"] += entry["seconds"]
+            for name in COUNTED_ATTRIBUTES:
+                if name in entry:
+                    row[name] = row.get(name, 0) + entry[name]
+            if "time_to_first_token" in entry:
+                row["time_to_first_token"] = min(row.get("time_to_first_token", float("inf")), entry["time_to_first_token"])
+        return list(rows.values())
+
+    def prometheus_text(self):
+        """
+        Renders the totals in the Prometheus text exposition format.
+        """
+        help_texts = {
+            "calls_total": "Calls of each stage",
+            "seconds_total": "Wall time spent in each stage",
+            "errors_total": "Calls of each stage that raised an error",
+            **{f"{name}_total": text for name, text in COUNTED_ATTRIBUTES.items()},
+        }
+        with self._lock:
+            totals = dict(self._totals)
+
+        lines = []
+        for metric, help_text in help_texts.items():
+            lines.append(f"# HELP lecture_notes_{metric} {help_text}")
+            lines.append(f"# TYPE lecture_notes_{metric} counter")
+            for (name, stage), value in sorted(totals.items()):
+                if name == metric:
+                    lines.append(f'lecture_notes_{metric}{{stage="{stage}"}} {value}')
+
+        lines.append("# HELP lecture_notes_time_to_first_token_seconds Time from request to first streamed token")
+        lines.append("# TYPE lecture_notes_time_to_first_token_seconds summary")
+        for (name, stage), value in sorted(totals.items()):
+            if name.startswith("time_to_first_token_seconds_"):
+                lines.append(f'lecture_notes_{name}{{stage="{stage}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+@contextmanager
+def job_context(job_id):
+    """
+    Tags every span recorded inside the block (and in pools submitted to with `submit_in_context`) with `job_id`.
+    """
+    token = current_job_id.set(job_id)
+    try:
+        yield
+    finally:
+        current_job_id.reset(token)
+
+@contextmanager
+def track(stage, **attributes):
+    """
+    Times a block as one call of `stage` and records it when the block exits.
+
+    Args:
+    - stage (str): The stage name, e.g., "speech_to_text"
+    - attributes: Initial values, e.g., `bytes_sent=...`
+
+    Yields:
+    Span: The span, to add values to while the block runs
+    """
+    span = Span(stage, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as error:
+        span.error = type(error).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        span.seconds = time.perf_counter() - span.started_at
+        registry.record(span)
+
+def instrument(stage):
+    """
+    Decorator that tracks every call of a function as `stage`.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def current_span():
+    """
+    Returns the innermost span being tracked in this context, or None.
+    """
+    return _current_span.get()
+
+def set_stage(stage):
+    """
+    Renames the stage of the current span once it is known which kind of call it is, e.g., "get_response.parse".
+    """
+    span = current_span()
+    if span is not None:
+        span.stage = stage
+
+def add_to_span(**values):
+    """
+    Adds to numeric attributes of the current span, if there is one.
+    """
+    span = current_span()
+    if span is not None:
+        span.add(**values)
+
+def mark_first_token():
+    """
+    Records the time to first token on the current span, if there is one.
+    """
+    span = current_span()
+    if span is not None:
+        span.mark_first_token()
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """
+    Submits `fn` to a thread pool so it runs with the caller's job ID.
+
+    Thread pools do not carry context variables over to their workers, so each call runs in a copy of the caller's context.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = registry.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("content-type", "text/plain; version=0.0.4")
+        self.send_header("content-length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host=METRICS_HOST):
+    """
+    Serves the totals at http://<host>:<port>/metrics from a background thread.
+
+    Args:
+    - port (int or None): The port. Nothing is started if None
+    - host (str, optional): The address to listen on. Default is METRICS_HOST, which only this machine can reach
+
+    Returns:
+    ThreadingHTTPServer or None: The server, or None if it is disabled or the port is taken
+    """
+    if port is None:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError:
+        logger.warning("Metrics endpoint not started: %s:%s is not available", host, port)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,202 @@
+"""
+notes.py
+
+This file contains the lecture note generation flow, including map-reduce generation for long transcripts.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from api_call import (
+    LectureNote,
+    get_response,
+    create_dynamic_lecture_note,
+    estimate_tokens
+)
+from render import (
+    format_lecture_note,
+    partial_note_renderer
+)
+from utils import get_headings
+from metrics import submit_in_context
+from prompts import (
+    user_message_lecture_note_fn,
+    user_message_transcript_fn,
+    user_message_lecture_note_details_fn,
+    user_message_map_fn,
+    user_message_partial_notes_fn,
+    user_message_reduce_fn,
+    SYSTEM_PROMPT_get_lecture_note,
+    SYSTEM_PROMPT_map_lecture_note,
+    SYSTEM_PROMPT_reduce_lecture_note
+)
+from config import (
+    MAP_REDUCE_THRESHOLD_TOKENS,
+    MAP_CHUNK_TOKENS,
+    MAP_REDUCE_MAX_WORKERS,
+    MAP_SUMMARY_CACHE_ENABLED
+)
+
+def chunk_transcript(transcript, max_tokens=MAP_CHUNK_TOKENS):
+    """
+    Splits a transcript into parts of at most `max_tokens` estimated tokens, breaking between sentences.
+
+    Args:
+    - transcript (str): The transcript to split
+    - max_tokens (int, optional): The token budget of each part
+
+    Returns:
+    List[str]: The parts, in transcript order
+    """
+    sentences = re.split(r"(?<=[.!?])\s+", transcript.strip())
+    chunks, current, current_tokens = [], [], 0
+
+    for sentence in sentences:
+        sentence_tokens = estimate_tokens(sentence) + 1
+        if current and current_tokens + sentence_tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current, current_tokens = [], 0
+
+        # A sentence longer than the whole budget (e.g., an unpunctuated transcript) is split between words
+        if sentence_tokens > max_tokens:
+            words = sentence.split()
+            words_per_chunk = max(1, len(words) * max_tokens // sentence_tokens)
+            for start in range(0, len(words), words_per_chunk):
+                chunks.append(" ".join(words[start:start + words_per_chunk]))
+            continue
+
+        current.append(sentence)
+        current_tokens += sentence_tokens
+
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def summarize_chunk(chunk, part_number, part_count=None, structured_output=LectureNote,
+                    use_cache=MAP_SUMMARY_CACHE_ENABLED):
+    """
+    Summarises one transcript part into a partial lecture note.
+
+    Args:
+    - chunk (str): The transcript part
+    - part_number (int): The position of this part, starting from 1
+    - part_count (int, optional): The total number of parts, or None while the lecture is still being recorded
+    - structured_output (BaseModel, optional): The partial lecture note model
+    - use_cache (bool, optional): Reuse the partial note of a part summarised before
+
+    Returns:
+    BaseModel: The partial lecture note
+    """
+    return get_response(
+        SYSTEM_PROMPT=SYSTEM_PROMPT_map_lecture_note,
+        USER_MESSAGE=user_message_map_fn(chunk, part_number, part_count),
+        structured_output=structured_output,
+        use_cache=use_cache
+    )
+
+def summarize_chunks(chunks, structured_output=LectureNote, max_workers=MAP_REDUCE_MAX_WORKERS, on_progress=None,
+                     use_cache=MAP_SUMMARY_CACHE_ENABLED):
+    """
+    Map stage: summarises transcript parts concurrently into partial lecture notes.
+
+    Partial notes always use the default `LectureNote` structure, whatever headings the final note has, and are cached
+    by the content of each part. Regenerating with other headings or notes then only runs the merge.
+
+    Args:
+    - chunks (List[str]): The transcript parts, in order
+    - structured_output (BaseModel, optional): The partial lecture note model
+    - max_workers (int, optional): Maximum number of parts summarised at the same time
+    - on_progress (callable, optional): Called as `on_progress(completed, total)` in the calling thread each time a part is done
+    - use_cache (bool, optional): Reuse the partial note of a part summarised before
+
+    Returns:
+    List[BaseModel]: The partial lecture notes, in transcript order
+    """
+    partial_notes = [None] * len(chunks)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            submit_in_context(executor, summarize_chunk, chunk, index + 1, len(chunks), structured_output, use_cache): index
+            for index, chunk in enumerate(chunks)
+        }
+        for completed, future in enumerate(as_completed(futures), start=1):
+            partial_notes[futures[future]] = future.result()
+            if on_progress is not None:
+                on_progress(completed, len(chunks))
+
+    return partial_notes
+
+def merge_partial_notes(partial_notes, raw_notes, additional_notes, structured_output, on_fields=None):
+    """
+    Reduce stage: merges the partial lecture notes and the user's notes into the final lecture note.
+
+    Args:
+    - partial_notes (List[BaseModel]): The partial lecture notes, in transcript order
+    - raw_notes (str): Raw notes relevant to the lecture
+    - additional_notes (str): Other notes from the lecture
+    - structured_output (BaseModel): The lecture note model
+    - on_fields (callable, optional): Passed to `get_response` to show fields as they complete
+
+    Returns:
+    BaseModel: The final lecture note
+    """
+    # The partial notes come before the user's details, so they form a prompt prefix shared by regenerations
+    return get_response(
+        SYSTEM_PROMPT=SYSTEM_PROMPT_reduce_lecture_note,
+        USER_MESSAGE=user_message_reduce_fn(raw_notes=raw_notes, additional_notes=additional_notes),
+        structured_output=structured_output,
+        on_fields=on_fields,
+        context=user_message_partial_notes_fn([partial_note.model_dump_json() for partial_note in partial_notes])
+    )
+
+def generate_lecture_note(transcript, raw_notes, additional_notes, headings_string="", box=None, on_progress=None,
+                          partial_notes=None):
+    """
+    Generates a lecture note, using map-reduce when the transcript is too long for a single call.
+
+    Args:
+    - transcript (str or None): The audio transcript, or None if no audio was uploaded
+    - raw_notes (str): Raw notes relevant to the lecture
+    - additional_notes (str): Other notes from the lecture
+    - headings_string (str, optional): Comma-separated headings for the note. The default `LectureNote` structure is used if empty
+    - box: A UI element to display the lecture note as it is generated
+    - on_progress (callable, optional): Called as `on_progress(completed, total)` as transcript parts are summarised
+    - partial_notes (List[BaseModel], optional): Partial notes already made for a long transcript (e.g., by a live session),
+      which are merged as they are instead of summarising the transcript again
+
+    Returns:
+    Tuple[BaseModel, str]: The structured lecture note and its markdown
+    """
+    # If there is a desired sample to follow, pass the headings as attributes into the class
+    if headings_string != "":
+        structured_output = create_dynamic_lecture_note(get_headings(headings_string))
+    else:
+        structured_output = LectureNote
+
+    on_fields = partial_note_renderer(box) if box is not None else None
+
+    if transcript is not None and estimate_tokens(transcript) > MAP_REDUCE_THRESHOLD_TOKENS:
+        if not partial_notes:
+            partial_notes = summarize_chunks(chunk_transcript(transcript), on_progress=on_progress)
+        lecture_note = merge_partial_notes(partial_notes, raw_notes, additional_notes, structured_output, on_fields)
+    elif transcript is not None:
+        # The transcript comes before the user's details, so it forms a prompt prefix shared by regenerations
+        lecture_note = get_response(
+            SYSTEM_PROMPT=SYSTEM_PROMPT_get_lecture_note,
+            USER_MESSAGE=user_message_lecture_note_details_fn(raw_notes=raw_notes, additional_notes=additional_notes),
+            structured_output=structured_output,
+            on_fields=on_fields,
+            context=user_message_transcript_fn(transcript)
+        )
+    else:
+        lecture_note = get_response(
+            SYSTEM_PROMPT=SYSTEM_PROMPT_get_lecture_note,
+            USER_MESSAGE=user_message_lecture_note_fn(
+                transcript=transcript,
+                raw_notes=raw_notes,
+                additional_notes=additional_notes
+            ),
+            structured_output=structured_output,
+            on_fields=on_fields
+        )
+
+    return lecture_note, format_lecture_note(lecture_note, box)
@@ -0,0 +1,203 @@
+"""
+pipeline.py
+
+This file contains the transcription pipeline, which cleans each part of the transcript while later segments are still being transcribed.
+"""
+from typing import Any, NamedTuple, Optional
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from api_call import get_response
+from cleaner import clean_text
+from cache import (
+    hash_audio,
+    transcription_cache
+)
+from notes import chunk_transcript
+from metrics import submit_in_context
+from utils import (
+    preprocess_audio,
+    split_audio,
+    speech_to_text,
+    trim_overlap
+)
+from prompts import (
+    user_message_clean_fn,
+    SYSTEM_PROMPT_get_clean
+)
+from config import (
+    WHISPER_MODEL,
+    PREPROCESS_BITRATE_KBPS,
+    TRANSCRIBE_MAX_WORKERS,
+    CLEAN_MAX_WORKERS,
+    CLEAN_CHUNK_TOKENS,
+    CLEANING_MODE
+)
+
+class PipelineEvent(NamedTuple):
+    """
+    Something that happened in the pipeline, yielded to the caller in order.
+
+    `stage` is one of:
+    - "preprocessed": `data` is the PreprocessStats of the upload (not sent on a cache hit)
+    - "transcribed": part `index` was transcribed, `data` is its text with the overlap removed
+    - "cleaned": part `index` was cleaned, `data` is the cleaned text
+    - "done": `data` is a (raw_transcription, clean_transcription) tuple
+
+    `total` is the number of parts, or None while the audio is still being split.
+    """
+    stage: str
+    index: Optional[int] = None
+    data: Any = None
+    total: Optional[int] = None
+
+def clean_transcript_llm(transcript):
+    """
+    Cleans one part of a transcript with the model.
+
+    Args:
+    - transcript (str): The part of the transcript to clean
+
+    Returns:
+    str: The cleaned text
+    """
+    return get_response(SYSTEM_PROMPT_get_clean, user_message_clean_fn(transcript), structured_output=None)
+
+def _identity(text):
+    return text
+
+def get_clean_fn(clean=True, cleaning_mode=CLEANING_MODE):
+    """
+    Picks the function that cleans one part of a transcript.
+
+    Args:
+    - clean (bool, optional): Clean each part. If False, the text is returned as it is.
+    - cleaning_mode (str, optional): "local" for the rule-based cleaner, or "llm" to have the model clean each part.
+
+    Returns:
+    callable: Turns raw text into cleaned text
+    """
+    if not clean:
+        return _identity
+    if cleaning_mode == "llm":
+        return clean_transcript_llm
+    return clean_text
+
+def _run_stages(sources, transcribe_fn, clean_fn, transcribe_workers, clean_workers, stitch=True):
+    """
+    Runs transcription and cleaning with a queue between them, yielding events in part order.
+
+    Parts are released to the cleaning stage as soon as every earlier part has been transcribed,
+    so part N is being cleaned while part N+1 is still being transcribed.
+
+    Args:
+    - sources (Iterable): The parts to transcribe, in order
+    - transcribe_fn (callable): Turns one source into its raw text
+    - clean_fn (callable): Turns raw text into cleaned text
+    - transcribe_workers (int): Maximum number of parts transcribed at the same time
+    - clean_workers (int): Maximum number of parts cleaned at the same time
+    - stitch (bool, optional): Remove the words repeated by the overlap between consecutive parts. Turned off for
+      parts split from a transcript, which do not overlap
+
+    Yields:
+    PipelineEvent: "transcribed" and "cleaned" events, each stage in part order
+    """
+    sources = iter(sources)
+    transcribing, cleaning = {}, {}
+    transcribed, cleaned = {}, {}
+    next_transcribed = next_cleaned = submitted = 0
+    previous = ""
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=transcribe_workers) as transcribe_pool, \
+            ThreadPoolExecutor(max_workers=clean_workers) as clean_pool:
+        while True:
+            # Pull the next part only when a transcription worker is free, so memory stays bounded
+            while not exhausted and len(transcribing) < transcribe_workers:
+                source = next(sources, None)
+                if source is None:
+                    exhausted = True
+                    break
+                transcribing[submit_in_context(transcribe_pool, transcribe_fn, source)] = submitted
+                submitted += 1
+
+            if not transcribing and not cleaning:
+                break
+
+            total = submitted if exhausted else None
+            done, _ = wait([*transcribing, *cleaning], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in transcribing:
+                    transcribed[transcribing.pop(future)] = future.result()
+                else:
+                    cleaned[cleaning.pop(future)] = future.result()
+
+            # Hand transcribed parts to the cleaning stage in order, removing the words repeated by the segment overlap
+            while next_transcribed in transcribed:
+                text = transcribed.pop(next_transcribed)
+                new_text = trim_overlap(previous, text) if stitch and previous else text.strip()
+                previous = text
+                yield PipelineEvent("transcribed", next_transcribed, new_text, total)
+                cleaning[submit_in_context(clean_pool, clean_fn, new_text)] = next_transcribed
+                next_transcribed += 1
+
+            while next_cleaned in cleaned:
+                yield PipelineEvent("cleaned", next_cleaned, cleaned.pop(next_cleaned), total)
+                next_cleaned += 1
+
+def run_pipeline(audio_file, language="en", trim_silence=False, clean=True, cleaning_mode=CLEANING_MODE,
+                 transcribe_workers=TRANSCRIBE_MAX_WORKERS, clean_workers=CLEAN_MAX_WORKERS):
+    """
+    Transcribes and cleans a recording with overlapping stages, yielding progress as it happens.
+
+    The generator runs in the calling thread, so Streamlit elements can be updated from the loop consuming it.
+    A recording that has been transcribed before is taken from the transcription cache, split into parts
+    and only cleaned.
+
+    Args:
+    - audio_file (str or file-like object): Path to the audio file or a file-like object (e.g., BytesIO).
+    - language (str, optional): The language of the audio. Default is English ("en").
+    - trim_silence (bool, optional): Shorten long silences before transcribing. Default is False.
+    - clean (bool, optional): Clean each part. If False, cleaned text is the raw text.
+    - cleaning_mode (str, optional): "local" for the rule-based cleaner, or "llm" to have the model clean each part.
+    - transcribe_workers (int, optional): Maximum number of segments transcribed at the same time.
+    - clean_workers (int, optional): Maximum number of parts cleaned at the same time.
+
+    Yields:
+    PipelineEvent: The progress of the pipeline, ending with a "done" event.
+    """
+    clean_fn = get_clean_fn(clean, cleaning_mode)
+    raw_parts, clean_parts = [], []
+
+    cache_key = transcription_cache.make_key(hash_audio(audio_file), language, WHISPER_MODEL, trim_silence)
+    cached = transcription_cache.get(cache_key)
+
+    if cached is not None:
+        events = _run_stages(
+            chunk_transcript(cached, CLEAN_CHUNK_TOKENS), _identity, clean_fn, 1, clean_workers, stitch=False
+        )
+        for event in events:
+            (raw_parts if event.stage == "transcribed" else clean_parts).append(event.data)
+            yield event
+    else:
+        with preprocess_audio(audio_file, trim_silence=trim_silence) as (preprocessed_path, preprocess_stats):
+            yield PipelineEvent("preprocessed", data=preprocess_stats)
+
+            segments = split_audio(preprocessed_path, bitrate_kbps=PREPROCESS_BITRATE_KBPS, copy=True)
+            events = _run_stages(
+                segments,
+                lambda segment: speech_to_text(segment, language),
+                clean_fn,
+                transcribe_workers,
+                clean_workers
+            )
+            for event in events:
+                (raw_parts if event.stage == "transcribed" else clean_parts).append(event.data)
+                yield event
+
+        transcription_cache.set(cache_key, " ".join(part for part in raw_parts if part))
+
+    yield PipelineEvent(
+        "done",
+        data=(" ".join(part for part in raw_parts if part), "\n\n".join(part for part in clean_parts if part)),
+        total=len(raw_parts)
+    )
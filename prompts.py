@@ -4,6 +4,30 @@ prompts.py
 This module contains functions to generate system prompts and user messages for synthesizing lectures into concise notes, as well as for cleaning up audio transcripts.
 """
 
+def format_raw_notes(title="", date="", lecturer="", course="", outline="", takeaways=""):
+    """
+    Formats the lecture details entered by the user into the raw notes passed to the model.
+
+    Parameters:
+    - title (str, optional): Lecture title
+    - date (str, optional): Date of the lecture (DD/MM/YYYY)
+    - lecturer (str, optional): Name of the lecturer
+    - course (str, optional): Course name
+    - outline (str, optional): Lecture outline
+    - takeaways (str, optional): Key takeaways and important points discussed
+
+    Returns:
+    str: The raw notes
+    """
+    return f"""
+        Lecture Title: {title},
+        Date of Lecture: {date},
+        Lecturer Name: {lecturer},
+        Course Name: {course},
+        Lecture Outline: {outline},
+        Key Takeaways: {takeaways}
+        """
+
 def user_message_lecture_note_fn(transcript=None, raw_notes="", additional_notes=""):  # default empty string
     """
     Constructs a user message for generating a lecture note based on provided inputs.
@@ -33,6 +57,49 @@ def user_message_lecture_note_fn(transcript=None, raw_notes="", additional_notes
     """
     return USER_MESSAGE
 
+def user_message_transcript_fn(transcript):
+    """
+    Constructs the message holding the transcript, sent before the lecture note request.
+
+    Keeping the transcript in its own message, ahead of the details the user may change, lets repeated generations
+    share a cacheable prompt prefix.
+
+    Parameters:
+    - transcript (str): The audio transcript of the lecture
+
+    Returns:
+    - str: The formatted message
+    """
+    return f"""
+    <transcript>
+    {transcript}
+    </transcript>
+    """
+
+def user_message_lecture_note_details_fn(raw_notes="", additional_notes=""):
+    """
+    Constructs a user message for generating a lecture note from the transcript sent before it.
+
+    Parameters:
+    - raw_notes (str): Raw notes relevant to the lecture
+    - additional_notes (str): Other notes from the lecture
+
+    Returns:
+    - str: The formatted user message
+    """
+    USER_MESSAGE = f"""
+    Provide me with a lecture note based on the transcript above and the following
+
+    <raw_notes>
+    {raw_notes}
+    </raw_notes>
+
+    <additional_notes>
+    {additional_notes}
+    </additional_notes>
+    """
+    return USER_MESSAGE
+
 def user_message_clean_fn(transcript):
     """
     Generates a user prompt for to clean the transcript.
@@ -52,6 +119,72 @@ def user_message_clean_fn(transcript):
     """
     return USER_MESSAGE
 
+def user_message_map_fn(transcript_part, part_number, part_count):
+    """
+    Constructs a user message for summarising one part of a long transcript into a partial lecture note.
+
+    Parameters:
+    - transcript_part (str): One part of the audio transcript
+    - part_number (int): The position of this part, starting from 1
+    - part_count (int or None): The total number of parts, or None while the lecture is still being recorded
+
+    Returns:
+    - str: The formatted user message
+    """
+    part = f"part {part_number} of {part_count}" if part_count is not None else f"part {part_number}"
+    USER_MESSAGE = f"""
+    Provide me with a partial lecture note for {part} of the following lecture transcript
+
+    <transcript_part>
+    {transcript_part}
+    </transcript_part>
+    """
+    return USER_MESSAGE
+
+def user_message_partial_notes_fn(partial_notes):
+    """
+    Constructs the message holding the partial lecture notes of a long transcript, sent before the merge request.
+
+    Parameters:
+    - partial_notes (List[str]): The partial lecture notes as JSON, in transcript order
+
+    Returns:
+    - str: The formatted message
+    """
+    partial_notes_string = "\n".join(
+        f"<partial_note part=\"{index}\">\n{partial_note}\n</partial_note>"
+        for index, partial_note in enumerate(partial_notes, start=1)
+    )
+    return f"""
+    <partial_notes>
+    {partial_notes_string}
+    </partial_notes>
+    """
+
+def user_message_reduce_fn(raw_notes="", additional_notes=""):
+    """
+    Constructs a user message for merging the partial lecture notes sent before it into the final lecture note.
+
+    Parameters:
+    - raw_notes (str): Raw notes relevant to the lecture
+    - additional_notes (str): Other notes from the lecture
+
+    Returns:
+    - str: The formatted user message
+    """
+    USER_MESSAGE = f"""
+    Provide me with a lecture note that merges the partial lecture notes above
+
+    <raw_notes>
+    {raw_notes}
+    </raw_notes>
+
+    <additional_notes>
+    {additional_notes}
+    </additional_notes>
+    """
+    return USER_MESSAGE
+
 # System prompt to generate the lecture note
 SYSTEM_PROMPT_get_lecture_note = """
 You are an expert lecture note taker. Your job is to generate a detailed and comprehensive lecture note organised by topic, aiding students in study and revision.
@@ -88,3 +221,45 @@ Extract the necessary information from the inputs and organize it logically unde
 SYSTEM_PROMPT_get_clean = """
 You are tasked with cleaning up a speech-to-text transcription. Your goal is to improve the readability and flow of the text by only removing filler words such as "um," "uh," "like," "you know," "sort of," and any unnecessary repetition. Ensure the core content, meaning, and structure of the speech remain fully intact. Do not cut down or alter the actual substance of the content. Keep all important details, ideas, and context exactly as spoken, minus the filler and repeated sentences.
 """
+
+# System prompt to summarise one part of a long transcript into a partial lecture note
+SYSTEM_PROMPT_map_lecture_note = """
+You are an expert lecture note taker. A long lecture transcript has been split into parts, and you are given one of them. Your job is to capture everything from this part that belongs in the final lecture note, so that the parts can later be merged.
+
+## Task:
+Fill in the lecture note structure using only the content of this part of the transcript.
+- Capture every concept, definition, example, insight, discussion point and follow-up action mentioned in this part, in detail.
+- Leave fields that this part does not cover as an empty string or an empty list. Do not guess the lecture title, date, lecturer or course name.
+- Do not write introductions or conclusions for the whole lecture, as this is only one part of it.
+
+## Guidelines:
+1. Use a professional, third-person narrative style.
+2. Present information in clear, concise bullet points.
+3. If speaker identity is unclear, use placeholders like <PERSON A>.
+4. Avoid using H1/H2/H3 markdown formatting.
+"""
+
+# System prompt to merge partial lecture notes into the final lecture note
+SYSTEM_PROMPT_reduce_lecture_note = """
+You are an expert lecture note taker. A long lecture was split into parts, and each part was summarised into a partial lecture note. Your job is to merge the partial notes into one detailed and comprehensive lecture note organised by topic, aiding students in study and revision.
+
+## Input:
+1. Partial Notes: Partial lecture notes, in the order the parts were spoken.
+2. Raw Notes: Including, but not limited to the lecture title, date, lecturer name, course name, lecture outline, and key takeaways.
+3. Additional Notes: Any supplementary information or details mentioned during the lecture.
+
+## Task:
+- Merge the partial notes into the lecture note structure you are given, placing each point under the field it belongs to and keeping the order in which topics were covered.
+- Combine points that repeat across parts instead of listing them twice, but do not drop any distinct detail.
+- Take the lecture title, date, lecturer and course name from the raw notes.
+- Write the introduction and outline for the lecture as a whole.
+
+## Guidelines:
+1. Use a professional, third-person narrative style.
+2. Present information in clear, concise bullet points.
+3. If speaker identity is unclear, use placeholders like <PERSON A>.
+4. Avoid using H1/H2/H3 markdown formatting.
+5. Ensure all key information from the inputs is incorporated.
+6. Highlight any critical insights or decisions made during the meeting.
+7. Clearly outline any follow-up actions or commitments.
+"""
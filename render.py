@@ -0,0 +1,124 @@
+"""
+render.py
+
+This file contains functions that turn structured lecture notes into markdown locally, without an API call.
+"""
+from pydantic import BaseModel
+
+from api_call import get_lecture_note_md
+from config import MARKDOWN_RENDERER
+
+# Short LectureNote fields shown as a details block under the title instead of as sections
+DETAIL_FIELDS = ("date", "lecturer", "course_name")
+
+def format_heading(field_name):
+    """
+    Turns a field name into a heading, e.g. "key_concepts" -> "Key Concepts".
+
+    Only the first letter of each word is changed, so headings the user typed (e.g. "AI_ethics") keep their casing.
+
+    Args:
+    - field_name (str): The name of the model field.
+
+    Returns:
+    str: The heading text.
+    """
+    return " ".join(word[:1].upper() + word[1:] for word in field_name.split("_") if word)
+
+def render_value(value):
+    """
+    Renders a field value as markdown: lists become bullet points, anything else a paragraph.
+
+    Args:
+    - value: The field value.
+
+    Returns:
+    str: The markdown for the value, or an empty string if there is nothing to show.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        # Indent continuation lines so multi-line items stay inside their bullet
+        return "\n".join("- " + str(item).strip().replace("\n", "\n  ") for item in value if str(item).strip())
+    return str(value).strip()
+
+def render_fields(fields):
+    """
+    Renders lecture note fields as markdown, one section per field in the order given.
+
+    A `lecture_title` field becomes the H1 title, the fields in DETAIL_FIELDS become a details block
+    under it, and every other non-empty field becomes an H2 section.
+
+    Args:
+    - fields (dict): Field names mapped to their values, e.g. from `model.model_dump()`.
+
+    Returns:
+    str: The lecture note in markdown.
+    """
+    parts = []
+
+    title = render_value(fields.get("lecture_title"))
+    if title:
+        parts.append(f"# {title}")
+
+    details = [
+        f"**{format_heading(name)}:** {render_value(fields[name])}"
+        for name in DETAIL_FIELDS if render_value(fields.get(name))
+    ]
+    if details:
+        parts.append("  \n".join(details))
+
+    for name, value in fields.items():
+        if name == "lecture_title" or name in DETAIL_FIELDS:
+            continue
+        body = render_value(value)
+        if body:
+            parts.append(f"## {format_heading(name)}\n\n{body}")
+
+    return "\n\n".join(parts)
+
+def render_lecture_note_md(lecture_note: BaseModel) -> str:
+    """
+    Renders a `LectureNote` or a dynamic heading model as markdown by walking its fields.
+
+    Args:
+    - lecture_note (BaseModel): The structured lecture note returned by `get_response`.
+
+    Returns:
+    str: The lecture note in markdown.
+    """
+    return render_fields(lecture_note.model_dump())
+
+def partial_note_renderer(box):
+    """
+    Creates an `on_fields` callback for `get_response` that shows the completed fields in `box` as they arrive.
+
+    Args:
+    - box: A UI element to display the partial lecture note
+
+    Returns:
+    callable: The callback, taking a dict of the completed fields.
+    """
+    def show_fields(fields):
+        box.info(render_fields(fields))
+    return show_fields
+
+def format_lecture_note(lecture_note, box=None, mode=MARKDOWN_RENDERER):
+    """
+    Formats a structured lecture note as markdown and shows it in the UI.
+
+    Args:
+    - lecture_note (BaseModel): The structured lecture note returned by `get_response`.
+    - box: A UI element to display the result
+    - mode (str, optional): "local" to render the fields directly, or "llm" to have the model format them.
+
+    Returns:
+    str: The lecture note in markdown.
+    """
+    if mode == "llm":
+        return get_lecture_note_md(str(lecture_note), box)
+
+    lecture_note_md = render_lecture_note_md(lecture_note)
+    if box is not None:
+        box.info(lecture_note_md)
+    return lecture_note_md
@@ -0,0 +1,116 @@
+"""
+streaming.py
+
+This file contains the stream consumer that collects streamed model output and shows it in the UI.
+"""
+import time
+from dataclasses import dataclass, field
+
+from config import (
+    STREAM_MAX_FPS,
+    STREAM_FLUSH_CHARS
+)
+
+@dataclass
+class StreamStats:
+    """
+    Timing and volume of one consumed stream
+    """
+    chunks: int = 0
+    chars: int = 0
+    flushes: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    first_chunk_at: float = None
+    finished_at: float = None
+
+    @property
+    def time_to_first_token(self):
+        return None if self.first_chunk_at is None else self.first_chunk_at - self.started_at
+
+    @property
+    def duration(self):
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def chars_per_second(self):
+        return self.chars / self.duration if self.duration > 0 else 0.0
+
+class StreamConsumer:
+    """
+    Accumulates streamed text chunks in a list and pushes the text to a UI element at a capped rate.
+
+    Appending each chunk to a growing string and re-sending the whole text on every chunk copies the
+    text quadratically and sends one websocket message per token. Here chunks are buffered, and the box
+    is only updated when `1 / max_fps` seconds have passed or `flush_chars` new characters are waiting.
+    The complete text is always shown once the stream ends.
+    """
+    def __init__(self, box=None, max_fps=STREAM_MAX_FPS, flush_chars=STREAM_FLUSH_CHARS):
+        self.box = box
+        self.min_interval = 1 / max_fps
+        self.flush_chars = flush_chars
+        self.stats = StreamStats()
+        self._text = ""
+        self._pending = []
+        self._pending_chars = 0
+        self._last_flush = 0.0
+
+    @property
+    def text(self):
+        """
+        The full text received so far.
+        """
+        if self._pending:
+            self._text += "".join(self._pending)
+            self._pending = []
+            self._pending_chars = 0
+        return self._text
+
+    def feed(self, chunk):
+        """
+        Adds a chunk of text, updating the box if it is due.
+
+        Args:
+        - chunk (str): The next piece of streamed text
+        """
+        if not chunk:
+            return
+        if self.stats.first_chunk_at is None:
+            self.stats.first_chunk_at = time.perf_counter()
+        self.stats.chunks += 1
+        self.stats.chars += len(chunk)
+
+        self._pending.append(chunk)
+        self._pending_chars += len(chunk)
+
+        if self.box is not None and (
+            self._pending_chars >= self.flush_chars
+            or time.perf_counter() - self._last_flush >= self.min_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """
+        Shows the full text received so far in the box.
+        """
+        text = self.text
+        if self.box is not None:
+            self.box.info(text)
+            self.stats.flushes += 1
+        self._last_flush = time.perf_counter()
+
+    def consume(self, chunks):
+        """
+        Feeds every chunk of a stream, then shows the complete text.
+
+        Args:
+        - chunks (Iterable[str]): The streamed pieces of text
+
+        Returns:
+        str: The complete text
+        """
+        for chunk in chunks:
+            self.feed(chunk)
+        self.stats.finished_at = time.perf_counter()
+        if self.box is not None:
+            self.flush()
+        return self.text
@@ -0,0 +1,39 @@
+"""
+conftest.py
+
+Puts the application modules on the import path, as the app and the CLI are run from the repository root, and provides
+the fake OpenAI server of the benchmarks to tests that call the API.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fake_openai_server import FakeServerConfig, start_server  # noqa: E402
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    """
+    Starts the fake OpenAI server and points the shared client at it.
+
+    Returns a function taking the server's settings as `FakeServerConfig` keyword arguments, which returns its counters.
+    """
+    import clients
+
+    servers = []
+
+    def start(**settings):
+        server, url, stats = start_server(FakeServerConfig(**settings), port=0)
+        servers.append(server)
+        monkeypatch.setattr(clients, "_read_credentials", lambda: ("fake", url))
+        monkeypatch.setattr(clients, "_client", None)
+        return stats
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
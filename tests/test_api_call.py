@@ -0,0 +1,39 @@
+"""
+test_api_call.py
+
+Tests for streaming structured responses against the fake OpenAI server.
+"""
+from typing import List
+
+from pydantic import BaseModel
+
+from api_call import _stream_structured_response
+
+MESSAGES = [{"role": "user", "content": "Write the lecture note"}]
+
+class Note(BaseModel):
+    summary: str
+    details: str
+
+class NoteWithList(BaseModel):
+    summary: str
+    takeaways: List[str]
+
+def test_string_field_is_shown_as_soon_as_it_is_complete(fake_server):
+    fake_server(latency=0, tokens_per_second=2000)
+    calls = []
+
+    note = _stream_structured_response(MESSAGES, Note, lambda fields: calls.append(dict(fields)))
+
+    # The last field is reported while streaming, not only with the final response
+    assert [list(fields) for fields in calls] == [["summary"], ["summary", "details"], ["summary", "details"]]
+    assert calls[-1] == note.model_dump()
+
+def test_list_field_is_held_back_until_complete(fake_server):
+    fake_server(latency=0, tokens_per_second=2000)
+    calls = []
+
+    note = _stream_structured_response(MESSAGES, NoteWithList, lambda fields: calls.append(dict(fields)))
+
+    assert all("takeaways" not in fields for fields in calls[:-1])
+    assert calls[-1] == note.model_dump()
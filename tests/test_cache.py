@@ -0,0 +1,77 @@
+"""
+test_cache.py
+
+Tests for the on-disk transcription cache: its size budget and least recently used eviction.
+"""
+import os
+import time
+
+import pytest
+
+from cache import TranscriptionCache
+
+ENTRY = "x" * 100  # Bytes on disk of each entry
+
+@pytest.fixture
+def cache(tmp_path):
+    return TranscriptionCache(directory=str(tmp_path), max_mb=250 / (1024 * 1024))  # Room for two entries
+
+def age(cache, key, seconds):
+    """
+    Makes an entry look as if it was last used `seconds` ago.
+    """
+    used_at = time.time() - seconds
+    os.utime(cache._path(key), (used_at, used_at))
+
+def cached_keys(cache):
+    return {key for key in ("a", "b", "c", "d") if os.path.exists(cache._path(key))}
+
+def test_entries_are_read_back(cache):
+    cache.set("a", "Transcript with ünïcode.")
+    assert cache.get("a") == "Transcript with ünïcode."
+    assert cache.get("missing") is None
+
+def test_least_recently_used_entry_is_evicted(cache):
+    cache.set("a", ENTRY)
+    age(cache, "a", 20)
+    cache.set("b", ENTRY)
+    age(cache, "b", 10)
+
+    cache.set("c", ENTRY)
+
+    assert cached_keys(cache) == {"b", "c"}
+
+def test_hit_refreshes_recency(cache):
+    cache.set("a", ENTRY)
+    age(cache, "a", 20)
+    cache.set("b", ENTRY)
+    age(cache, "b", 10)
+
+    assert cache.get("a") == ENTRY
+    cache.set("c", ENTRY)
+
+    assert cached_keys(cache) == {"a", "c"}
+
+def test_size_stays_within_budget(cache):
+    for index, key in enumerate(("a", "b", "c", "d")):
+        cache.set(key, ENTRY)
+        age(cache, key, 10 - index)
+
+    sizes = [entry.stat().st_size for entry in os.scandir(cache.directory) if entry.name.endswith(".txt")]
+    assert sum(sizes) <= cache.max_bytes
+    assert cached_keys(cache) == {"c", "d"}
+
+def test_replacing_an_entry_is_counted_once(cache):
+    cache.set("a", ENTRY)
+    age(cache, "a", 10)
+    cache.set("b", ENTRY)
+    cache.set("b", ENTRY)
+
+    assert cached_keys(cache) == {"a", "b"}
+    assert not [name for name in os.listdir(cache.directory) if name.endswith(".tmp")]
+
+def test_keys_depend_on_every_part():
+    key = TranscriptionCache.make_key("hash", "en", "whisper")
+    assert key == TranscriptionCache.make_key("hash", "en", "whisper")
+    assert key != TranscriptionCache.make_key("hash", "fr", "whisper")
+    assert key != TranscriptionCache.make_key("hash", "en", "whisper", True)
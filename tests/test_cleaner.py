@@ -0,0 +1,84 @@
+"""
+test_cleaner.py
+
+Tests for the local transcript cleaner: what it removes, and what it must leave as it was said.
+"""
+import pytest
+
+from cleaner import (
+    clean_text,
+    remove_fillers,
+    remove_repeated_ngrams,
+    normalise_whitespace
+)
+
+@pytest.mark.parametrize("transcript, expected", [
+    ("Um. So today we look at entropy.", "So today we look at entropy."),
+    ("That was the proof. Uh, so next we look at entropy.", "That was the proof. So next we look at entropy."),
+    ("Um, so today we look at entropy.", "So today we look at entropy."),
+])
+def test_hesitation_at_sentence_start_leaves_no_punctuation(transcript, expected):
+    assert clean_text(transcript) == expected
+
+def test_hesitation_between_commas_keeps_one_comma():
+    assert clean_text("This is important, uh, okay?") == "This is important, okay?"
+
+def test_filler_phrase_between_commas_keeps_one_comma():
+    assert remove_fillers("It is, you know, fine.") == "It is, fine."
+
+def test_hesitations_inside_a_sentence_are_removed():
+    assert clean_text("The gradient is, um, the slope um of the loss, uh.") == "The gradient is, the slope of the loss."
+
+def test_filler_phrases_used_as_words_are_kept():
+    transcript = "I like this kind of bias."
+    assert clean_text(transcript) == transcript
+
+def test_repeated_words_are_collapsed():
+    assert clean_text("I think I think the the answer is zero.") == "I think the answer is zero."
+
+def test_repeated_sentence_is_dropped():
+    assert clean_text("Let us begin. Let us begin. First, the definition.") == "Let us begin. First, the definition."
+
+@pytest.mark.parametrize("transcript", [
+    "The Fibonacci sequence starts 1 1 2 3 5 8.",
+    "The matrix is 0 0, 0 1.",
+    "Call it version 2 version 2.",
+])
+def test_repeated_numbers_are_kept(transcript):
+    assert remove_repeated_ngrams(transcript) == transcript
+
+@pytest.mark.parametrize("transcript", [
+    "This is very very hard.",
+    "It took a long long time.",
+    "She had had enough.",
+    "He said that that was wrong.",
+])
+def test_legitimate_doubles_are_kept(transcript):
+    assert remove_repeated_ngrams(transcript) == transcript
+
+def test_no_capital_after_abbreviations():
+    transcript = "Use a prior, e.g. a Gaussian. then we stop, i.e. we are done, etc. and so on."
+    expected = "Use a prior, e.g. a Gaussian. Then we stop, i.e. we are done, etc. and so on."
+    assert normalise_whitespace(transcript) == expected
+
+def test_sentences_are_capitalised():
+    assert normalise_whitespace("first point.  second point?  third") == "First point. Second point? Third"
+
+def test_leading_punctuation_is_removed():
+    assert normalise_whitespace(". , so today") == "So today"
+
+@pytest.mark.parametrize("transcript", [
+    "Uh-huh, that is right.",
+    "Mm-hmm, right.",
+    "And then, uh-oh, it crashed.",
+])
+def test_hyphenated_interjections_are_kept(transcript):
+    assert clean_text(transcript) == transcript
+
+@pytest.mark.parametrize("transcript", [
+    "The answer is yes. Yes.",
+    "It is the end. End. Next topic.",
+])
+def test_repeats_across_sentences_are_kept(transcript):
+    assert remove_repeated_ngrams(transcript) == transcript
+    assert clean_text(transcript) == transcript
@@ -0,0 +1,119 @@
+"""
+test_clients.py
+
+Tests for the retry policy and rate limiting of the shared client, against the fake OpenAI server.
+"""
+import time
+
+import pytest
+from openai import BadRequestError, InternalServerError
+
+import clients
+from clients import (
+    TokenBucket,
+    call_with_retry,
+    get_client
+)
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+def create_completion():
+    return get_client().chat.completions.create(model="gpt-4o", messages=MESSAGES)
+
+def call_recording_retries(**kwargs):
+    retries = []
+    result = call_with_retry(create_completion, on_retry=lambda attempt, delay, error: retries.append((attempt, delay, error)), **kwargs)
+    return result, retries
+
+@pytest.mark.parametrize("retry_after_format, expected_delay", [
+    ("ms", 0.25),
+    ("both", 0.25),  # retry-after-ms is more precise than retry-after, so it wins
+    ("seconds", 1.0),
+])
+def test_retry_waits_for_retry_after(fake_server, retry_after_format, expected_delay):
+    stats = fake_server(latency=0, completion_tokens=5, throttle_first=1, retry_after=0.25,
+                        retry_after_format=retry_after_format)
+
+    result, retries = call_recording_retries()
+
+    assert result.choices[0].message.content
+    assert [(attempt, delay) for attempt, delay, _ in retries] == [(1, pytest.approx(expected_delay))]
+    assert (stats.requests, stats.throttled) == (2, 1)
+
+def test_retry_waits_until_retry_after_date(fake_server):
+    fake_server(latency=0, completion_tokens=5, throttle_first=1, retry_after=1.5, retry_after_format="date")
+
+    _, retries = call_recording_retries()
+
+    # An HTTP date only has whole seconds
+    assert len(retries) == 1
+    assert 0 <= retries[0][1] <= 1.5
+
+def test_retry_wait_is_capped(fake_server, monkeypatch):
+    monkeypatch.setattr(clients, "API_MAX_RETRY_DELAY", 0.1)
+    fake_server(latency=0, completion_tokens=5, throttle_first=1, retry_after=30, retry_after_format="ms")
+
+    start = time.monotonic()
+    _, retries = call_recording_retries()
+
+    assert retries[0][1] == 0.1
+    assert time.monotonic() - start < 5
+
+def test_server_errors_back_off_exponentially(fake_server, monkeypatch):
+    monkeypatch.setattr(clients, "API_RETRY_BACKOFF", 0.01)
+    stats = fake_server(latency=0, completion_tokens=5, fail_first=3)
+
+    _, retries = call_recording_retries()
+
+    assert stats.requests == 4
+    assert [attempt for attempt, _, _ in retries] == [1, 2, 3]
+    for attempt, delay, error in retries:
+        assert isinstance(error, InternalServerError)
+        # Jitter keeps each wait between half and one and a half times the backoff
+        assert 0.005 * 2 ** (attempt - 1) <= delay <= 0.015 * 2 ** (attempt - 1)
+
+def test_gives_up_after_max_retries(fake_server, monkeypatch):
+    monkeypatch.setattr(clients, "API_RETRY_BACKOFF", 0.01)
+    stats = fake_server(latency=0, fail_first=10)
+
+    with pytest.raises(InternalServerError):
+        call_recording_retries(max_retries=2)
+    assert stats.requests == 3
+
+def test_client_errors_are_not_retried(fake_server):
+    stats = fake_server(latency=0, fail_first=1, failure_status=400)
+
+    with pytest.raises(BadRequestError):
+        call_recording_retries()
+    assert stats.requests == 1
+
+def test_token_bucket_starts_full():
+    bucket = TokenBucket(per_minute=600)
+
+    start = time.monotonic()
+    for _ in range(600):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.5
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(per_minute=600)  # Ten units a second
+    bucket.acquire(600)
+
+    start = time.monotonic()
+    bucket.acquire(3)
+    assert 0.25 <= time.monotonic() - start < 1.0
+
+def test_token_bucket_does_not_refill_beyond_its_size():
+    bucket = TokenBucket(per_minute=6000)
+    bucket.acquire(6000)
+
+    bucket._updated -= 120  # Two minutes idle
+    bucket._refill()
+    assert bucket._available == bucket.capacity
+
+def test_token_bucket_caps_requests_larger_than_its_size():
+    bucket = TokenBucket(per_minute=60)
+
+    start = time.monotonic()
+    bucket.acquire(1000)
+    assert time.monotonic() - start < 0.5
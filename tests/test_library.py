@@ -0,0 +1,143 @@
+"""
+test_library.py
+
+Tests for the lecture library: saving transcripts and notes, and finding them again with the full-text search.
+"""
+import sqlite3
+
+import pytest
+
+from library import LectureLibrary
+
+@pytest.fixture
+def library(tmp_path):
+    library = LectureLibrary(str(tmp_path / "library.db"))
+    yield library
+    library.close()
+
+def test_transcript_and_note_are_saved_to_one_lecture(library):
+    lecture_id = library.save_transcript("raw words", "Clean words.", source="week1.mp3", audio_hash="abc", title="week1")
+    assert library.save_note("# Note", details={"title": "Gradient Descent", "course": "ML"}, lecture_id=lecture_id) == lecture_id
+
+    lecture = library.get(lecture_id)
+    assert (lecture["transcription"], lecture["clean_transcription"]) == ("raw words", "Clean words.")
+    assert (lecture["title"], lecture["course"], lecture["lecture_note_md"]) == ("Gradient Descent", "ML", "# Note")
+
+def test_generating_again_keeps_the_lecture_and_its_details(library):
+    lecture_id = library.save_note("# First", details={"title": "Entropy", "lecturer": "Dr. Tan"})
+
+    assert library.save_note("# Second", details={"title": "Entropy", "lecturer": ""}, lecture_id=lecture_id) == lecture_id
+
+    lecture = library.get(lecture_id)
+    assert lecture["lecture_note_md"] == "# Second"
+    assert lecture["lecturer"] == "Dr. Tan"  # Empty details keep what the lecture already has
+    assert len(library.search()) == 1
+
+def test_note_for_a_deleted_lecture_is_saved_as_a_new_one(library):
+    lecture_id = library.save_note("# Note", details={"title": "Entropy"})
+    library.save_note("# Other", details={"title": "Sorting"})
+    library.delete(lecture_id)
+
+    new_id = library.save_note("# Note again", lecture_id=lecture_id)
+
+    assert new_id != lecture_id
+    assert library.get(lecture_id) is None
+    assert library.get(new_id)["lecture_note_md"] == "# Note again"
+
+def test_same_recording_updates_the_owners_lecture(library):
+    first_id = library.save_transcript("first", "First.", audio_hash="abc", owner="session-1")
+    library.save_note("# Note", details={"headings": "Summary"}, lecture_id=first_id)
+
+    assert library.save_transcript("second", "Second.", audio_hash="abc", owner="session-1") == first_id
+    lecture = library.get(first_id)
+    assert lecture["transcription"] == "second"
+    assert (lecture["lecture_note_md"], lecture["headings"]) == ("# Note", "Summary")
+
+def test_same_recording_of_another_owner_is_a_new_lecture(library):
+    first_id = library.save_transcript("first", "First.", audio_hash="abc", owner="session-1")
+    library.save_note("# First user's note", details={"headings": "Summary"}, lecture_id=first_id)
+
+    second_id = library.save_transcript("second", "Second.", audio_hash="abc", owner="session-2")
+    library.save_note("# Second user's note", details={"headings": "Outline"}, lecture_id=second_id)
+
+    assert second_id != first_id
+    first = library.get(first_id)
+    assert (first["transcription"], first["lecture_note_md"], first["headings"]) == ("first", "# First user's note", "Summary")
+
+def test_recording_without_owner_is_always_a_new_lecture(library):
+    first_id = library.save_transcript("first", "First.", audio_hash="abc")
+    assert library.save_transcript("second", "Second.", audio_hash="abc") != first_id
+
+def test_search_finds_words_in_every_indexed_column(library):
+    lecture_id = library.save_transcript("", "We derive the softmax function today.", title="Week 3")
+    library.save_note("# Attention", details={"course": "Deep Learning", "lecturer": "Dr. Lim"}, lecture_id=lecture_id)
+
+    for query in ("softmax", "attention", "deep learning", "lim", "week 3"):
+        assert [lecture["id"] for lecture in library.search(query)] == [lecture_id], query
+
+def test_search_needs_every_word(library):
+    library.save_transcript("", "Markov chains and random walks.", title="Markov")
+    library.save_transcript("", "Markov decision processes.", title="MDPs")
+
+    assert [lecture["title"] for lecture in library.search("markov walks")] == ["Markov"]
+
+def test_search_is_stemmed(library):
+    lecture_id = library.save_transcript("", "The model is learning from examples.", title="Training")
+    assert [lecture["id"] for lecture in library.search("learn")] == [lecture_id]
+
+def test_search_matches_the_last_word_as_a_prefix_from_three_letters(library):
+    lecture_id = library.save_transcript("", "Today we cover gradients.", title="Optimisation")
+
+    assert [lecture["id"] for lecture in library.search("grad")] == [lecture_id]
+    assert library.search("gr") == []
+
+def test_search_ranks_title_above_transcript(library):
+    in_transcript = library.save_transcript("", "A short aside about entropy.", title="Probability")
+    in_title = library.save_transcript("", "Information and surprise.", title="Entropy")
+
+    assert [lecture["id"] for lecture in library.search("entropy")] == [in_title, in_transcript]
+
+def test_search_returns_a_snippet_of_the_match(library):
+    library.save_transcript("", "The eigenvalue of a matrix tells us how it stretches space.", title="Linear Algebra")
+    assert "**eigenvalue**" in library.search("eigenvalue")[0]["snippet"]
+
+@pytest.mark.parametrize("query", ['"unbalanced', "AND OR NOT", "col:umn*", "(", "-entropy"])
+def test_search_treats_punctuation_and_operators_as_text(library, query):
+    library.save_transcript("", "Entropy and information.", title="Entropy")
+    library.search(query)  # Must not raise an FTS5 syntax error
+
+def test_search_without_words_lists_recent_lectures(library):
+    ids = [library.save_transcript("", f"Lecture {index}.", title=f"Lecture {index}") for index in range(3)]
+    library.save_note("# Updated", lecture_id=ids[0])
+
+    assert [lecture["id"] for lecture in library.search("")] == [ids[0], ids[2], ids[1]]
+    assert [lecture["id"] for lecture in library.search("", limit=2)] == [ids[0], ids[2]]
+
+def test_deleted_lecture_is_not_found(library):
+    lecture_id = library.save_transcript("", "Fourier series.", title="Fourier")
+    library.delete(lecture_id)
+    assert library.search("fourier") == []
+
+def test_updated_lecture_is_found_by_its_new_words_only(library):
+    lecture_id = library.save_note("# Old heading", details={"title": "Sorting"})
+    library.save_note("# Quicksort", lecture_id=lecture_id)
+
+    assert [lecture["id"] for lecture in library.search("quicksort")] == [lecture_id]
+    assert library.search("heading") == []
+
+def test_library_without_owners_is_upgraded(tmp_path):
+    path = str(tmp_path / "library.db")
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE lectures (id INTEGER PRIMARY KEY, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+        "source TEXT NOT NULL DEFAULT '', audio_hash TEXT, title TEXT NOT NULL DEFAULT '', date TEXT NOT NULL DEFAULT '', "
+        "lecturer TEXT NOT NULL DEFAULT '', course TEXT NOT NULL DEFAULT '', outline TEXT NOT NULL DEFAULT '', "
+        "takeaways TEXT NOT NULL DEFAULT '', additional_notes TEXT NOT NULL DEFAULT '', headings TEXT NOT NULL DEFAULT '', "
+        "transcription TEXT, clean_transcription TEXT, lecture_note_md TEXT, lecture_note_json TEXT)"
+    )
+    connection.close()
+
+    library = LectureLibrary(path)
+    lecture_id = library.save_transcript("raw", "Clean.", audio_hash="abc", owner="cli")
+    assert library.save_transcript("raw again", "Clean again.", audio_hash="abc", owner="cli") == lecture_id
+    library.close()
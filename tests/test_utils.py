@@ -0,0 +1,94 @@
+"""
+test_utils.py
+
+Tests for splitting a recording into segments and stitching their transcripts back together.
+"""
+import pytest
+
+from utils import (
+    plan_segments,
+    stitch_transcripts,
+    trim_overlap
+)
+from config import SEGMENT_SIZE_HEADROOM
+
+def test_trim_overlap_removes_repeated_words():
+    previous = "Today we will look at the gradient of the loss function"
+    current = "of the loss function, and how it is computed."
+    assert trim_overlap(previous, current) == "and how it is computed."
+
+def test_trim_overlap_ignores_case_and_punctuation():
+    previous = "which brings us to Bayes' theorem."
+    current = "bayes' Theorem states that"
+    assert trim_overlap(previous, current) == "states that"
+
+def test_trim_overlap_keeps_text_without_overlap():
+    previous = "That is all for the first part."
+    current = "  Now let us move on to the second part.  "
+    assert trim_overlap(previous, current) == "Now let us move on to the second part."
+
+def test_trim_overlap_finds_differently_transcribed_overlap():
+    # The overlap was heard as "the lost" in the next segment, but the last three words still match
+    previous = "we take the derivative of the loss function"
+    current = "the lost of the loss function with respect to the weights"
+    assert trim_overlap(previous, current) == "with respect to the weights"
+
+def test_trim_overlap_does_not_match_a_repeated_phrase_past_the_overlap():
+    # "one of the" also appears later in the segment, beyond the words a two-second overlap can hold
+    previous = "so this is one of the"
+    current = "most important results in the course. It is one of the best known"
+    assert trim_overlap(previous, current) == current
+
+def test_trim_overlap_needs_two_matching_words():
+    previous = "and that is the end of the"
+    current = "the next topic is sorting"
+    assert trim_overlap(previous, current) == current
+
+def test_stitch_transcripts_joins_segments_in_order():
+    transcriptions = [
+        "First we define a matrix",
+        "define a matrix and its transpose",
+        "its transpose, then multiply them.",
+    ]
+    assert stitch_transcripts(transcriptions) == "First we define a matrix and its transpose then multiply them."
+
+def test_stitch_transcripts_skips_empty_segments():
+    assert stitch_transcripts(["Hello there", "", "  ", "General remarks"]) == "Hello there General remarks"
+
+def test_stitch_transcripts_of_nothing_is_empty():
+    assert stitch_transcripts([]) == ""
+
+def test_plan_segments_short_audio_is_one_segment():
+    assert plan_segments(120) == [(0.0, 120.0)]
+
+@pytest.mark.parametrize("audio_duration", [601, 3600, 2 * 3600 + 17.5])
+def test_plan_segments_covers_audio_with_equal_segments(audio_duration):
+    segments = plan_segments(audio_duration)
+
+    assert len(segments) > 1
+    assert segments[0][0] == 0
+    durations = {round(duration, 6) for _, duration in segments}
+    assert len(durations) == 1
+    for (start, duration), (next_start, _) in zip(segments, segments[1:]):
+        assert next_start == pytest.approx(start + duration)
+    start, duration = segments[-1]
+    assert start + duration == pytest.approx(audio_duration)
+
+@pytest.mark.parametrize("bitrate_kbps, slack", [(128, 0), (128, 5), (320, 0), (32, 2)])
+def test_plan_segments_fit_under_size_limit(bitrate_kbps, slack):
+    max_size_mb = 10
+    segments = plan_segments(3 * 3600, max_size_mb=max_size_mb, bitrate_kbps=bitrate_kbps, slack=slack)
+
+    max_size_bits = max_size_mb * 1024 * 1024 * 8 * SEGMENT_SIZE_HEADROOM
+    for _, duration in segments:
+        assert (duration + slack) * bitrate_kbps * 1000 <= max_size_bits
+
+def test_plan_segments_respects_max_segment_duration():
+    segments = plan_segments(3600, bitrate_kbps=16, max_segment_duration=600)
+    assert len(segments) == 6
+    assert all(duration <= 600 for _, duration in segments)
+
+@pytest.mark.parametrize("max_size_mb, slack", [(0.01, 5), (0.0, 0), (1, 70)])
+def test_plan_segments_rejects_a_budget_without_room_for_audio(max_size_mb, slack):
+    with pytest.raises(ValueError):
+        plan_segments(3600, max_size_mb=max_size_mb, bitrate_kbps=128, slack=slack)
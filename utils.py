@@ -5,89 +5,484 @@ This file contains utility functions used across the application.
 """
 import io
 import os
-import streamlit as st
-
-from pydub import AudioSegment
-from openai import AzureOpenAI
+import re
+import math
+import shutil
+import tempfile
+import subprocess
+from dataclasses import dataclass
+from contextlib import contextmanager
 
+from cache import (
+    hash_audio,
+    transcription_cache
+)
+from metrics import (
+    track,
+    instrument,
+    add_to_span
+)
+from clients import (
+    get_client,
+    whisper_limiter,
+    call_with_retry
+)
 from config import (
-    API_VERSION
+    WHISPER_MODEL,
+    SEGMENT_BITRATE_KBPS,
+    MAX_SEGMENT_DURATION,
+    SEGMENT_SIZE_HEADROOM,
+    PREPROCESS_SAMPLE_RATE,
+    PREPROCESS_BITRATE_KBPS,
+    SILENCE_THRESHOLD_DB,
+    SILENCE_MIN_DURATION,
+    SILENCE_KEEP,
+    BOUNDARY_SEARCH_WINDOW,
+    RMS_FRAME_DURATION,
+    SEGMENT_OVERLAP,
+    OVERLAP_MAX_WORDS,
+    OVERLAP_ANCHOR_WORDS,
+    LIVE_WINDOW_SECONDS
 )
 
-try:
-    OAI_API_KEY = st.secrets["OAI_API_KEY"]
-    OAI_API_ENDPOINT = st.secrets["OAI_API_ENDPOINT"]
-except (KeyError, FileNotFoundError):
-    OAI_API_KEY = os.getenv("OAI_API_KEY")
-    OAI_API_ENDPOINT = os.getenv("OAI_API_ENDPOINT")
-
-client = AzureOpenAI(
-    api_key=OAI_API_KEY,
-    api_version=API_VERSION,
-    azure_endpoint=OAI_API_ENDPOINT
-)
+@contextmanager
+def _local_audio_path(audio_file):
+    """
+    Yields a path on disk for the audio file, spooling file-like objects to a temporary file.
+
+    ffmpeg needs a seekable file to jump straight to each window, so uploads are copied to disk
+    in small blocks instead of being decoded in memory.
+
+    Args:
+    - audio_file (str or file-like object): Path to the audio file or a file-like object (e.g., BytesIO).
+
+    Yields:
+    str: Path to the audio file on disk.
+    """
+    if isinstance(audio_file, (str, os.PathLike)):
+        yield os.fspath(audio_file)
+        return
+
+    suffix = os.path.splitext(getattr(audio_file, "name", ""))[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        audio_file.seek(0)
+        shutil.copyfileobj(audio_file, tmp)
+    try:
+        yield tmp.name
+    finally:
+        os.remove(tmp.name)
+
+def get_audio_duration(path):
+    """
+    Gets the duration of an audio file without decoding it.
+
+    Args:
+    - path (str): Path to the audio file.
+
+    Returns:
+    float: The duration of the audio file in seconds.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", path],
+        capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip())
+
+def _encode_window(path, start, duration, bitrate_kbps=SEGMENT_BITRATE_KBPS, copy=False):
+    """
+    Decodes one window of the audio file and re-encodes it to MP3 through an ffmpeg pipe.
+
+    Only the requested window is decoded, so memory use is bounded by the size of the encoded segment.
+    The segment is encoded at a constant bitrate so that its size is known before encoding.
+
+    Args:
+    - path (str): Path to the audio file.
+    - start (float): Start of the window in seconds.
+    - duration (float): Length of the window in seconds.
+    - bitrate_kbps (int, optional): Constant bitrate of the encoded segment in kbps.
+    - copy (bool, optional): Cut the MP3 frames as they are instead of re-encoding them.
+
+    Returns:
+    io.BytesIO: The encoded MP3 segment.
+    """
+    codec_args = ["-c:a", "copy"] if copy else ["-b:a", f"{bitrate_kbps}k"]
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error",
+         "-ss", f"{start:.3f}", "-t", f"{duration:.3f}", "-i", path,
+         "-vn", *codec_args, "-f", "mp3", "pipe:1"],
+        capture_output=True, check=True
+    )
+    segment_bytes = io.BytesIO(result.stdout)
+    segment_bytes.name = f'segment_{int(start * 1000)}.mp3'  # Need to set the name with the extension
+    return segment_bytes
+
+def plan_segments(audio_duration, max_size_mb=10, bitrate_kbps=SEGMENT_BITRATE_KBPS,
+                  max_segment_duration=MAX_SEGMENT_DURATION, slack=0):
+    """
+    Computes segment boundaries so that every segment fits under the size limit when encoded at `bitrate_kbps`.
 
-def split_audio(audio_file, max_size_mb=10):
-    """s
+    The longest segment that fits is derived from the bitrate, and the audio is then divided into
+    equally long segments so the last one is not left as a short remainder. A ValueError is raised if a segment
+    under the size limit would have no room left for audio once `slack` is taken off.
+
+    Args:
+    - audio_duration (float): Duration of the audio in seconds.
+    - max_size_mb (int, optional): Maximum size of each segment in megabytes. Default is 10 MB.
+    - bitrate_kbps (int, optional): Constant bitrate the segments will be encoded at in kbps.
+    - max_segment_duration (float, optional): Upper bound on the length of a segment in seconds.
+    - slack (float, optional): Seconds a segment may later grow by (e.g., boundary alignment and overlap)
+      that must still fit under the size limit.
+
+    Returns:
+    List[Tuple[float, float]]: The (start, duration) of each segment in seconds.
+    """
+    max_size_bits = max_size_mb * (1024 * 1024) * 8 * SEGMENT_SIZE_HEADROOM
+    longest_fit = min(max_size_bits / (bitrate_kbps * 1000) - slack, max_segment_duration)
+    if longest_fit <= 0:
+        raise ValueError(
+            f"Segments of {max_size_mb} MB at {bitrate_kbps} kbps have no room for audio after {slack} s of slack"
+        )
+    segment_count = max(1, math.ceil(audio_duration / longest_fit))
+    segment_duration = audio_duration / segment_count
+    return [(index * segment_duration, segment_duration) for index in range(segment_count)]
+
+def _read_pcm(path, start, duration):
+    """
+    Decodes one window of the audio file to 16 kHz mono 16-bit samples.
+
+    Args:
+    - path (str): Path to the audio file.
+    - start (float): Start of the window in seconds.
+    - duration (float): Length of the window in seconds.
+
+    Returns:
+    np.ndarray: The samples of the window.
+    """
+    import numpy as np  # Only needed when segment boundaries are aligned to silence
+
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error",
+         "-ss", f"{start:.3f}", "-t", f"{duration:.3f}", "-i", path,
+         "-vn", "-ac", "1", "-ar", str(PREPROCESS_SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        capture_output=True, check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+def find_quiet_point(path, target, search_window=BOUNDARY_SEARCH_WINDOW, audio_duration=None):
+    """
+    Finds the lowest-energy point near `target`, so a segment boundary does not cut through a word.
+
+    Only the search window around `target` is decoded. Its RMS energy is computed per frame in one
+    vectorized pass, and frames further from `target` are slightly penalised so that, among equally
+    quiet frames, the closest one wins.
+
+    Args:
+    - path (str): Path to the audio file.
+    - target (float): The planned boundary in seconds.
+    - search_window (float, optional): Seconds searched on each side of `target`.
+    - audio_duration (float, optional): Duration of the audio, used to clip the search window.
+
+    Returns:
+    float: The boundary, in seconds, moved to the middle of the quietest frame.
+    """
+    import numpy as np
+
+    window_start = max(0.0, target - search_window)
+    window_end = target + search_window if audio_duration is None else min(audio_duration, target + search_window)
+    samples = _read_pcm(path, window_start, window_end - window_start)
+
+    frame_length = int(PREPROCESS_SAMPLE_RATE * RMS_FRAME_DURATION)
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return target
+
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length).astype(np.float32)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+
+    frame_centres = window_start + (np.arange(frame_count) + 0.5) * RMS_FRAME_DURATION
+    distance_penalty = 1 + 0.1 * np.abs(frame_centres - target) / search_window
+    return float(frame_centres[np.argmin((rms + 1) * distance_penalty)])
+
+def split_audio(audio_file, max_size_mb=10, bitrate_kbps=SEGMENT_BITRATE_KBPS, copy=False,
+                align_to_silence=True, overlap=SEGMENT_OVERLAP):
+    """
     Splits an audio file into segments of specified maximum size.
 
+    Segment boundaries are planned up front from the bitrate, so each segment is encoded exactly once.
+    Each boundary is then moved to the nearest quiet point, and every segment but the last runs `overlap`
+    seconds into the next one so words at the boundary are heard in full; use `stitch_transcripts` to join them.
+    The file is never fully decoded: each window is decoded and re-encoded by ffmpeg on its own,
+    and segments are yielded as soon as they are ready so they can be transcribed while the next one is encoded.
+
     Args:
     - audio_file (str or file-like object): Path to the audio file or a file-like object (e.g., BytesIO).
     - max_size_mb (int, optional): Maximum size of each segment in megabytes. Default is 10 MB.
+    - bitrate_kbps (int, optional): Constant bitrate the segments are encoded at in kbps.
+    - copy (bool, optional): Cut segments without re-encoding. The input must already be a constant
+      bitrate MP3 at `bitrate_kbps`, such as the output of `preprocess_audio`.
+    - align_to_silence (bool, optional): Move boundaries to the nearest low-energy region. Default is True.
+    - overlap (float, optional): Seconds each segment overlaps the next one.
+
+    Yields:
+    io.BytesIO: Audio segments as BytesIO objects, each less than or equal to the specified max_size_mb.
+    """
+    with _local_audio_path(audio_file) as path:
+        audio_duration = get_audio_duration(path)
+
+        search_window = BOUNDARY_SEARCH_WINDOW if align_to_silence else 0
+        plan = plan_segments(audio_duration, max_size_mb, bitrate_kbps, slack=2 * search_window + overlap)
+        # Never search further than a quarter segment, so moved boundaries stay in order
+        search_window = min(search_window, plan[0][1] / 4)
+
+        boundaries = [start_time for start_time, _ in plan] + [audio_duration]
+        for index in range(len(plan)):
+            start_time, end_time = boundaries[index], boundaries[index + 1]
+            is_last = index == len(plan) - 1
+
+            if search_window and not is_last:
+                end_time = find_quiet_point(path, end_time, search_window, audio_duration)
+                boundaries[index + 1] = end_time
+
+            segment_duration = end_time - start_time + (0 if is_last else overlap)
+            with track("split_audio", audio_seconds=segment_duration) as span:
+                segment = _encode_window(path, start_time, segment_duration, bitrate_kbps, copy)
+                span.add(bytes_sent=segment.getbuffer().nbytes)
+            yield segment
+
+def split_live_audio(path, start, audio_duration, window_seconds=LIVE_WINDOW_SECONDS, final=False,
+                     bitrate_kbps=SEGMENT_BITRATE_KBPS, copy=False, align_to_silence=True, overlap=SEGMENT_OVERLAP):
+    """
+    Cuts the complete windows of a recording that is still growing, starting at `start`.
+
+    A window is complete once the audio reaches past its end by the boundary search window and the overlap, so its
+    boundary can be moved to a quiet point and the words at the boundary are heard in full, as in `split_audio`.
+    Once the recording has ended (`final`), the rest of the audio is cut as well.
+
+    Args:
+    - path (str): Path to the recording.
+    - start (float): Where the first window starts in seconds, i.e., the end of the audio already transcribed.
+    - audio_duration (float): Duration of the audio available so far in seconds.
+    - window_seconds (float, optional): Target length of each window in seconds.
+    - final (bool, optional): The recording has ended, so the last, shorter window is cut too.
+    - bitrate_kbps (int, optional): Constant bitrate the windows are encoded at in kbps.
+    - copy (bool, optional): Cut windows without re-encoding, see `split_audio`.
+    - align_to_silence (bool, optional): Move boundaries to the nearest low-energy region. Default is True.
+    - overlap (float, optional): Seconds each window overlaps the next one.
+
+    Yields:
+    Tuple[io.BytesIO, float]: Each window, and where the next window starts in seconds.
+    """
+    # Never search further than a quarter window, so moved boundaries stay in order
+    search_window = min(BOUNDARY_SEARCH_WINDOW, window_seconds / 4) if align_to_silence else 0
+
+    while audio_duration - start > 0.1:  # Whisper rejects shorter audio
+        is_last = final and audio_duration - start <= window_seconds + search_window
+        if not is_last and audio_duration - start < window_seconds + search_window + overlap:
+            return
+
+        end_time = audio_duration if is_last else start + window_seconds
+        if search_window and not is_last:
+            end_time = find_quiet_point(path, end_time, search_window, audio_duration)
+
+        segment_duration = end_time - start + (0 if is_last else overlap)
+        with track("split_audio", audio_seconds=segment_duration) as span:
+            segment = _encode_window(path, start, segment_duration, bitrate_kbps, copy)
+            span.add(bytes_sent=segment.getbuffer().nbytes)
+        yield segment, end_time
+
+        if is_last:
+            return
+        start = end_time
+
+@dataclass
+class PreprocessStats:
+    """
+    Size and duration of an audio file before and after preprocessing
+    """
+    original_bytes: int
+    processed_bytes: int
+    original_duration: float
+    processed_duration: float
+
+    @property
+    def bytes_saved(self):
+        return self.original_bytes - self.processed_bytes
+
+    @property
+    def seconds_saved(self):
+        return self.original_duration - self.processed_duration
+
+@contextmanager
+def preprocess_audio(audio_file, trim_silence=False):
+    """
+    Shrinks an audio file for Whisper by downmixing to mono, resampling to 16 kHz and encoding to a low-bitrate MP3.
+
+    The output is a constant bitrate MP3 at PREPROCESS_BITRATE_KBPS, so it can be passed to
+    `split_audio(..., bitrate_kbps=PREPROCESS_BITRATE_KBPS, copy=True)` without being encoded again.
+    The preprocessed file is deleted when the context exits.
+
+    Args:
+    - audio_file (str or file-like object): Path to the audio file or a file-like object (e.g., BytesIO).
+    - trim_silence (bool, optional): Shorten silences longer than SILENCE_MIN_DURATION seconds. Default is False.
+
+    Yields:
+    Tuple[str, PreprocessStats]: Path to the preprocessed MP3, and the bytes and duration saved.
+    """
+    filters = ["-af", (
+        f"silenceremove=stop_periods=-1:stop_duration={SILENCE_MIN_DURATION}"
+        f":stop_threshold={SILENCE_THRESHOLD_DB}dB:stop_silence={SILENCE_KEEP}"
+    )] if trim_silence else []
+
+    with _local_audio_path(audio_file) as path, tempfile.TemporaryDirectory() as tmp_dir:
+        processed_path = os.path.join(tmp_dir, "preprocessed.mp3")
+        with track("preprocess_audio") as span:
+            subprocess.run(
+                ["ffmpeg", "-nostdin", "-v", "error", "-i", path, "-vn", *filters,
+                 "-ac", "1", "-ar", str(PREPROCESS_SAMPLE_RATE), "-b:a", f"{PREPROCESS_BITRATE_KBPS}k",
+                 "-f", "mp3", processed_path],
+                capture_output=True, check=True
+            )
+            stats = PreprocessStats(
+                original_bytes=os.path.getsize(path),
+                processed_bytes=os.path.getsize(processed_path),
+                original_duration=get_audio_duration(path),
+                processed_duration=get_audio_duration(processed_path)
+            )
+            span.add(bytes_sent=stats.processed_bytes, audio_seconds=stats.original_duration)
+        yield processed_path, stats
+
+def append_audio(audio_file, spool_path):
+    """
+    Converts one piece of a recording to the preprocessed format and appends it to a spool file.
+
+    Every piece is encoded as a constant bitrate MP3 without a header frame, so the spool file is one continuous
+    MP3 stream whose duration ffprobe can read from its size, and windows can be cut from it without re-encoding
+    (`bitrate_kbps=PREPROCESS_BITRATE_KBPS, copy=True`).
+
+    Args:
+    - audio_file (str or file-like object): The piece of the recording, in any format ffmpeg reads.
+    - spool_path (str): Path to the spool file.
 
     Returns:
-    List[io.BytesIO]: A list of audio segments as BytesIO objects, where each segment is less than or equal to the specified max_size_mb.
-    """
-    audio = AudioSegment.from_file(audio_file)
-    max_size_bytes = max_size_mb * (1024 * 1024)
-    segments = []
-    start_time = 0
-    segment_duration = 60 * 30 * 1000 # 60sec * 30min * 1000ms
-
-    while start_time < len(audio):
-        # Slice the audio into 30min segments
-        segment = audio[start_time:(start_time+segment_duration)] # Slice audio
-        segment_bytes = io.BytesIO() # Create buffer to store the audio
-        segment_bytes.name = f'segment_{start_time}.mp3' # Need to set the name with the extension
-        segment.export(segment_bytes, format='mp3') # Export the sliced audio to buffer
-        segment_size = segment_bytes.getbuffer().nbytes # Get the size of the buffer
-
-        # This while loop will run only if the sliced segment is still larger than max_size_byte
-        # We reduce the length by 5 minute each time
-        while segment_size > max_size_bytes:
-            segment_duration -= 5 * 60 * 1000  # Reduce by 5 minutes
-            segment = audio[start_time:(start_time + segment_duration)]
-            segment_bytes = io.BytesIO()
-            segment_bytes.name = f'segment_{start_time}.mp3'
-            segment.export(segment_bytes, format='mp3')
-            segment_size = segment_bytes.getbuffer().nbytes
-
-        segment_bytes.seek(0)
-
-        # Append the segment to the list as bytes
-        segments.append(segment_bytes)
-        start_time += len(segment)
-
-    return segments
-
-def speech_to_text(audio_file, language="en"):
+    int: The number of bytes appended.
+    """
+    with _local_audio_path(audio_file) as path, track("append_audio") as span:
+        result = subprocess.run(
+            ["ffmpeg", "-nostdin", "-v", "error", "-i", path, "-vn",
+             "-ac", "1", "-ar", str(PREPROCESS_SAMPLE_RATE), "-b:a", f"{PREPROCESS_BITRATE_KBPS}k",
+             "-write_xing", "0", "-f", "mp3", "pipe:1"],
+            capture_output=True, check=True
+        )
+        with open(spool_path, "ab") as spool:
+            spool.write(result.stdout)
+        span.add(bytes_sent=len(result.stdout))
+    return len(result.stdout)
+
+def _file_size(audio_file):
+    if isinstance(audio_file, (str, os.PathLike)):
+        return os.path.getsize(audio_file)
+    position = audio_file.tell()
+    size = audio_file.seek(0, io.SEEK_END)
+    audio_file.seek(position)
+    return size
+
+@instrument("speech_to_text")
+def speech_to_text(audio_file, language="en", use_cache=True):
     """
     Converts speech in an audio file to text using a speech-to-text service.
 
     Args:
     - audio_file (str or file-like object): Path to the audio file or a file-like object (e.g., BytesIO).
     - language (str, optional): The language of the audio file. Default is English ("en").
+    - use_cache (bool, optional): Reuse a cached transcription of the same audio bytes. Default is True.
 
     Returns:
     str: The transcribed text from the audio file.
     """
-    transcription = client.audio.transcriptions.create(
-        file=audio_file,
-        language=language,
-        model="whisper-1"
-    )
+    if use_cache:
+        cache_key = transcription_cache.make_key(hash_audio(audio_file), language, WHISPER_MODEL)
+        cached = transcription_cache.get(cache_key)
+        if cached is not None:
+            add_to_span(cache_hits=1)
+            return cached
+
+    def create_transcription():
+        if hasattr(audio_file, "seek"):
+            audio_file.seek(0)  # A retried upload must send the whole file again
+        return get_client().audio.transcriptions.create(
+            file=audio_file,
+            language=language,
+            model=WHISPER_MODEL
+        )
+
+    add_to_span(bytes_sent=_file_size(audio_file))
+    transcription = call_with_retry(create_transcription, limiter=whisper_limiter)
+
+    if use_cache:
+        transcription_cache.set(cache_key, transcription.text)
     return transcription.text
 
+def _normalise_words(words):
+    """
+    Lowercases words and strips punctuation so the same word matches across two transcripts.
+    """
+    return [re.sub(r"[^\w']", "", word.lower()) for word in words]
+
+def trim_overlap(previous, current, max_overlap_words=OVERLAP_MAX_WORDS, max_anchor_words=OVERLAP_ANCHOR_WORDS):
+    """
+    Removes the words at the start of `current` that repeat the end of `previous`.
+
+    Consecutive segments overlap by a couple of seconds, so the same words are usually transcribed twice.
+    The longest run of at least two words that ends `previous` and starts `current` is removed. If Whisper
+    transcribed the overlap slightly differently, the last three words of `previous` are searched for within
+    the first `max_anchor_words` of `current` instead, and everything up to them is removed.
+
+    Args:
+    - previous (str): The transcription of the earlier segment.
+    - current (str): The transcription of the later segment.
+    - max_overlap_words (int, optional): Most words that can be repeated across the boundary.
+    - max_anchor_words (int, optional): Most words of `current` the last three words of `previous` are searched in.
+
+    Returns:
+    str: `current` without the repeated words.
+    """
+    previous_words = _normalise_words(previous.split()[-max_overlap_words:])
+    current_words = current.split()
+    current_normalised = _normalise_words(current_words[:max_overlap_words])
+
+    for length in range(min(len(previous_words), len(current_normalised)), 1, -1):
+        if previous_words[-length:] == current_normalised[:length]:
+            return " ".join(current_words[length:])
+
+    anchor = previous_words[-3:]
+    if len(anchor) == 3:
+        for start in range(min(len(current_normalised), max_anchor_words) - 2):
+            if current_normalised[start:start + 3] == anchor:
+                return " ".join(current_words[start + 3:])
+
+    return current.strip()
+
+def stitch_transcripts(transcriptions, max_overlap_words=OVERLAP_MAX_WORDS):
+    """
+    Joins segment transcriptions in order, removing words duplicated by the segment overlap.
+
+    Args:
+    - transcriptions (List[str]): The transcription of each segment, in segment order.
+    - max_overlap_words (int, optional): Most words that can be repeated across a boundary.
+
+    Returns:
+    str: The joined transcription.
+    """
+    stitched = []
+    previous = ""
+    for transcription in transcriptions:
+        text = trim_overlap(previous, transcription, max_overlap_words) if previous else transcription.strip()
+        if text:
+            stitched.append(text)
+        previous = transcription
+    return " ".join(stitched)
+
 def get_headings(lecture_note_example):
     """
     Get the list of headings from the string that was inputted by the user.